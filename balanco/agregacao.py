@@ -0,0 +1,128 @@
+"""
+Motor de agregação dos balanços.
+
+Cada função executa uma única consulta agrupada sobre a tabela de origem,
+usando agregados condicionais para separar produtos e recargas. O custo de
+um balanço passa a ser constante, independente do tamanho do período ou do
+volume de vendas da loja:
+
+    agregar_vendas        -> 1 consulta sobre ResumoVendaDiaria
+    agregar_relatorios    -> 1 consulta sobre RelatorioDiario
+    serie_vendas_diarias  -> 1 consulta sobre ResumoVendaDiaria (GROUP BY dia)
+
+As vendas são lidas do resumo diário materializado (lojas.ResumoVendaDiaria)
+e não das vendas individuais.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+
+# Campo do Balanco -> campo do RelatorioDiario
+CAMPOS_RELATORIO = {
+    # TV
+    'total_tpa': 'tpa',
+    'total_dstv': 'dstv',
+    'total_inicio_dstv': 'inicio_dstv',
+    'total_resto_dstv': 'resto_dstv',
+    'total_zap': 'zap',
+    'total_resto_zap': 'resto_zap',
+    # Telefonia
+    'total_unitel': 'unitel',
+    'total_resto_unitel': 'resto_unitel',
+    'total_africell': 'africell',
+    'total_resto_africell': 'resto_africell',
+    # Financeiro
+    'total_recargas_relatorios': 'recargas',
+    'total_acc_relatorios': 'acc',
+    'total_geral_relatorios': 'total_geral',
+    'total_dm': 'dm',
+    'total_moedas': 'moedas',
+    'total_gastos': 'gastos',
+}
+
+
+def agregar_vendas(loja, data_inicio, data_fim):
+    """Totais de vendas do período (1 consulta)"""
+    from lojas.models import ResumoVendaDiaria
+
+    totais = ResumoVendaDiaria.objects.filter(
+        loja=loja,
+        data__range=[data_inicio, data_fim]
+    ).aggregate(
+        total_vendas_produtos=Sum('valor_total', filter=Q(item_type='produto')),
+        total_vendas_recargas=Sum('valor_total', filter=Q(item_type='recarga')),
+        quantidade_vendas_produtos=Sum('numero_vendas', filter=Q(item_type='produto')),
+        quantidade_vendas_recargas=Sum('numero_vendas', filter=Q(item_type='recarga')),
+    )
+
+    return {
+        'total_vendas_produtos': totais['total_vendas_produtos'] or Decimal('0.00'),
+        'total_vendas_recargas': totais['total_vendas_recargas'] or Decimal('0.00'),
+        'quantidade_vendas_produtos': totais['quantidade_vendas_produtos'] or 0,
+        'quantidade_vendas_recargas': totais['quantidade_vendas_recargas'] or 0,
+    }
+
+
+def agregar_relatorios(loja, data_inicio, data_fim):
+    """Somas dos relatórios diários do período (1 consulta)"""
+    from relatorio.models import RelatorioDiario
+
+    totais = RelatorioDiario.objects.filter(
+        loja=loja,
+        data__range=[data_inicio, data_fim]
+    ).aggregate(**{
+        campo_balanco: Sum(campo_relatorio)
+        for campo_balanco, campo_relatorio in CAMPOS_RELATORIO.items()
+    })
+
+    return {
+        campo: valor or Decimal('0.00')
+        for campo, valor in totais.items()
+    }
+
+
+def serie_vendas_diarias(loja, data_inicio, data_fim):
+    """
+    Série diária de vendas do período (1 consulta).
+    Os dias sem vendas são preenchidos com zero em Python.
+    """
+    from lojas.models import ResumoVendaDiaria
+
+    vendas_por_dia = ResumoVendaDiaria.objects.filter(
+        loja=loja,
+        data__range=[data_inicio, data_fim]
+    ).values('data').annotate(
+        total_produtos=Sum('valor_total', filter=Q(item_type='produto')),
+        total_recargas=Sum('valor_total', filter=Q(item_type='recarga')),
+        quantidade_produtos=Sum('numero_vendas', filter=Q(item_type='produto')),
+        quantidade_recargas=Sum('numero_vendas', filter=Q(item_type='recarga')),
+    ).order_by('data')
+
+    por_dia = {linha['data']: linha for linha in vendas_por_dia}
+
+    serie = []
+    data_atual = data_inicio
+    while data_atual <= data_fim:
+        linha = por_dia.get(data_atual, {})
+        total_produtos = linha.get('total_produtos') or Decimal('0.00')
+        total_recargas = linha.get('total_recargas') or Decimal('0.00')
+        quantidade_produtos = linha.get('quantidade_produtos') or 0
+        quantidade_recargas = linha.get('quantidade_recargas') or 0
+
+        serie.append({
+            'data': data_atual.strftime('%d/%m/%Y'),
+            'total': float(total_produtos + total_recargas),
+            'produtos': {
+                'total': float(total_produtos),
+                'quantidade': quantidade_produtos
+            },
+            'recargas': {
+                'total': float(total_recargas),
+                'quantidade': quantidade_recargas
+            },
+            'total_transacoes': quantidade_produtos + quantidade_recargas
+        })
+        data_atual += timedelta(days=1)
+
+    return serie
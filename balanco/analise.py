@@ -0,0 +1,78 @@
+"""
+Análise de um produto na rede de lojas.
+
+    estoque_e_vendas_por_loja -> 1 consulta agrupada por loja
+    serie_mensal_vendas       -> 1 consulta agrupada por mês (TruncMonth)
+
+O custo da página de detalhe do produto não depende do número de lojas.
+"""
+from datetime import date
+
+from django.db.models import FilteredRelation, Max, Q, Sum, Value
+from django.db.models.functions import TruncMonth
+
+MESES_SERIE_PADRAO = 6
+MESES_SERIE_MAXIMO = 24
+
+
+def estoque_e_vendas_por_loja(produto, lojas):
+    """
+    Lojas anotadas com o estoque e as vendas do produto (1 consulta):
+    quantidade_estoque, status_estoque, quantidade_vendida, valor_vendido e
+    numero_vendas.
+    """
+    from lojas.models import Loja
+
+    return Loja.objects.filter(
+        id__in=[loja.id for loja in lojas]
+    ).annotate(
+        estoque_produto=FilteredRelation('estoqueloja', condition=Q(estoqueloja__produto=produto)),
+        resumo_produto=FilteredRelation(
+            'resumos_vendas',
+            condition=Q(resumos_vendas__produto=produto, resumos_vendas__item_type='produto')
+        ),
+    ).annotate(
+        # (loja, produto) é único no estoque: o Max apenas o traz para o GROUP BY
+        quantidade_estoque=Max('estoque_produto__quantidade', default=0),
+        status_estoque=Max('estoque_produto__status', default=Value('esgotado')),
+        quantidade_vendida=Sum('resumo_produto__quantidade', default=0),
+        valor_vendido=Sum('resumo_produto__valor_total'),
+        numero_vendas=Sum('resumo_produto__numero_vendas', default=0),
+    ).order_by('id')
+
+
+def meses_anteriores(meses, hoje=None):
+    """Primeiro dia de cada um dos últimos `meses` meses de calendário, do mais antigo ao atual"""
+    hoje = hoje or date.today()
+    ano, mes = hoje.year, hoje.month
+    inicio = []
+    for _ in range(meses):
+        inicio.append(date(ano, mes, 1))
+        ano, mes = (ano, mes - 1) if mes > 1 else (ano - 1, 12)
+    return list(reversed(inicio))
+
+
+def serie_mensal_vendas(produto, lojas, meses=MESES_SERIE_PADRAO):
+    """
+    Quantidade vendida do produto por mês de calendário nas lojas dadas
+    (1 consulta). Retorna (rótulos 'Mon/YYYY', quantidades).
+    """
+    from lojas.models import ResumoVendaDiaria
+
+    meses = max(1, min(meses, MESES_SERIE_MAXIMO))
+    inicio_meses = meses_anteriores(meses)
+
+    por_mes = dict(ResumoVendaDiaria.objects.filter(
+        produto=produto,
+        item_type='produto',
+        loja__in=[loja.id for loja in lojas],
+        data__gte=inicio_meses[0]
+    ).annotate(
+        mes=TruncMonth('data')
+    ).values('mes').annotate(
+        total=Sum('quantidade')
+    ).values_list('mes', 'total'))
+
+    rotulos = [inicio.strftime('%b/%Y') for inicio in inicio_meses]
+    quantidades = [por_mes.get(inicio) or 0 for inicio in inicio_meses]
+    return rotulos, quantidades
@@ -0,0 +1,92 @@
+"""
+Composição hierárquica dos balanços.
+
+Um balanço mensal ou anual pode ser montado somando balanços menores já
+gravados da mesma loja (diários, semanais ou mensais) que cobrem o período
+exatamente, sem lacunas nem sobreposições. O custo passa a depender do
+número de períodos e não do número de vendas.
+
+Os rankings (produtos, recargas, vendedores) são mesclados a partir dos
+top 10 de cada componente, portanto são aproximados: um item fora do top
+de todos os componentes não aparece no resultado.
+"""
+from datetime import datetime, timedelta
+
+# Tipos de balanço que podem compor cada período, do maior para o menor
+COMPONENTES_PERIODO = {
+    'mensal': ['semanal', 'diario'],
+    'anual': ['mensal', 'semanal', 'diario'],
+}
+
+LIMITE_RANKING = 10
+
+
+def escolher_componentes(loja, periodo_tipo, data_inicio, data_fim):
+    """
+    Retorna a menor lista de balanços gravados que cobre exatamente o
+    período, em ordem de data, ou None se não houver cobertura (1 consulta).
+    """
+    from .models import Balanco
+
+    tipos = COMPONENTES_PERIODO.get(periodo_tipo)
+    if not tipos:
+        return None
+
+    candidatos = Balanco.objects.filter(
+        loja=loja,
+        periodo_tipo__in=tipos,
+        data_inicio__gte=data_inicio,
+        data_fim__lte=data_fim
+    ).order_by('-data_inicio')
+
+    # cobertura[d]: menor sequência de balanços que cobre de d até data_fim
+    cobertura = {data_fim + timedelta(days=1): []}
+    for balanco in candidatos:
+        resto = cobertura.get(balanco.data_fim + timedelta(days=1))
+        if resto is None:
+            continue
+        atual = cobertura.get(balanco.data_inicio)
+        if atual is None or len(resto) + 1 < len(atual):
+            cobertura[balanco.data_inicio] = [balanco] + resto
+
+    return cobertura.get(data_inicio)
+
+
+def mesclar_ranking(listas, chave, campos_soma, ordenar_por='total_valor'):
+    """Soma entradas de rankings com a mesma chave e mantém o top do resultado"""
+    mesclado = {}
+    for lista in listas:
+        for entrada in lista if isinstance(lista, list) else []:
+            k = tuple(entrada.get(c) for c in chave)
+            if k not in mesclado:
+                mesclado[k] = dict(entrada)
+                continue
+            for campo in campos_soma:
+                mesclado[k][campo] = (mesclado[k].get(campo) or 0) + (entrada.get(campo) or 0)
+
+    ranking = sorted(mesclado.values(), key=lambda e: e.get(ordenar_por) or 0, reverse=True)
+    return ranking[:LIMITE_RANKING]
+
+
+def mesclar_produtos(listas):
+    """Mescla rankings de produtos ou recargas"""
+    ranking = mesclar_ranking(listas, ('nome', 'preco_unitario'), ('total_vendido', 'total_valor', 'numero_vendas'))
+    for item in ranking:
+        item['media_venda'] = item['total_valor'] / item['numero_vendas'] if item['numero_vendas'] else 0.0
+    return ranking
+
+
+def mesclar_vendedores(listas):
+    """Mescla rankings de vendedores"""
+    ranking = mesclar_ranking(listas, ('id',), ('total_vendas', 'total_valor', 'vendas_produtos', 'vendas_recargas'))
+    for vendedor in ranking:
+        vendedor['media_venda'] = vendedor['total_valor'] / vendedor['total_vendas'] if vendedor['total_vendas'] else 0.0
+        vendedor['performance'] = 'alta' if vendedor['total_valor'] > 1000 else 'media' if vendedor['total_valor'] > 500 else 'baixa'
+    return ranking
+
+
+def concatenar_series(listas):
+    """Junta séries diárias (entradas com 'data' dd/mm/YYYY) em ordem de data"""
+    serie = [entrada for lista in listas if isinstance(lista, list) for entrada in lista]
+    serie.sort(key=lambda e: datetime.strptime(e['data'], '%d/%m/%Y'))
+    return serie
@@ -0,0 +1,291 @@
+"""
+Matriz de estoque (item × loja) das páginas consolidadas de estoque.
+
+Os estoques de todas as lojas visíveis são lidos numa única consulta e
+organizados em memória; classificação, filtros, ordenação e paginação
+trabalham sobre a matriz, sem consultas por célula.
+
+Estoque histórico: estoque_no_dia parte do ponto de controle mais próximo
+(FechamentoEstoque ou o estoque atual) e repete só as variações diárias
+entre ele e o dia pedido.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import F, IntegerField, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# Classe CSS de cada status (a coluna status das tabelas de estoque)
+CLASSES_STATUS = {
+    'esgotado': 'danger',
+    'baixo': 'warning',
+    'normal': 'success',
+}
+
+
+def estoques_do_tipo(item_type):
+    """(manager do estoque, nome do campo do item) para 'produto' ou 'recarga'"""
+    from lojas.models import EstoqueLoja, EstoqueRecarga
+
+    if item_type == 'produto':
+        return EstoqueLoja.objects, 'produto_id'
+    return EstoqueRecarga.objects, 'recarga_id'
+
+
+def carregar_matriz_estoque(lojas, item_type, item_ids=None):
+    """
+    Quantidade e status em estoque por item e loja:
+    {item_id: {loja_id: (quantidade, status)}} (1 consulta). Combinações sem
+    registro de estoque não aparecem (contam como esgotadas).
+    """
+    estoques, campo_item = estoques_do_tipo(item_type)
+    estoques = estoques.filter(loja__in=lojas)
+    if item_ids is not None:
+        estoques = estoques.filter(**{f'{campo_item}__in': item_ids})
+    estoques = estoques.values_list(campo_item, 'loja_id', 'quantidade', 'status')
+
+    matriz = {}
+    for item_id, loja_id, quantidade, status in estoques:
+        matriz.setdefault(item_id, {})[loja_id] = (quantidade, status)
+    return matriz
+
+
+def montar_tabela_estoque(items, lojas, item_type, loja_id='', status_estoque=''):
+    """
+    Tabela consolidada de estoque, ordenada por valor total em estoque.
+    Os totais de cada item incluem todas as lojas consideradas; o filtro de
+    status limita as lojas listadas em 'estoques' e só entram itens com
+    alguma loja nesse status.
+    """
+    lojas = [loja for loja in lojas if not loja_id or str(loja.id) == loja_id]
+
+    item_ids = None
+    if status_estoque in ('baixo', 'normal'):
+        # Itens com alguma linha no status, pela coluna indexada; 'esgotado'
+        # também vale para lojas sem linha de estoque e lê a matriz inteira
+        estoques, campo_item = estoques_do_tipo(item_type)
+        if status_estoque == 'baixo':
+            estoques = estoques.em_alerta('baixo')
+        else:
+            estoques = estoques.filter(status='normal')
+        item_ids = estoques.filter(loja__in=lojas).values(campo_item)
+        items = items.filter(id__in=item_ids)
+    matriz = carregar_matriz_estoque(lojas, item_type, item_ids)
+
+    tabela_estoque = []
+    for item in items:
+        quantidades = matriz.get(item.id, {})
+        item_data = {
+            'id': item.id,
+            'nome': item.nome,
+            'preco': item.preco,
+            'tipo': item_type,
+            'estoques': [],
+            'estoque_total': 0,
+            'valor_total_estoque': Decimal('0.00')
+        }
+
+        for loja in lojas:
+            # O status vem da coluna persistida, com o estoque mínimo de cada linha
+            quantidade, status = quantidades.get(loja.id, (0, 'esgotado'))
+            valor_estoque_loja = quantidade * item.preco
+
+            item_data['estoque_total'] += quantidade
+            item_data['valor_total_estoque'] += valor_estoque_loja
+
+            if status_estoque and status != status_estoque:
+                continue
+
+            item_data['estoques'].append({
+                'loja_id': loja.id,
+                'loja_nome': loja.nome,
+                'quantidade': quantidade,
+                'valor_estoque': valor_estoque_loja,
+                'status': status,
+                'status_class': CLASSES_STATUS[status],
+                'cidade': loja.cidade
+            })
+
+        # Com filtro de loja ou de status, só entram itens com alguma linha listada
+        if not (loja_id or status_estoque) or item_data['estoques']:
+            tabela_estoque.append(item_data)
+
+    tabela_estoque.sort(key=lambda x: x['valor_total_estoque'], reverse=True)
+    return tabela_estoque
+
+
+def resumir_tabela_estoque(tabela_estoque):
+    """Totais e contagem de status da tabela consolidada"""
+    contagem_status = {
+        'normal': 0,
+        'baixo': 0,
+        'esgotado': 0
+    }
+    for item in tabela_estoque:
+        for estoque in item['estoques']:
+            contagem_status[estoque['status']] += 1
+
+    return {
+        'total_items': len(tabela_estoque),
+        'total_estoque': sum(item['estoque_total'] for item in tabela_estoque),
+        'total_valor_estoque': sum(item['valor_total_estoque'] for item in tabela_estoque),
+        'contagem_status': contagem_status
+    }
+
+
+def linhas_exportacao_estoque(item_type, loja_id='', chunk_size=2000):
+    """
+    Gera as linhas (item, código, preço, loja, quantidade, valor, status) da
+    exportação de estoque, item a item e loja a loja, com memória constante.
+
+    Itens e estoques são lidos por cursores ordenados por (item, loja) e
+    intercalados: combinações sem registro de estoque saem com quantidade 0.
+    """
+    from lojas.models import Loja, EstoqueLoja, EstoqueRecarga
+    from produtos.models import Produto, Recarga
+
+    if item_type == 'produto':
+        itens, estoques, prefixo, campo_item = Produto.objects, EstoqueLoja.objects, 'PROD', 'produto_id'
+    else:
+        itens, estoques, prefixo, campo_item = Recarga.objects, EstoqueRecarga.objects, 'REC', 'recarga_id'
+
+    lojas = Loja.objects.order_by('id')
+    if loja_id:
+        lojas = lojas.filter(id=loja_id)
+    lojas = list(lojas.values_list('id', 'nome'))
+
+    estoques = iter(estoques.filter(
+        loja_id__in=[loja for loja, _ in lojas]
+    ).order_by(campo_item, 'loja_id').values_list(campo_item, 'loja_id', 'quantidade', 'status').iterator(chunk_size=chunk_size))
+    estoque = next(estoques, None)
+
+    for item_id, nome, preco in itens.order_by('id').values_list('id', 'nome', 'preco').iterator(chunk_size=chunk_size):
+        for loja, loja_nome in lojas:
+            while estoque is not None and (estoque[0], estoque[1]) < (item_id, loja):
+                estoque = next(estoques, None)
+
+            quantidade, status = 0, 'esgotado'
+            if estoque is not None and (estoque[0], estoque[1]) == (item_id, loja):
+                quantidade, status = estoque[2], estoque[3]
+
+            yield [
+                nome,
+                f'{prefixo}{item_id:04d}',
+                f'{preco:.2f}',
+                loja_nome,
+                quantidade,
+                f'{quantidade * preco:.2f}',
+                status
+            ]
+
+
+def inicio_do_dia(dia):
+    """Instante (no fuso local) em que o dia começa"""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def variacoes_diarias_estoque(loja_id, item_type, inicio, fim, item_ids=None):
+    """
+    Variação líquida do estoque por item e dia entre `inicio` e `fim`
+    (inclusive): {item_id: {dia: variação}} (2 consultas).
+
+    As vendas vêm do resumo diário de vendas; as demais alterações, do
+    histórico MovimentoEstoque. Movimentos ligados a uma venda espelham a
+    própria venda e não entram na conta.
+    """
+    from lojas.models import ResumoVendaDiaria
+    from .models import MovimentoEstoque
+
+    campo_item = 'produto_id' if item_type == 'produto' else 'recarga_id'
+    filtro_itens = {f'{campo_item}__in': item_ids} if item_ids is not None else {}
+    variacoes = {}
+
+    vendas = ResumoVendaDiaria.objects.filter(
+        loja_id=loja_id,
+        item_type=item_type,
+        data__range=[inicio, fim],
+        **filtro_itens
+    ).values(campo_item, 'data').annotate(total=Sum('quantidade')).values_list(campo_item, 'data', 'total')
+    for item_id, dia, quantidade in vendas:
+        dias = variacoes.setdefault(item_id, {})
+        dias[dia] = dias.get(dia, 0) - quantidade
+
+    movimentos = MovimentoEstoque.objects.filter(
+        loja_id=loja_id,
+        venda__isnull=True,
+        criado_em__gte=inicio_do_dia(inicio),
+        criado_em__lt=inicio_do_dia(fim + timedelta(days=1)),
+        **{f'{campo_item}__isnull': False},
+        **filtro_itens
+    ).annotate(
+        dia=TruncDate('criado_em')
+    ).values(campo_item, 'dia').annotate(
+        total=Sum(F('quantidade_atual') - F('quantidade_anterior'), output_field=IntegerField())
+    ).values_list(campo_item, 'dia', 'total')
+    for item_id, dia, variacao in movimentos:
+        dias = variacoes.setdefault(item_id, {})
+        dias[dia] = dias.get(dia, 0) + variacao
+
+    return variacoes
+
+
+def estoque_no_dia(loja_id, item_type, dia, item_ids=None):
+    """
+    Estoque de abertura e de fechamento de `dia` na loja, por item:
+    {item_id: {'abertura': ..., 'fechamento': ...}}. Itens ausentes tinham
+    estoque 0.
+
+    O ponto de partida é o mais próximo do dia entre o fechamento gravado
+    anterior, o fechamento gravado posterior e o estoque atual; só as
+    variações entre ele e o dia são lidas, nunca o histórico inteiro.
+    """
+    from lojas.models import EstoqueLoja, EstoqueRecarga
+    from .models import FechamentoEstoque
+
+    hoje = timezone.localdate()
+    dia = min(dia, hoje)
+    campo_item = 'produto_id' if item_type == 'produto' else 'recarga_id'
+    filtro_itens = {f'{campo_item}__in': item_ids} if item_ids is not None else {}
+
+    fechamentos = FechamentoEstoque.objects.filter(loja_id=loja_id, item_type=item_type)
+    datas = fechamentos.aggregate(
+        anterior=Max('data', filter=Q(data__lt=dia)),
+        posterior=Min('data', filter=Q(data__gte=dia, data__lt=hoje))
+    )
+
+    # (distância em dias, ponto de partida); em empate vale o estoque atual
+    candidatos = [(hoje - dia, hoje)]
+    if datas['posterior']:
+        candidatos.append((datas['posterior'] - dia, datas['posterior']))
+    if datas['anterior']:
+        candidatos.append((dia - datas['anterior'] - timedelta(days=1), datas['anterior']))
+    _, partida = min(candidatos, key=lambda candidato: candidato[0])
+
+    if partida == hoje:
+        estoques = EstoqueLoja.objects if item_type == 'produto' else EstoqueRecarga.objects
+        base = estoques.filter(loja_id=loja_id, **filtro_itens).values_list(campo_item, 'quantidade')
+    else:
+        base = fechamentos.filter(data=partida, **filtro_itens).values_list(campo_item, 'quantidade')
+    base = dict(base)
+
+    if partida >= dia:
+        # Recua a partir do ponto de partida: fechamento = base - variações após o dia
+        variacoes = variacoes_diarias_estoque(loja_id, item_type, dia, partida, item_ids)
+    else:
+        # Avança a partir do fechamento anterior
+        variacoes = variacoes_diarias_estoque(loja_id, item_type, partida + timedelta(days=1), dia, item_ids)
+
+    posicoes = {}
+    for item_id in set(base) | set(variacoes):
+        dias = variacoes.get(item_id, {})
+        variacao_dia = dias.get(dia, 0)
+        if partida >= dia:
+            fechamento = base.get(item_id, 0) - sum(v for d, v in dias.items() if d > dia)
+            abertura = fechamento - variacao_dia
+        else:
+            abertura = base.get(item_id, 0) + sum(v for d, v in dias.items() if d < dia)
+            fechamento = abertura + variacao_dia
+        posicoes[item_id] = {'abertura': abertura, 'fechamento': fechamento}
+
+    return posicoes
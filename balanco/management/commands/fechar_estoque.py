@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from balanco.models import FechamentoEstoque
+from lojas.models import Loja
+
+
+class Command(BaseCommand):
+    help = 'Grava o fechamento diário de estoque (ponto de controle do estoque histórico) de cada loja'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', help='Dia a fechar (YYYY-MM-DD); padrão: ontem')
+        parser.add_argument('--dias', type=int, default=1,
+                            help='Número de dias a fechar, recuando a partir de --data')
+        parser.add_argument('--loja', type=int, action='append', dest='lojas', help='ID da loja (pode repetir)')
+
+    def handle(self, *args, **options):
+        hoje = timezone.localdate()
+        try:
+            data = self._data(options['data']) or hoje - timedelta(days=1)
+        except ValueError:
+            raise CommandError('Formato de data inválido. Use YYYY-MM-DD')
+
+        if data >= hoje:
+            raise CommandError('Só é possível fechar dias já terminados.')
+        if options['dias'] < 1:
+            raise CommandError('--dias deve ser pelo menos 1.')
+
+        lojas = Loja.objects.order_by('id')
+        if options['lojas']:
+            lojas = lojas.filter(id__in=options['lojas'])
+            if lojas.count() != len(set(options['lojas'])):
+                raise CommandError('Uma ou mais lojas não foram encontradas.')
+        loja_ids = list(lojas.values_list('id', flat=True))
+
+        # Do dia mais recente para o mais antigo: cada fechamento parte do anterior já gravado
+        total = 0
+        for deslocamento in range(options['dias']):
+            dia = data - timedelta(days=deslocamento)
+            for loja_id in loja_ids:
+                total += FechamentoEstoque.fechar_dia(loja_id, dia)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Estoque fechado em {options['dias']} dia(s) para {len(loja_ids)} loja(s): {total} linhas."
+        ))
+
+    def _data(self, valor):
+        return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
@@ -0,0 +1,142 @@
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.utils import timezone
+
+# Os modelos são importados dentro das funções: com o método "spawn" os
+# processos do pool importam este módulo antes de o Django estar configurado.
+
+# O SQLite admite um único escritor e recusa de imediato ("database is
+# locked") a transação que tenta escrever enquanto outra escreve.
+TENTATIVAS_BLOQUEIO = 20
+
+
+def iniciar_processo():
+    """Configura o Django em cada processo do pool"""
+    import django
+    django.setup()
+
+
+def gerar_balancos_loja(loja_id, periodo_tipo, periodos, compor):
+    """Gera ou atualiza os balanços de uma loja; executado num processo do pool"""
+    from balanco.models import Balanco
+    from lojas.models import Loja
+
+    inicio = time.perf_counter()
+    loja = Loja.objects.get(id=loja_id)
+    gerados = 0
+    erros = []
+
+    for data_inicio, data_fim in periodos:
+        for tentativa in range(TENTATIVAS_BLOQUEIO):
+            try:
+                Balanco.gerar_balanco(loja, periodo_tipo, data_inicio, data_fim, compor=compor)
+                gerados += 1
+                break
+            except OperationalError as e:
+                if 'locked' in str(e) and tentativa < TENTATIVAS_BLOQUEIO - 1:
+                    time.sleep(random.uniform(0.01, 0.05) * (tentativa + 1))
+                    continue
+                erros.append(f"{data_inicio.strftime('%d/%m/%Y')}: {e}")
+                break
+            except Exception as e:
+                erros.append(f"{data_inicio.strftime('%d/%m/%Y')}: {e}")
+                break
+
+    return {
+        'loja': loja.nome,
+        'gerados': gerados,
+        'erros': erros,
+        'segundos': time.perf_counter() - inicio,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Gera ou atualiza os balanços de todas as lojas num intervalo, em paralelo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('periodo', choices=['diario', 'semanal', 'mensal', 'anual'], help='Tipo de período')
+        parser.add_argument('--data-inicio', help='Data inicial (YYYY-MM-DD); padrão: hoje')
+        parser.add_argument('--data-fim', help='Data final (YYYY-MM-DD); padrão: data inicial')
+        parser.add_argument('--loja', type=int, action='append', dest='lojas', help='ID da loja (pode repetir)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Número de processos')
+        parser.add_argument('--compor', action='store_true',
+                            help='Montar balanços mensais/anuais a partir dos menores já gravados')
+
+    def handle(self, *args, **options):
+        from balanco.models import Balanco
+        from lojas.models import Loja
+
+        try:
+            data_inicio = self._data(options['data_inicio']) or timezone.localdate()
+            data_fim = self._data(options['data_fim']) or data_inicio
+        except ValueError:
+            raise CommandError('Formato de data inválido. Use YYYY-MM-DD')
+
+        if data_inicio > data_fim:
+            raise CommandError('A data de início deve ser anterior à data de fim.')
+        if options['workers'] < 1:
+            raise CommandError('--workers deve ser pelo menos 1.')
+
+        lojas = Loja.objects.order_by('id')
+        if options['lojas']:
+            lojas = lojas.filter(id__in=options['lojas'])
+            if lojas.count() != len(set(options['lojas'])):
+                raise CommandError('Uma ou mais lojas não foram encontradas.')
+        loja_ids = list(lojas.values_list('id', flat=True))
+
+        periodo_tipo = options['periodo']
+        periodos = Balanco.periodos_no_intervalo(periodo_tipo, data_inicio, data_fim)
+        workers = min(options['workers'], len(loja_ids)) or 1
+
+        self.stdout.write(
+            f'Gerando {len(periodos)} balanço(s) {periodo_tipo} para {len(loja_ids)} loja(s) '
+            f'com {workers} processo(s)...'
+        )
+
+        inicio = time.perf_counter()
+        if workers == 1:
+            resultados = [
+                gerar_balancos_loja(loja_id, periodo_tipo, periodos, options['compor'])
+                for loja_id in loja_ids
+            ]
+            for resultado in resultados:
+                self._relatar(resultado)
+        else:
+            # Conexões abertas não podem ser herdadas pelos processos filhos
+            connections.close_all()
+            resultados = []
+            with ProcessPoolExecutor(max_workers=workers, initializer=iniciar_processo) as pool:
+                tarefas = [
+                    pool.submit(gerar_balancos_loja, loja_id, periodo_tipo, periodos, options['compor'])
+                    for loja_id in loja_ids
+                ]
+                for tarefa in as_completed(tarefas):
+                    resultado = tarefa.result()
+                    resultados.append(resultado)
+                    self._relatar(resultado)
+        segundos = time.perf_counter() - inicio
+
+        gerados = sum(r['gerados'] for r in resultados)
+        erros = sum(len(r['erros']) for r in resultados)
+        vazao = gerados / segundos if segundos else 0.0
+        mensagem = f'{gerados} balanço(s) em {segundos:.2f}s ({vazao:.1f} balanços/s).'
+        if erros:
+            self.stdout.write(self.style.WARNING(f'{mensagem} {erros} erro(s).'))
+        else:
+            self.stdout.write(self.style.SUCCESS(mensagem))
+
+    def _relatar(self, resultado):
+        self.stdout.write(
+            f"  {resultado['loja']}: {resultado['gerados']} balanço(s) em {resultado['segundos']:.2f}s"
+        )
+        for erro in resultado['erros']:
+            self.stderr.write(f'    Erro em {erro}')
+
+    def _data(self, valor):
+        return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
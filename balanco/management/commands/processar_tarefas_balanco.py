@@ -0,0 +1,51 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from balanco.models import TarefaBalanco
+
+
+class Command(BaseCommand):
+    help = 'Executa as tarefas de cálculo de balanço pendentes (worker em segundo plano)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true',
+                            help='Processa as tarefas pendentes e termina em vez de aguardar novas')
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help='Segundos de espera quando não há tarefas pendentes')
+
+    def handle(self, *args, **options):
+        if options['intervalo'] <= 0:
+            raise CommandError('--intervalo deve ser maior que zero.')
+
+        # SIGTERM (parada do serviço, deploy) interrompe como Ctrl+C: a tarefa volta à fila
+        def interromper(signum, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, interromper)
+
+        self.stdout.write('Aguardando tarefas de balanço...')
+        tarefa = None
+        try:
+            while True:
+                tarefa = TarefaBalanco.reservar_proxima()
+                if tarefa is None:
+                    if options['uma_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+
+                inicio = time.perf_counter()
+                tarefa.executar()
+                segundos = time.perf_counter() - inicio
+
+                if tarefa.status == 'concluida':
+                    self.stdout.write(self.style.SUCCESS(f'{tarefa} em {segundos:.2f}s'))
+                else:
+                    self.stderr.write(f'{tarefa}: {tarefa.erro}')
+        except KeyboardInterrupt:
+            # Devolve à fila a tarefa interrompida a meio; se o worker morrer
+            # sem passar por aqui, a reserva vence e outro worker a retoma
+            if tarefa is not None:
+                tarefa.devolver_a_fila()
+            self.stdout.write('Worker interrompido.')
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('balanco', '0003_movimentoestoque'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='balanco',
+            name='marca_dados',
+            field=models.CharField(blank=True, max_length=120, verbose_name='Marca dos Dados'),
+        ),
+    ]
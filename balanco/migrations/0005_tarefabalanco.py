@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('balanco', '0004_balanco_marca_dados'),
+        ('lojas', '0012_resumovendadiaria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaBalanco',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo_tipo', models.CharField(choices=[('diario', 'Diário'), ('semanal', 'Semanal'), ('mensal', 'Mensal'), ('anual', 'Anual'), ('personalizado', 'Personalizado')], max_length=15, verbose_name='Tipo de Período')),
+                ('data_inicio', models.DateField(verbose_name='Data de Início')),
+                ('data_fim', models.DateField(verbose_name='Data de Fim')),
+                ('descricao_periodo', models.CharField(blank=True, max_length=100, verbose_name='Descrição do Período')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Em Execução'), ('concluida', 'Concluída'), ('erro', 'Erro')], default='pendente', max_length=10, verbose_name='Status')),
+                ('progresso', models.PositiveSmallIntegerField(default=0, verbose_name='Progresso (%)')),
+                ('etapa', models.CharField(blank=True, max_length=50, verbose_name='Etapa Atual')),
+                ('erro', models.TextField(blank=True, verbose_name='Erro')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('balanco', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tarefas', to='balanco.balanco', verbose_name='Balanço')),
+                ('criado_por', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tarefas_balanco', to='lojas.loja', verbose_name='Loja')),
+            ],
+            options={
+                'verbose_name': 'Tarefa de Balanço',
+                'verbose_name_plural': 'Tarefas de Balanço',
+                'ordering': ['criado_em'],
+                'indexes': [models.Index(fields=['status', 'criado_em'], name='balanco_tar_status_e6757c_idx')],
+            },
+        ),
+    ]
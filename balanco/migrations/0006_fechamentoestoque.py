@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('balanco', '0005_tarefabalanco'),
+        ('lojas', '0014_venda_dia_venda'),
+        ('produtos', '0004_recarga'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FechamentoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(verbose_name='Data')),
+                ('item_type', models.CharField(choices=[('produto', 'Produto'), ('recarga', 'Recarga')], max_length=10, verbose_name='Tipo de Item')),
+                ('quantidade', models.IntegerField(default=0, verbose_name='Quantidade')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+            ],
+            options={
+                'verbose_name': 'Fechamento de Estoque',
+                'verbose_name_plural': 'Fechamentos de Estoque',
+                'ordering': ['-data', 'loja'],
+            },
+        ),
+        migrations.AddField(
+            model_name='movimentoestoque',
+            name='recarga',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movimentos_estoque', to='produtos.recarga', verbose_name='Recarga'),
+        ),
+        migrations.AlterField(
+            model_name='movimentoestoque',
+            name='produto',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='produtos.produto', verbose_name='Produto'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentoestoque',
+            index=models.Index(fields=['recarga', 'criado_em'], name='balanco_mov_recarga_7e7202_idx'),
+        ),
+        migrations.AddField(
+            model_name='fechamentoestoque',
+            name='loja',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fechamentos_estoque', to='lojas.loja', verbose_name='Loja'),
+        ),
+        migrations.AddField(
+            model_name='fechamentoestoque',
+            name='produto',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='fechamentos_estoque', to='produtos.produto', verbose_name='Produto'),
+        ),
+        migrations.AddField(
+            model_name='fechamentoestoque',
+            name='recarga',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='fechamentos_estoque', to='produtos.recarga', verbose_name='Recarga'),
+        ),
+        migrations.AddIndex(
+            model_name='fechamentoestoque',
+            index=models.Index(fields=['loja', 'item_type', 'data'], name='balanco_fec_loja_id_cc7a10_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='fechamentoestoque',
+            constraint=models.UniqueConstraint(condition=models.Q(('item_type', 'produto')), fields=('loja', 'data', 'produto'), name='fechamento_estoque_produto_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='fechamentoestoque',
+            constraint=models.UniqueConstraint(condition=models.Q(('item_type', 'recarga')), fields=('loja', 'data', 'recarga'), name='fechamento_estoque_recarga_unico'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('balanco', '0006_fechamentoestoque'),
+        ('lojas', '0015_estoque_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenciaReferencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefixo', models.CharField(max_length=10, verbose_name='Prefixo')),
+                ('ultimo_numero', models.PositiveBigIntegerField(default=0, verbose_name='Último Número Reservado')),
+                ('loja', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sequencias_referencia', to='lojas.loja', verbose_name='Loja')),
+            ],
+            options={
+                'verbose_name': 'Sequência de Referência',
+                'verbose_name_plural': 'Sequências de Referência',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('loja__isnull', False)), fields=('prefixo', 'loja'), name='sequencia_referencia_loja_unica'), models.UniqueConstraint(condition=models.Q(('loja__isnull', True)), fields=('prefixo',), name='sequencia_referencia_geral_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('balanco', '0007_sequenciareferencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tarefabalanco',
+            name='reserva_renovada_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Reserva Renovada em'),
+        ),
+    ]
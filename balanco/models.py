@@ -1,11 +1,21 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
-from django.db.models import Sum, Q, Count
+from django.db.models import Sum, Q, Count, Max, F
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
+import logging
 from django.db.models import Avg
 
+logger = logging.getLogger(__name__)
+
+# Campos recalculados por calcular_totais_derivados
+CAMPOS_DERIVADOS = [
+    'total_vendas_geral', 'total_transacoes', 'total_arrecadado', 'diferenca_caixa',
+    'custos_operacionais', 'lucro_bruto', 'margem_lucro', 'status',
+]
+
+
 class Balanco(models.Model):
     PERIODO_CHOICES = [
         ('diario', 'Diário'),
@@ -94,6 +104,9 @@ class Balanco(models.Model):
     atualizado_em = models.DateTimeField(auto_now=True)
     criado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     
+    # Marca d'água dos dados de origem refletidos neste balanço (ver calcular_marca_dados)
+    marca_dados = models.CharField(max_length=120, blank=True, verbose_name='Marca dos Dados')
+    
     class Meta:
         verbose_name = 'Balanço'
         verbose_name_plural = 'Balanços'
@@ -103,73 +116,107 @@ class Balanco(models.Model):
     def __str__(self):
         return f"Balanço {self.loja.nome} - {self.descricao_periodo}"
     
-    def save(self, *args, **kwargs):
+    def save(self, *args, recalcular=True, **kwargs):
         if not self.descricao_periodo:
             self.descricao_periodo = f"{self.data_inicio.strftime('%d/%m/%Y')} a {self.data_fim.strftime('%d/%m/%Y')}"
         
-        self.calcular_todos_dados()
+        if recalcular:
+            self.calcular_todos_dados()
         super().save(*args, **kwargs)
     
-    def calcular_todos_dados(self):
-        """Calcula todos os dados do balanço"""
-        self.calcular_vendas()
-        self.calcular_relatorios_diarios()
-        self.calcular_metricas_financeiras()
-        self.coletar_detalhes()
-        self.definir_status()
-    
-    def calcular_vendas(self):
-        """Calcula dados de vendas do período"""
-        from lojas.models import Venda
+    def calcular_marca_dados(self):
+        """
+        Marca d'água dos dados de origem do período (2 consultas): última
+        alteração, número de linhas e somas dos valores do resumo de vendas
+        e dos relatórios diários. A contagem detecta exclusões que não
+        alteram o máximo; as somas, alterações feitas por .update() ou com
+        um atualizado_em anterior ao máximo já gravado.
+        """
+        import hashlib
+        from lojas.models import ResumoVendaDiaria
+        from relatorio.models import RelatorioDiario
+        from .agregacao import CAMPOS_RELATORIO
+        
+        vendas = ResumoVendaDiaria.objects.filter(
+            loja=self.loja,
+            data__range=[self.data_inicio, self.data_fim]
+        ).aggregate(
+            ultima=Max('atualizado_em'), total=Count('id'),
+            quantidade=Sum('quantidade'), valor=Sum('valor_total'), numero=Sum('numero_vendas')
+        )
         
-        vendas_periodo = Venda.objects.filter(
-            Q(estoque_loja__loja=self.loja) | Q(estoque_recarga__loja=self.loja),
-            data_venda__date__range=[self.data_inicio, self.data_fim]
+        relatorios = RelatorioDiario.objects.filter(
+            loja=self.loja,
+            data__range=[self.data_inicio, self.data_fim]
+        ).aggregate(
+            ultima=Max('atualizado_em'), total=Count('id'),
+            **{campo: Sum(campo) for campo in CAMPOS_RELATORIO.values()}
         )
         
-        # Vendas de produtos
-        vendas_produtos = vendas_periodo.filter(item_type='produto')
-        self.total_vendas_produtos = vendas_produtos.aggregate(total=Sum('valor_total'))['total'] or Decimal('0.00')
-        self.quantidade_vendas_produtos = vendas_produtos.count()
+        def marca(dados):
+            ultima = dados.pop('ultima')
+            valores = ':'.join(str(dados[campo] or 0) for campo in sorted(dados))
+            return f"{ultima.isoformat() if ultima else '-'}:{valores}"
         
-        # Vendas de recargas
-        vendas_recargas = vendas_periodo.filter(item_type='recarga')
-        self.total_vendas_recargas = vendas_recargas.aggregate(total=Sum('valor_total'))['total'] or Decimal('0.00')
-        self.quantidade_vendas_recargas = vendas_recargas.count()
+        # Resumida num hash: a marca completa não cabe no campo
+        return hashlib.md5(
+            f"v:{marca(vendas)}|r:{marca(relatorios)}".encode(), usedforsecurity=False
+        ).hexdigest()
+    
+    def esta_atualizado(self):
+        """Indica se o balanço ainda reflete as vendas e relatórios do período"""
+        return bool(self.marca_dados) and self.marca_dados == self.calcular_marca_dados()
+    
+    def atualizar_se_necessario(self):
+        """
+        Recalcula e grava o balanço apenas se os dados de origem mudaram
+        desde o último cálculo. Retorna True se houve recálculo.
+        """
+        if self.esta_atualizado():
+            return False
+        
+        self.calcular_todos_dados()
+        self.save(recalcular=False)
+        return True
+    
+    def calcular_todos_dados(self, progresso=None):
+        """
+        Calcula todos os dados do balanço.
+        progresso: função opcional chamada como progresso(percentual, etapa)
+        antes de cada etapa (usada pelas tarefas em segundo plano).
+        """
+        etapas = [
+            ('Vendas', self.calcular_vendas),
+            ('Relatórios diários', self.calcular_relatorios_diarios),
+            ('Métricas financeiras', self.calcular_metricas_financeiras),
+            ('Detalhes', self.coletar_detalhes),
+            ('Status', self.definir_status),
+        ]
+        
+        # A marca é lida antes dos dados: uma alteração durante o cálculo
+        # deixa o balanço desatualizado e provoca novo cálculo depois
+        self.marca_dados = self.calcular_marca_dados()
+        for indice, (etapa, calcular) in enumerate(etapas):
+            if progresso:
+                progresso(indice * 100 // len(etapas), etapa)
+            calcular()
+    
+    def calcular_vendas(self):
+        """Calcula dados de vendas do período"""
+        from .agregacao import agregar_vendas
+        
+        for campo, valor in agregar_vendas(self.loja, self.data_inicio, self.data_fim).items():
+            setattr(self, campo, valor)
         
         self.total_vendas_geral = self.total_vendas_produtos + self.total_vendas_recargas
         self.total_transacoes = self.quantidade_vendas_produtos + self.quantidade_vendas_recargas
     
     def calcular_relatorios_diarios(self):
         """Calcula somas dos relatórios diários do período"""
-        from relatorio.models import RelatorioDiario
+        from .agregacao import agregar_relatorios
         
-        relatorios_periodo = RelatorioDiario.objects.filter(
-            loja=self.loja,
-            data__range=[self.data_inicio, self.data_fim]
-        )
-        
-        # TV
-        self.total_tpa = relatorios_periodo.aggregate(total=Sum('tpa'))['total'] or Decimal('0.00')
-        self.total_dstv = relatorios_periodo.aggregate(total=Sum('dstv'))['total'] or Decimal('0.00')
-        self.total_inicio_dstv = relatorios_periodo.aggregate(total=Sum('inicio_dstv'))['total'] or Decimal('0.00')
-        self.total_resto_dstv = relatorios_periodo.aggregate(total=Sum('resto_dstv'))['total'] or Decimal('0.00')
-        self.total_zap = relatorios_periodo.aggregate(total=Sum('zap'))['total'] or Decimal('0.00')
-        self.total_resto_zap = relatorios_periodo.aggregate(total=Sum('resto_zap'))['total'] or Decimal('0.00')
-        
-        # Telefonia
-        self.total_unitel = relatorios_periodo.aggregate(total=Sum('unitel'))['total'] or Decimal('0.00')
-        self.total_resto_unitel = relatorios_periodo.aggregate(total=Sum('resto_unitel'))['total'] or Decimal('0.00')
-        self.total_africell = relatorios_periodo.aggregate(total=Sum('africell'))['total'] or Decimal('0.00')
-        self.total_resto_africell = relatorios_periodo.aggregate(total=Sum('resto_africell'))['total'] or Decimal('0.00')
-        
-        # Financeiro
-        self.total_recargas_relatorios = relatorios_periodo.aggregate(total=Sum('recargas'))['total'] or Decimal('0.00')
-        self.total_acc_relatorios = relatorios_periodo.aggregate(total=Sum('acc'))['total'] or Decimal('0.00')
-        self.total_geral_relatorios = relatorios_periodo.aggregate(total=Sum('total_geral'))['total'] or Decimal('0.00')
-        self.total_dm = relatorios_periodo.aggregate(total=Sum('dm'))['total'] or Decimal('0.00')
-        self.total_moedas = relatorios_periodo.aggregate(total=Sum('moedas'))['total'] or Decimal('0.00')
-        self.total_gastos = relatorios_periodo.aggregate(total=Sum('gastos'))['total'] or Decimal('0.00')
+        for campo, valor in agregar_relatorios(self.loja, self.data_inicio, self.data_fim).items():
+            setattr(self, campo, valor)
         
         # Totais calculados
         self.total_arrecadado = self.total_dm + self.total_moedas + self.total_tpa + self.total_gastos
@@ -189,44 +236,12 @@ class Balanco(models.Model):
     
     def coletar_detalhes(self):
         """Coleta dados detalhados para análise - VERSÃO ATUALIZADA"""
-        from lojas.models import Venda
+        from lojas.models import ResumoVendaDiaria
         from relatorio.models import RelatorioDiario
+        from .agregacao import serie_vendas_diarias
         
         # === VENDAS POR DIA - DETALHADO ===
-        vendas_por_dia_detalhadas = []
-        data_atual = self.data_inicio
-        while data_atual <= self.data_fim:
-            # Vendas do dia
-            vendas_dia = Venda.objects.filter(
-                Q(estoque_loja__loja=self.loja) | Q(estoque_recarga__loja=self.loja),
-                data_venda__date=data_atual
-            )
-            
-            total_vendas_dia = vendas_dia.aggregate(total=Sum('valor_total'))['total'] or Decimal('0.00')
-            
-            # Detalhes por tipo
-            vendas_produtos_dia = vendas_dia.filter(item_type='produto')
-            vendas_recargas_dia = vendas_dia.filter(item_type='recarga')
-            
-            total_produtos_dia = vendas_produtos_dia.aggregate(total=Sum('valor_total'))['total'] or Decimal('0.00')
-            total_recargas_dia = vendas_recargas_dia.aggregate(total=Sum('valor_total'))['total'] or Decimal('0.00')
-            quantidade_produtos_dia = vendas_produtos_dia.count()
-            quantidade_recargas_dia = vendas_recargas_dia.count()
-            
-            vendas_por_dia_detalhadas.append({
-                'data': data_atual.strftime('%d/%m/%Y'),
-                'total': float(total_vendas_dia),
-                'produtos': {
-                    'total': float(total_produtos_dia),
-                    'quantidade': quantidade_produtos_dia
-                },
-                'recargas': {
-                    'total': float(total_recargas_dia),
-                    'quantidade': quantidade_recargas_dia
-                },
-                'total_transacoes': quantidade_produtos_dia + quantidade_recargas_dia
-            })
-            data_atual += timedelta(days=1)
+        vendas_por_dia_detalhadas = serie_vendas_diarias(self.loja, self.data_inicio, self.data_fim)
         
         # === RELATÓRIOS POR DIA ===
         relatorios_por_dia_raw = RelatorioDiario.objects.filter(
@@ -285,24 +300,28 @@ class Balanco(models.Model):
             diferenca_balanco = Decimal('0.00')
         
         # === TOP PRODUTOS ===
-        top_produtos_raw = Venda.objects.filter(
-            estoque_loja__loja=self.loja,
-            item_type='produto',
-            data_venda__date__range=[self.data_inicio, self.data_fim]
+        resumos_periodo = ResumoVendaDiaria.objects.filter(
+            loja=self.loja,
+            data__range=[self.data_inicio, self.data_fim],
+            numero_vendas__gt=0
+        )
+        
+        top_produtos_raw = resumos_periodo.filter(
+            item_type='produto'
         ).values(
-            'estoque_loja__produto__nome',
-            'estoque_loja__produto__preco'
+            'produto__nome',
+            'produto__preco'
         ).annotate(
             total_vendido=Sum('quantidade'),
             total_valor=Sum('valor_total'),
-            numero_vendas=Count('id')
+            numero_vendas=Sum('numero_vendas')
         ).order_by('-total_valor')[:10]
         
         top_produtos = []
         for produto in top_produtos_raw:
             top_produtos.append({
-                'nome': produto['estoque_loja__produto__nome'],
-                'preco_unitario': float(produto['estoque_loja__produto__preco'] or 0.0),
+                'nome': produto['produto__nome'],
+                'preco_unitario': float(produto['produto__preco'] or 0.0),
                 'total_vendido': produto['total_vendido'],
                 'total_valor': float(produto['total_valor'] or 0.0),
                 'numero_vendas': produto['numero_vendas'],
@@ -310,24 +329,22 @@ class Balanco(models.Model):
             })
         
         # === TOP RECARGAS ===
-        top_recargas_raw = Venda.objects.filter(
-            estoque_recarga__loja=self.loja,
-            item_type='recarga',
-            data_venda__date__range=[self.data_inicio, self.data_fim]
+        top_recargas_raw = resumos_periodo.filter(
+            item_type='recarga'
         ).values(
-            'estoque_recarga__recarga__nome',
-            'estoque_recarga__recarga__preco'
+            'recarga__nome',
+            'recarga__preco'
         ).annotate(
             total_vendido=Sum('quantidade'),
             total_valor=Sum('valor_total'),
-            numero_vendas=Count('id')
+            numero_vendas=Sum('numero_vendas')
         ).order_by('-total_valor')[:10]
         
         top_recargas = []
         for recarga in top_recargas_raw:
             top_recargas.append({
-                'nome': recarga['estoque_recarga__recarga__nome'],
-                'preco_unitario': float(recarga['estoque_recarga__recarga__preco'] or 0.0),
+                'nome': recarga['recarga__nome'],
+                'preco_unitario': float(recarga['recarga__preco'] or 0.0),
                 'total_vendido': recarga['total_vendido'],
                 'total_valor': float(recarga['total_valor'] or 0.0),
                 'numero_vendas': recarga['numero_vendas'],
@@ -335,19 +352,15 @@ class Balanco(models.Model):
             })
         
         # === TOP VENDEDORES DETALHADO ===
-        top_vendedores_raw = Venda.objects.filter(
-            Q(estoque_loja__loja=self.loja) | Q(estoque_recarga__loja=self.loja),
-            data_venda__date__range=[self.data_inicio, self.data_fim]
-        ).values(
+        top_vendedores_raw = resumos_periodo.values(
             'vendedor__id',
             'vendedor__nome',
             'vendedor__email'
         ).annotate(
-            total_vendas=Count('id'),
+            total_vendas=Sum('numero_vendas'),
             total_valor=Sum('valor_total'),
-            media_venda=Avg('valor_total'),
-            vendas_produtos=Count('id', filter=Q(item_type='produto')),
-            vendas_recargas=Count('id', filter=Q(item_type='recarga'))
+            vendas_produtos=Sum('numero_vendas', filter=Q(item_type='produto'), default=0),
+            vendas_recargas=Sum('numero_vendas', filter=Q(item_type='recarga'), default=0)
         ).order_by('-total_valor')[:10]
         
         top_vendedores = []
@@ -358,7 +371,7 @@ class Balanco(models.Model):
                 'email': vendedor['vendedor__email'] or '',
                 'total_vendas': vendedor['total_vendas'],
                 'total_valor': float(vendedor['total_valor'] or 0.0),
-                'media_venda': float(vendedor['media_venda'] or 0.0),
+                'media_venda': float(vendedor['total_valor'] or 0.0) / vendedor['total_vendas'] if vendedor['total_vendas'] else 0.0,
                 'vendas_produtos': vendedor['vendas_produtos'],
                 'vendas_recargas': vendedor['vendas_recargas'],
                 'performance': 'alta' if vendedor['total_valor'] and vendedor['total_valor'] > 1000 else 'media' if vendedor['total_valor'] and vendedor['total_valor'] > 500 else 'baixa'
@@ -472,6 +485,206 @@ class Balanco(models.Model):
             print(f"Erro ao calcular dados em tempo real: {e}")
             return {}
     
+    def compor_de_balancos(self):
+        """
+        Monta o balanço somando balanços menores já gravados que cobrem o
+        período exatamente (ver balanco.composicao). Retorna False, sem
+        alterar nada, se não houver cobertura completa.
+        """
+        from .agregacao import CAMPOS_RELATORIO
+        from .composicao import (
+            escolher_componentes, concatenar_series, mesclar_produtos, mesclar_vendedores
+        )
+        
+        componentes = escolher_componentes(self.loja, self.periodo_tipo, self.data_inicio, self.data_fim)
+        if not componentes:
+            return False
+        
+        campos_soma = [
+            'total_vendas_produtos', 'total_vendas_recargas',
+            'quantidade_vendas_produtos', 'quantidade_vendas_recargas',
+        ] + list(CAMPOS_RELATORIO)
+        for campo in campos_soma:
+            setattr(self, campo, sum(getattr(b, campo) for b in componentes))
+        self.calcular_totais_derivados()
+        
+        self.detalhes_vendas_diarias = concatenar_series(b.detalhes_vendas_diarias for b in componentes)
+        self.detalhes_relatorios_diarios = concatenar_series(b.detalhes_relatorios_diarios for b in componentes)
+        self.detalhes_produtos = mesclar_produtos(b.detalhes_produtos for b in componentes)
+        self.detalhes_recargas = mesclar_produtos(b.detalhes_recargas for b in componentes)
+        self.detalhes_vendedores = mesclar_vendedores(b.detalhes_vendedores for b in componentes)
+        
+        # Sem marca: o primeiro acesso ao detalhe recalcula os rankings exatos
+        self.marca_dados = ''
+        return True
+    
+    def calcular_totais_derivados(self):
+        """Recalcula os totais e métricas que derivam das somas gravadas"""
+        self.total_vendas_geral = self.total_vendas_produtos + self.total_vendas_recargas
+        self.total_transacoes = self.quantidade_vendas_produtos + self.quantidade_vendas_recargas
+        self.total_arrecadado = self.total_dm + self.total_moedas + self.total_tpa + self.total_gastos
+        self.diferenca_caixa = self.total_arrecadado - self.total_geral_relatorios
+        self.calcular_metricas_financeiras()
+        self.definir_status()
+    
+    def aplicar_delta_vendas(self, dia, delta):
+        """
+        Soma um delta de vendas (campos de vendas do balanço) aos totais
+        gravados e à entrada do dia em detalhes_vendas_diarias. Um total
+        que ficaria negativo indica que o balanço divergiu das vendas: o
+        delta não é aplicado e a marca dos dados é apagada, para que o
+        próximo acesso faça o recálculo completo.
+        """
+        novos = {campo: getattr(self, campo) + valor for campo, valor in delta.items()}
+        
+        data = dia.strftime('%d/%m/%Y')
+        series = self.detalhes_vendas_diarias if isinstance(self.detalhes_vendas_diarias, list) else []
+        entrada = next((e for e in series if e.get('data') == data), None)
+        tipos = (
+            ('produtos', 'total_vendas_produtos', 'quantidade_vendas_produtos'),
+            ('recargas', 'total_vendas_recargas', 'quantidade_vendas_recargas'),
+        )
+        if entrada is not None:
+            entrada_nova = {
+                tipo: {
+                    'total': round(entrada[tipo]['total'] + float(delta[total]), 2),
+                    'quantidade': entrada[tipo]['quantidade'] + delta[quantidade],
+                }
+                for tipo, total, quantidade in tipos
+            }
+        
+        if any(valor < 0 for valor in novos.values()) or (entrada is not None and any(
+            valor < 0 for valores in entrada_nova.values() for valor in valores.values()
+        )):
+            self.marca_dados = ''
+            self.save(recalcular=False, update_fields=['marca_dados'])
+            return
+        
+        for campo, valor in novos.items():
+            setattr(self, campo, valor)
+        self.calcular_totais_derivados()
+        
+        if entrada is not None:
+            for tipo, valores in entrada_nova.items():
+                entrada[tipo].update(valores)
+            entrada['total'] = round(entrada['produtos']['total'] + entrada['recargas']['total'], 2)
+            entrada['total_transacoes'] = entrada['produtos']['quantidade'] + entrada['recargas']['quantidade']
+        
+        self.save(recalcular=False, update_fields=list(delta) + CAMPOS_DERIVADOS + ['detalhes_vendas_diarias', 'atualizado_em'])
+    
+    def aplicar_delta_relatorio(self, dia, delta, dia_sem_relatorios=False):
+        """
+        Soma um delta de relatório diário (campos de relatório do balanço)
+        aos totais gravados e à entrada do dia em detalhes_relatorios_diarios.
+        Com dia_sem_relatorios, a entrada do dia é removida.
+        """
+        for campo, valor in delta.items():
+            setattr(self, campo, getattr(self, campo) + valor)
+        self.calcular_totais_derivados()
+        
+        if isinstance(self.detalhes_relatorios_diarios, list):
+            data = dia.strftime('%d/%m/%Y')
+            entrada = next((e for e in self.detalhes_relatorios_diarios if e.get('data') == data), None)
+            if entrada is None:
+                entrada = {'data': data, 'total_geral': 0.0, 'total_arrecadado': 0.0,
+                           'dm': 0.0, 'moedas': 0.0, 'tpa': 0.0, 'gastos': 0.0}
+                self.detalhes_relatorios_diarios.append(entrada)
+                self.detalhes_relatorios_diarios.sort(key=lambda e: datetime.strptime(e['data'], '%d/%m/%Y'))
+            
+            for chave, campo in (('total_geral', 'total_geral_relatorios'), ('dm', 'total_dm'),
+                                 ('moedas', 'total_moedas'), ('tpa', 'total_tpa'), ('gastos', 'total_gastos')):
+                entrada[chave] = round(entrada[chave] + float(delta[campo]), 2)
+            entrada['total_arrecadado'] = round(entrada['dm'] + entrada['moedas'] + entrada['tpa'] + entrada['gastos'], 2)
+            
+            if dia_sem_relatorios:
+                self.detalhes_relatorios_diarios.remove(entrada)
+        
+        self.save(recalcular=False, update_fields=list(delta) + CAMPOS_DERIVADOS + ['detalhes_relatorios_diarios', 'atualizado_em'])
+    
+    @classmethod
+    def cobrindo_dia(cls, loja_id, dia):
+        """Balanços gravados da loja cujo período inclui o dia, bloqueados para atualização"""
+        return cls.objects.select_for_update().filter(
+            loja_id=loja_id,
+            data_inicio__lte=dia,
+            data_fim__gte=dia
+        )
+    
+    @classmethod
+    def aplicar_vendas(cls, vendas, sinal=1):
+        """
+        Aplica vendas criadas (sinal=1) ou removidas (sinal=-1) como delta em
+        todos os balanços gravados (diários, semanais, mensais, anuais...)
+        que cobrem a loja e o dia de cada venda, sem recalcular o período.
+        
+        Os deltas são aplicados depois do commit das vendas, em transação
+        própria: a venda não espera pelo bloqueio dos balanços (o anual é
+        comum a todos os vendedores da loja) nem pela regravação das séries
+        diárias. Se a aplicação falhar o erro é registrado e a marca dos
+        dados, que não muda com o delta, leva o detalhe ao recálculo.
+        
+        Os rankings (produtos, recargas, vendedores) não são atualizados: a
+        marca dos dados fica desatualizada e o próximo acesso ao detalhe do
+        balanço faz o recálculo completo.
+        """
+        from lojas.models import ResumoVendaDiaria
+        
+        deltas = {}
+        for venda in vendas:
+            chave = ResumoVendaDiaria.chave_da_venda(venda)
+            if chave is None:
+                continue
+            loja_id, dia, item_type = chave[:3]
+            delta = deltas.setdefault((loja_id, dia), {
+                'total_vendas_produtos': Decimal('0.00'),
+                'total_vendas_recargas': Decimal('0.00'),
+                'quantidade_vendas_produtos': 0,
+                'quantidade_vendas_recargas': 0,
+            })
+            sufixo = 'produtos' if item_type == 'produto' else 'recargas'
+            delta[f'total_vendas_{sufixo}'] += sinal * Decimal(str(venda.valor_total or 0))
+            delta[f'quantidade_vendas_{sufixo}'] += sinal
+        
+        if deltas:
+            from django.utils import timezone
+            instante = timezone.now()
+            transaction.on_commit(lambda: cls.aplicar_deltas_vendas(deltas, instante), robust=True)
+    
+    @classmethod
+    def aplicar_deltas_vendas(cls, deltas, instante=None):
+        """
+        Aplica deltas {(loja_id, dia): delta} aos balanços que cobrem cada dia.
+        Um balanço gravado depois de `instante` (o momento das vendas) e com
+        a marca igual à dos dados atuais foi recalculado já com as vendas e
+        não recebe o delta de novo.
+        """
+        with transaction.atomic():
+            for (loja_id, dia), delta in deltas.items():
+                for balanco in cls.cobrindo_dia(loja_id, dia):
+                    if instante and balanco.atualizado_em >= instante and balanco.esta_atualizado():
+                        continue
+                    balanco.aplicar_delta_vendas(dia, delta)
+    
+    @classmethod
+    def aplicar_relatorio(cls, loja_id, dia, valores, sinal=1):
+        """
+        Aplica um relatório diário criado (sinal=1) ou removido (sinal=-1)
+        como delta nos balanços gravados que cobrem a loja e o dia.
+        valores: campos monetários do RelatorioDiario (ver CAMPOS_RELATORIO).
+        """
+        from relatorio.models import RelatorioDiario
+        from .agregacao import CAMPOS_RELATORIO
+        
+        delta = {
+            campo_balanco: sinal * (valores.get(campo_relatorio) or Decimal('0.00'))
+            for campo_balanco, campo_relatorio in CAMPOS_RELATORIO.items()
+        }
+        
+        with transaction.atomic():
+            dia_sem_relatorios = sinal < 0 and not RelatorioDiario.objects.filter(loja_id=loja_id, data=dia).exists()
+            for balanco in cls.cobrindo_dia(loja_id, dia):
+                balanco.aplicar_delta_relatorio(dia, delta, dia_sem_relatorios)
+    
     def definir_status(self):
         """Define o status do balanço"""
         if self.lucro_bruto > Decimal('1000.00'):
@@ -501,9 +714,48 @@ class Balanco(models.Model):
         return (self.total_resto_dstv + self.total_resto_zap + 
                 self.total_resto_unitel + self.total_resto_africell)
     
+    @staticmethod
+    def periodos_no_intervalo(periodo_tipo, data_inicio, data_fim):
+        """
+        Lista os períodos de calendário (data_inicio, data_fim) do tipo dado
+        que tocam o intervalo: dias, semanas (segunda a domingo), meses ou anos.
+        """
+        periodos = []
+        if periodo_tipo == 'diario':
+            inicio = data_inicio
+        elif periodo_tipo == 'semanal':
+            inicio = data_inicio - timedelta(days=data_inicio.weekday())
+        elif periodo_tipo == 'mensal':
+            inicio = data_inicio.replace(day=1)
+        elif periodo_tipo == 'anual':
+            inicio = data_inicio.replace(month=1, day=1)
+        else:
+            raise ValueError(f'Tipo de período inválido: {periodo_tipo}')
+        
+        while inicio <= data_fim:
+            if periodo_tipo == 'diario':
+                proximo = inicio + timedelta(days=1)
+            elif periodo_tipo == 'semanal':
+                proximo = inicio + timedelta(days=7)
+            elif periodo_tipo == 'mensal':
+                proximo = (inicio.replace(month=inicio.month + 1) if inicio.month < 12
+                           else inicio.replace(year=inicio.year + 1, month=1))
+            else:
+                proximo = inicio.replace(year=inicio.year + 1)
+            periodos.append((inicio, proximo - timedelta(days=1)))
+            inicio = proximo
+        
+        return periodos
+    
     @classmethod
-    def gerar_balanco(cls, loja, periodo_tipo, data_inicio=None, data_fim=None, usuario=None):
-        """Gera um balanço para o período especificado"""
+    def gerar_balanco(cls, loja, periodo_tipo, data_inicio=None, data_fim=None, usuario=None, compor=False):
+        """
+        Gera um balanço para o período especificado.
+        Com compor=True, balanços mensais e anuais são montados a partir dos
+        balanços menores já gravados quando estes cobrem o período.
+        """
+        from .composicao import COMPONENTES_PERIODO
+        
         hoje = datetime.now().date()
         
         if not data_inicio or not data_fim:
@@ -521,6 +773,17 @@ class Balanco(models.Model):
                 data_inicio = hoje.replace(month=1, day=1)
                 data_fim = hoje.replace(month=12, day=31)
         
+        if compor and periodo_tipo in COMPONENTES_PERIODO:
+            balanco = cls.objects.filter(
+                loja=loja,
+                periodo_tipo=periodo_tipo,
+                data_inicio=data_inicio
+            ).first() or cls(loja=loja, periodo_tipo=periodo_tipo, data_inicio=data_inicio)
+            balanco.data_fim = data_fim
+            balanco.criado_por = usuario
+            balanco.save(recalcular=not balanco.compor_de_balancos())
+            return balanco
+        
         balanco, created = cls.objects.get_or_create(
             loja=loja,
             periodo_tipo=periodo_tipo,
@@ -538,6 +801,191 @@ class Balanco(models.Model):
         
         return balanco
 
+class TarefaBalanco(models.Model):
+    """
+    Cálculo de balanço pendente, executado fora do pedido web pelo comando
+    processar_tarefas_balanco. As views criam a tarefa e consultam o
+    progresso pela API.
+    """
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Em Execução'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    ]
+    
+    loja = models.ForeignKey('lojas.Loja', on_delete=models.CASCADE, verbose_name='Loja', related_name='tarefas_balanco')
+    periodo_tipo = models.CharField(max_length=15, choices=Balanco.PERIODO_CHOICES, verbose_name='Tipo de Período')
+    data_inicio = models.DateField(verbose_name='Data de Início')
+    data_fim = models.DateField(verbose_name='Data de Fim')
+    descricao_periodo = models.CharField(max_length=100, blank=True, verbose_name='Descrição do Período')
+    
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pendente', verbose_name='Status')
+    progresso = models.PositiveSmallIntegerField(default=0, verbose_name='Progresso (%)')
+    etapa = models.CharField(max_length=50, blank=True, verbose_name='Etapa Atual')
+    erro = models.TextField(blank=True, verbose_name='Erro')
+    balanco = models.ForeignKey(Balanco, on_delete=models.SET_NULL, null=True, blank=True, related_name='tarefas', verbose_name='Balanço')
+    
+    criado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, verbose_name='Criado por')
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    # Renovada pelo worker a cada etapa; vencida, a tarefa volta a poder ser reservada
+    reserva_renovada_em = models.DateTimeField(null=True, blank=True, verbose_name='Reserva Renovada em')
+    concluido_em = models.DateTimeField(null=True, blank=True)
+    
+    # Tempo sem renovação após o qual o worker é dado como morto (SIGKILL, falta de memória...)
+    DURACAO_RESERVA = timedelta(minutes=10)
+    
+    class Meta:
+        verbose_name = 'Tarefa de Balanço'
+        verbose_name_plural = 'Tarefas de Balanço'
+        ordering = ['criado_em']
+        indexes = [
+            models.Index(fields=['status', 'criado_em']),
+        ]
+    
+    def __str__(self):
+        return f"Tarefa #{self.pk} - {self.loja.nome} {self.periodo_tipo} ({self.get_status_display()})"
+    
+    @property
+    def ativa(self):
+        return self.status in ('pendente', 'executando')
+    
+    @classmethod
+    def reserva_vencida(cls, agora):
+        """Filtro das tarefas em execução cujo worker não renova a reserva há DURACAO_RESERVA"""
+        limite = agora - cls.DURACAO_RESERVA
+        return Q(status='executando') & (
+            Q(reserva_renovada_em__lt=limite) |
+            Q(reserva_renovada_em__isnull=True, iniciado_em__lt=limite)
+        )
+    
+    @classmethod
+    def enfileirar(cls, loja, periodo_tipo, data_inicio, data_fim, descricao='', usuario=None):
+        """
+        Cria a tarefa, reaproveitando uma já ativa para o mesmo balanço.
+        Tarefas com a reserva vencida não contam como ativas: são encerradas
+        com erro e o balanço volta à fila numa tarefa nova.
+        """
+        from django.utils import timezone
+        
+        agora = timezone.now()
+        mesmas = cls.objects.filter(
+            loja=loja,
+            periodo_tipo=periodo_tipo,
+            data_inicio=data_inicio,
+            data_fim=data_fim
+        )
+        mesmas.filter(cls.reserva_vencida(agora)).update(
+            status='erro',
+            erro='Worker interrompido (reserva vencida)',
+            concluido_em=agora
+        )
+        tarefa = mesmas.filter(status__in=['pendente', 'executando']).first()
+        
+        if tarefa is None:
+            tarefa = cls.objects.create(
+                loja=loja,
+                periodo_tipo=periodo_tipo,
+                data_inicio=data_inicio,
+                data_fim=data_fim,
+                descricao_periodo=descricao,
+                criado_por=usuario
+            )
+        return tarefa
+    
+    @classmethod
+    def reservar_proxima(cls):
+        """
+        Reserva a tarefa pendente mais antiga para este processo, ou uma em
+        execução cuja reserva venceu (worker morto sem devolvê-la). A reserva
+        é um UPDATE condicional, portanto dois workers nunca pegam a mesma tarefa.
+        """
+        from django.utils import timezone
+        
+        agora = timezone.now()
+        disponivel = Q(status='pendente') | cls.reserva_vencida(agora)
+        for tarefa_id in cls.objects.filter(disponivel).order_by('criado_em').values_list('id', flat=True)[:10]:
+            reservada = cls.objects.filter(disponivel, id=tarefa_id).update(
+                status='executando',
+                iniciado_em=agora,
+                reserva_renovada_em=agora,
+                progresso=0,
+                etapa='Iniciando'
+            )
+            if reservada:
+                return cls.objects.select_related('loja').get(id=tarefa_id)
+        return None
+    
+    def atualizar_progresso(self, progresso, etapa):
+        """Grava o progresso e renova a reserva da tarefa"""
+        from django.utils import timezone
+        
+        self.progresso = progresso
+        self.etapa = etapa
+        self.reserva_renovada_em = timezone.now()
+        TarefaBalanco.objects.filter(id=self.id).update(
+            progresso=progresso, etapa=etapa, reserva_renovada_em=self.reserva_renovada_em
+        )
+    
+    def devolver_a_fila(self):
+        """Devolve à fila a tarefa interrompida a meio (worker encerrado)"""
+        if self.status == 'executando':
+            TarefaBalanco.objects.filter(id=self.id, status='executando').update(
+                status='pendente', progresso=0, reserva_renovada_em=None
+            )
+    
+    def executar(self):
+        """Calcula e grava o balanço da tarefa, registrando o resultado"""
+        from django.utils import timezone
+        
+        try:
+            balanco = Balanco.objects.filter(
+                loja=self.loja,
+                periodo_tipo=self.periodo_tipo,
+                data_inicio=self.data_inicio
+            ).first() or Balanco(
+                loja=self.loja,
+                periodo_tipo=self.periodo_tipo,
+                data_inicio=self.data_inicio,
+                descricao_periodo=self.descricao_periodo
+            )
+            balanco.data_fim = self.data_fim
+            balanco.criado_por = self.criado_por
+            
+            balanco.calcular_todos_dados(progresso=self.atualizar_progresso)
+            self.atualizar_progresso(100, 'Gravando')
+            balanco.save(recalcular=False)
+            
+            self.balanco = balanco
+            self.status = 'concluida'
+            self.etapa = 'Concluída'
+        except Exception as e:
+            logger.exception('Erro ao executar tarefa de balanço %s', self.id)
+            self.status = 'erro'
+            self.erro = str(e)
+        
+        self.concluido_em = timezone.now()
+        self.save()
+    
+    def como_dict(self):
+        """Estado da tarefa para a API de acompanhamento"""
+        return {
+            'id': self.id,
+            'loja': self.loja.nome,
+            'periodo_tipo': self.periodo_tipo,
+            'data_inicio': self.data_inicio.strftime('%d/%m/%Y'),
+            'data_fim': self.data_fim.strftime('%d/%m/%Y'),
+            'status': self.status,
+            'status_display': self.get_status_display(),
+            'progresso': self.progresso,
+            'etapa': self.etapa,
+            'erro': self.erro,
+            'balanco_id': self.balanco_id,
+            'url_balanco': self.balanco.get_absolute_url() if self.balanco_id else None,
+        }
+
+
 class MovimentoEstoque(models.Model):
     """
     Modelo para gerenciar entradas e saídas de produtos no estoque
@@ -567,13 +1015,29 @@ class MovimentoEstoque(models.Model):
         ('outro', 'Outro'),
     ]
     
+    PREFIXOS_REFERENCIA = {
+        'entrada': 'ENT',
+        'saida': 'SAI',
+        'ajuste': 'AJT',
+        'devolucao': 'DEV',
+        'transferencia': 'TRF',
+    }
+    
     # Identificação do movimento
     referencia = models.CharField(max_length=50, unique=True, verbose_name='Referência')
     tipo_movimento = models.CharField(max_length=15, choices=TIPO_MOVIMENTO_CHOICES, verbose_name='Tipo de Movimento')
     
     # Dados do produto
     loja = models.ForeignKey('lojas.Loja', on_delete=models.CASCADE, verbose_name='Loja')
-    produto = models.ForeignKey('produtos.Produto', on_delete=models.CASCADE, verbose_name='Produto')
+    produto = models.ForeignKey('produtos.Produto', on_delete=models.CASCADE, null=True, blank=True, verbose_name='Produto')
+    recarga = models.ForeignKey(
+        'produtos.Recarga',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name='Recarga',
+        related_name='movimentos_estoque'
+    )
     
     # Quantidades
     quantidade_anterior = models.PositiveIntegerField(default=0, verbose_name='Quantidade Anterior')
@@ -622,27 +1086,25 @@ class MovimentoEstoque(models.Model):
         indexes = [
             models.Index(fields=['referencia']),
             models.Index(fields=['produto', 'criado_em']),
+            models.Index(fields=['recarga', 'criado_em']),
             models.Index(fields=['loja', 'tipo_movimento']),
             models.Index(fields=['criado_em']),
         ]
     
     def __str__(self):
-        return f"{self.referencia} - {self.produto.nome} - {self.tipo_movimento} ({self.quantidade_movimento})"
+        return f"{self.referencia} - {self.item.nome} - {self.tipo_movimento} ({self.quantidade_movimento})"
+    
+    @property
+    def item(self):
+        """Produto ou recarga movimentado"""
+        return self.produto if self.produto_id else self.recarga
     
     def save(self, *args, **kwargs):
-        # Gerar referência automática se não existir
+        # Gerar referência automática se não existir (sequência por prefixo e loja)
         if not self.referencia:
-            prefix = {
-                'entrada': 'ENT',
-                'saida': 'SAI',
-                'ajuste': 'AJT',
-                'devolucao': 'DEV',
-                'transferencia': 'TRF'
-            }.get(self.tipo_movimento, 'MOV')
-            
-            from datetime import datetime
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            self.referencia = f"{prefix}-{self.produto.id}-{timestamp}"
+            from .referencias import reservar_referencias
+            prefix = self.PREFIXOS_REFERENCIA.get(self.tipo_movimento, 'MOV')
+            self.referencia = reservar_referencias(prefix, loja_id=self.loja_id)[0]
         
         # Calcular custo total
         if self.quantidade_movimento > 0 and self.custo_unitario > 0:
@@ -687,36 +1149,37 @@ class MovimentoEstoque(models.Model):
                          criado_por=None):
         """Método para registrar uma entrada de estoque"""
         from lojas.models import EstoqueLoja
+        from lojas.estoque import repor_estoque
         
-        # Buscar ou criar estoque da loja
-        estoque, created = EstoqueLoja.objects.get_or_create(
-            loja=loja,
-            produto=produto,
-            defaults={'quantidade': 0}
-        )
-        
-        # Registrar movimento
-        movimento = cls(
-            tipo_movimento='entrada',
-            produto=produto,
-            loja=loja,
-            quantidade_anterior=estoque.quantidade,
-            quantidade_movimento=quantidade,
-            quantidade_atual=estoque.quantidade + quantidade,
-            custo_unitario=custo_unitario,
-            preco_venda_unitario=preco_venda_unitario,
-            motivo_tipo=motivo_tipo,
-            motivo_detalhado=motivo_detalhado,
-            fornecedor=fornecedor,
-            nota_fiscal=nota_fiscal,
-            criado_por=criado_por,
-            data_documento=datetime.now().date()
-        )
-        movimento.save()
-        
-        # Atualizar estoque
-        estoque.quantidade += quantidade
-        estoque.save()
+        with transaction.atomic():
+            # Buscar ou criar estoque da loja
+            estoque, created = EstoqueLoja.objects.get_or_create(
+                loja=loja,
+                produto=produto,
+                defaults={'quantidade': 0}
+            )
+            
+            # Atualizar estoque
+            quantidade_anterior = repor_estoque(estoque, quantidade)
+            
+            # Registrar movimento
+            movimento = cls(
+                tipo_movimento='entrada',
+                produto=produto,
+                loja=loja,
+                quantidade_anterior=quantidade_anterior,
+                quantidade_movimento=quantidade,
+                quantidade_atual=estoque.quantidade,
+                custo_unitario=custo_unitario,
+                preco_venda_unitario=preco_venda_unitario,
+                motivo_tipo=motivo_tipo,
+                motivo_detalhado=motivo_detalhado,
+                fornecedor=fornecedor,
+                nota_fiscal=nota_fiscal,
+                criado_por=criado_por,
+                data_documento=datetime.now().date()
+            )
+            movimento.save()
         
         return movimento
     
@@ -725,6 +1188,7 @@ class MovimentoEstoque(models.Model):
                        motivo_detalhado='', venda=None, criado_por=None):
         """Método para registrar uma saída de estoque"""
         from lojas.models import EstoqueLoja
+        from lojas.estoque import baixar_estoque
         
         # Buscar estoque da loja
         try:
@@ -732,32 +1196,61 @@ class MovimentoEstoque(models.Model):
         except EstoqueLoja.DoesNotExist:
             raise ValueError(f"Produto {produto.nome} não encontrado no estoque da loja {loja.nome}")
         
-        # Verificar se há estoque suficiente
-        if estoque.quantidade < quantidade:
-            raise ValueError(f"Estoque insuficiente. Disponível: {estoque.quantidade}, Requerido: {quantidade}")
+        with transaction.atomic():
+            # Baixa condicional: levanta EstoqueInsuficiente (ValueError) se faltar saldo
+            quantidade_anterior = baixar_estoque(estoque, quantidade)
+            
+            # Registrar movimento
+            movimento = cls(
+                tipo_movimento='saida',
+                produto=produto,
+                loja=loja,
+                quantidade_anterior=quantidade_anterior,
+                quantidade_movimento=quantidade,
+                quantidade_atual=estoque.quantidade,
+                preco_venda_unitario=produto.preco,
+                motivo_tipo=motivo_tipo,
+                motivo_detalhado=motivo_detalhado,
+                venda=venda,
+                criado_por=criado_por
+            )
+            movimento.save()
         
-        # Registrar movimento
+        return movimento
+
+    @classmethod
+    def registrar_alteracao(cls, estoque, quantidade_anterior, tipo_movimento='ajuste',
+                            motivo_tipo='inventario', motivo_detalhado='', criado_por=None):
+        """
+        Registra no histórico uma alteração já aplicada a um EstoqueLoja ou
+        EstoqueRecarga (entrada manual, correção de inventário, ...)
+        """
+        from lojas.models import EstoqueLoja
+
+        quantidade_atual = int(estoque.quantidade)
+        if quantidade_atual == quantidade_anterior:
+            return None
+
+        item = estoque.produto if isinstance(estoque, EstoqueLoja) else estoque.recarga
         movimento = cls(
-            tipo_movimento='saida',
-            produto=produto,
-            loja=loja,
-            quantidade_anterior=estoque.quantidade,
-            quantidade_movimento=quantidade,
-            quantidade_atual=estoque.quantidade - quantidade,
-            preco_venda_unitario=produto.preco if venda else produto.preco,
+            tipo_movimento=tipo_movimento,
+            loja_id=estoque.loja_id,
+            quantidade_anterior=quantidade_anterior,
+            quantidade_movimento=abs(quantidade_atual - quantidade_anterior),
+            quantidade_atual=quantidade_atual,
+            preco_venda_unitario=item.preco,
             motivo_tipo=motivo_tipo,
             motivo_detalhado=motivo_detalhado,
-            venda=venda,
             criado_por=criado_por
         )
+        if isinstance(estoque, EstoqueLoja):
+            movimento.produto = item
+        else:
+            movimento.recarga = item
         movimento.save()
-        
-        # Atualizar estoque
-        estoque.quantidade -= quantidade
-        estoque.save()
-        
+
         return movimento
-    
+
     @property
     def estilo_tipo(self):
         """Retorna classes CSS baseadas no tipo de movimento"""
@@ -768,4 +1261,139 @@ class MovimentoEstoque(models.Model):
             'devolucao': {'class': 'info', 'icon': 'fas fa-undo', 'text': 'Devolução'},
             'transferencia': {'class': 'primary', 'icon': 'fas fa-exchange-alt', 'text': 'Transferência'},
         }
-        return styles.get(self.tipo_movimento, styles['ajuste'])
\ No newline at end of file
+        return styles.get(self.tipo_movimento, styles['ajuste'])
+
+class SequenciaReferencia(models.Model):
+    """
+    Contador das referências de MovimentoEstoque, por prefixo e, se
+    pedido, por loja. Guarda o último número já reservado; os números são
+    distribuídos em blocos por balanco/referencias.py.
+    """
+    prefixo = models.CharField(max_length=10, verbose_name='Prefixo')
+    loja = models.ForeignKey(
+        'lojas.Loja',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name='Loja',
+        related_name='sequencias_referencia'
+    )
+    ultimo_numero = models.PositiveBigIntegerField(default=0, verbose_name='Último Número Reservado')
+
+    class Meta:
+        verbose_name = 'Sequência de Referência'
+        verbose_name_plural = 'Sequências de Referência'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['prefixo', 'loja'],
+                condition=Q(loja__isnull=False),
+                name='sequencia_referencia_loja_unica'
+            ),
+            models.UniqueConstraint(
+                fields=['prefixo'],
+                condition=Q(loja__isnull=True),
+                name='sequencia_referencia_geral_unica'
+            ),
+        ]
+
+    def __str__(self):
+        escopo = f" - {self.loja.nome}" if self.loja_id else ''
+        return f"{self.prefixo}{escopo}: {self.ultimo_numero}"
+
+    @classmethod
+    def reservar(cls, prefixo, quantidade, loja_id=None):
+        """
+        Reserva `quantidade` números seguidos num UPDATE com F(), sem
+        disputa com outros processos. Retorna (primeiro, último).
+        """
+        filtro = {'prefixo': prefixo, 'loja_id': loja_id}
+        # Sem savepoint: dentro de outra transação a reserva segue o destino dela
+        with transaction.atomic(savepoint=False):
+            if not cls.objects.filter(**filtro).update(ultimo_numero=F('ultimo_numero') + quantidade):
+                # Primeira reserva: cria o contador (ou aproveita o criado por outro processo)
+                cls.objects.bulk_create([cls(prefixo=prefixo, loja_id=loja_id)], ignore_conflicts=True)
+                cls.objects.filter(**filtro).update(ultimo_numero=F('ultimo_numero') + quantidade)
+            ultimo = cls.objects.filter(**filtro).values_list('ultimo_numero', flat=True).get()
+        return ultimo - quantidade + 1, ultimo
+
+
+class FechamentoEstoque(models.Model):
+    """
+    Quantidade em estoque de um item numa loja ao fim de um dia.
+
+    Pontos de controle gravados pelo comando `manage.py fechar_estoque`:
+    o estoque de um dia passado é obtido a partir do fechamento mais
+    próximo, repetindo apenas as movimentações entre os dois dias
+    (ver balanco/estoque.py). Um dia fechado tem uma linha por item com
+    registro de estoque na loja; itens sem linha tinham estoque 0.
+    """
+    loja = models.ForeignKey('lojas.Loja', on_delete=models.CASCADE, verbose_name='Loja', related_name='fechamentos_estoque')
+    data = models.DateField(verbose_name='Data')
+    item_type = models.CharField(max_length=10, choices=[('produto', 'Produto'), ('recarga', 'Recarga')], verbose_name='Tipo de Item')
+    produto = models.ForeignKey(
+        'produtos.Produto',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name='Produto',
+        related_name='fechamentos_estoque'
+    )
+    recarga = models.ForeignKey(
+        'produtos.Recarga',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name='Recarga',
+        related_name='fechamentos_estoque'
+    )
+    quantidade = models.IntegerField(default=0, verbose_name='Quantidade')
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
+
+    class Meta:
+        verbose_name = 'Fechamento de Estoque'
+        verbose_name_plural = 'Fechamentos de Estoque'
+        ordering = ['-data', 'loja']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['loja', 'data', 'produto'],
+                condition=Q(item_type='produto'),
+                name='fechamento_estoque_produto_unico'
+            ),
+            models.UniqueConstraint(
+                fields=['loja', 'data', 'recarga'],
+                condition=Q(item_type='recarga'),
+                name='fechamento_estoque_recarga_unico'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['loja', 'item_type', 'data']),
+        ]
+
+    def __str__(self):
+        item = self.produto if self.item_type == 'produto' else self.recarga
+        return f"{self.loja.nome} - {self.data} - {item.nome}: {self.quantidade}"
+
+    @classmethod
+    def fechar_dia(cls, loja_id, dia):
+        """
+        Grava (ou regrava) o fechamento de estoque da loja no dia, para
+        produtos e recargas. Retorna o número de linhas gravadas.
+        """
+        from .estoque import estoque_no_dia
+
+        with transaction.atomic():
+            # Remove antes de calcular, para o dia não partir do próprio fechamento antigo
+            cls.objects.filter(loja_id=loja_id, data=dia).delete()
+
+            linhas = []
+            for item_type, campo_item in [('produto', 'produto_id'), ('recarga', 'recarga_id')]:
+                for item_id, posicao in estoque_no_dia(loja_id, item_type, dia).items():
+                    linhas.append(cls(
+                        loja_id=loja_id,
+                        data=dia,
+                        item_type=item_type,
+                        quantidade=posicao['fechamento'],
+                        **{campo_item: item_id}
+                    ))
+            cls.objects.bulk_create(linhas)
+        return len(linhas)
@@ -0,0 +1,101 @@
+"""
+Referências dos movimentos de estoque (MovimentoEstoque.referencia).
+
+Os números vêm de SequenciaReferencia, um contador por prefixo e, se
+pedido, por loja. Cada processo reserva um bloco de números de uma vez e
+o consome em memória: a maioria das referências sai sem consulta, e
+inserções em lote reservam todas as que precisam num único UPDATE. Dentro
+de uma transação, a sobra de um bloco ainda não confirmado serve às
+reservas seguintes da mesma transação. Os números não repetem, mas podem
+ficar lacunas (blocos não usados).
+"""
+import threading
+
+from django.db import transaction
+
+TAMANHO_BLOCO = 100
+
+# Blocos reservados e já confirmados: {(prefixo, loja_id): (próximo, último)}
+_blocos = {}
+_trava = threading.Lock()
+
+
+def formatar_referencia(prefixo, numero, loja_id=None):
+    """ENT-0000001, ou ENT-L3-0000001 para sequências por loja"""
+    if loja_id:
+        return f"{prefixo}-L{loja_id}-{numero:07d}"
+    return f"{prefixo}-{numero:07d}"
+
+
+def _guardar_bloco(chave, bloco):
+    with _trava:
+        # Se outra thread já guardou um bloco, o dela continua em uso
+        _blocos.setdefault(chave, bloco)
+
+
+class _SobraPendente:
+    """
+    Sobra de um bloco reservado na transação em curso, guardada para o
+    processo no commit. Enquanto a transação não termina, a própria
+    transação pode consumi-la.
+    """
+
+    def __init__(self, chave, proximo, ultimo):
+        self.chave = chave
+        self.proximo = proximo
+        self.ultimo = ultimo
+
+    def __call__(self):
+        if self.proximo <= self.ultimo:
+            _guardar_bloco(self.chave, (self.proximo, self.ultimo))
+
+
+def _sobra_da_transacao(chave):
+    """
+    Sobra pendente da transação em curso para a chave, ou None. As sobras
+    ficam nos callbacks de on_commit da conexão, que o Django descarta com
+    o rollback da transação ou do savepoint em que a reserva foi feita:
+    uma sobra encontrada ali continua válida.
+    """
+    for _, callback, _ in transaction.get_connection().run_on_commit:
+        if isinstance(callback, _SobraPendente) and callback.chave == chave:
+            return callback
+    return None
+
+
+def reservar_referencias(prefixo, quantidade=1, loja_id=None):
+    """
+    Lista de `quantidade` referências únicas do prefixo (na sequência da
+    loja, se dada). Usa primeiro o bloco guardado no processo e depois a
+    sobra pendente da transação em curso; o que faltar é reservado de uma
+    vez, com folga de TAMANHO_BLOCO números.
+    """
+    from .models import SequenciaReferencia
+
+    chave = (prefixo, loja_id)
+    numeros = []
+    with _trava:
+        if chave in _blocos:
+            proximo, ultimo = _blocos.pop(chave)
+            usados = min(quantidade, ultimo - proximo + 1)
+            numeros.extend(range(proximo, proximo + usados))
+            if proximo + usados <= ultimo:
+                _blocos[chave] = (proximo + usados, ultimo)
+
+    faltam = quantidade - len(numeros)
+    pendente = _sobra_da_transacao(chave) if faltam else None
+    if pendente:
+        usados = min(faltam, pendente.ultimo - pendente.proximo + 1)
+        numeros.extend(range(pendente.proximo, pendente.proximo + usados))
+        pendente.proximo += usados
+        faltam -= usados
+
+    if faltam:
+        primeiro, ultimo = SequenciaReferencia.reservar(prefixo, faltam + TAMANHO_BLOCO, loja_id)
+        numeros.extend(range(primeiro, primeiro + faltam))
+        # A sobra só fica disponível para o processo depois do commit: se a
+        # transação for desfeita, a reserva também é, e os números não
+        # podem ser reaproveitados
+        transaction.on_commit(_SobraPendente(chave, primeiro + faltam, ultimo))
+
+    return [formatar_referencia(prefixo, numero, loja_id) for numero in numeros]
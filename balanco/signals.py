@@ -0,0 +1,48 @@
+# balanco/signals.py
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from lojas.signals import vendas_alteradas
+from relatorio.models import RelatorioDiario
+
+from .agregacao import CAMPOS_RELATORIO
+from .models import Balanco
+
+
+def valores_do_relatorio(relatorio):
+    """Campos monetários do relatório usados pelos balanços"""
+    return {campo: getattr(relatorio, campo) for campo in CAMPOS_RELATORIO.values()}
+
+
+@receiver(vendas_alteradas)
+def atualizar_balancos_vendas(sender, vendas, sinal, **kwargs):
+    """Mantém os balanços gravados em dia com as vendas"""
+    Balanco.aplicar_vendas(vendas, sinal)
+
+
+@receiver(pre_save, sender=RelatorioDiario)
+def guardar_relatorio_anterior(sender, instance, raw=False, **kwargs):
+    """Guarda os valores gravados do relatório para descontá-los após a edição"""
+    instance._relatorio_anterior = None
+    if instance.pk and not raw:
+        instance._relatorio_anterior = RelatorioDiario.objects.filter(pk=instance.pk).values(
+            'loja_id', 'data', *CAMPOS_RELATORIO.values()
+        ).first()
+
+
+@receiver(post_save, sender=RelatorioDiario)
+def relatorio_salvo(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    anterior = getattr(instance, '_relatorio_anterior', None)
+    with transaction.atomic():
+        if anterior:
+            Balanco.aplicar_relatorio(anterior['loja_id'], anterior['data'], anterior, -1)
+        Balanco.aplicar_relatorio(instance.loja_id, instance.data, valores_do_relatorio(instance), 1)
+
+
+@receiver(post_delete, sender=RelatorioDiario)
+def relatorio_removido(sender, instance, **kwargs):
+    Balanco.aplicar_relatorio(instance.loja_id, instance.data, valores_do_relatorio(instance), -1)
@@ -1,3 +1,77 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from conta.models import Conta
+from lojas.models import Loja, ResumoVendaDiaria
+from produtos.models import Produto, Recarga
+from relatorio.models import RelatorioDiario
+from .models import Balanco
+
+
+class ConsultasBalancoTest(TestCase):
+    """
+    O custo de calcular um balanço é constante (ver balanco/agregacao.py):
+    o número de consultas não cresce com o período nem com o volume de
+    vendas e relatórios da loja.
+    """
+    # Marca d'água (2), totais de vendas e relatórios (2), séries diárias
+    # de vendas e relatórios (2) e rankings de produtos, recargas e vendedores (3)
+    CONSULTAS_BALANCO = 9
+
+    def setUp(self):
+        self.vendedor = Conta.objects.create_user(
+            'vendedor@teste.ao', 'senha', username='vendedor', nome='Vendedor'
+        )
+        self.loja = Loja.objects.create(
+            nome='Loja Teste', bairro='Centro', cidade='Luanda', provincia='Luanda'
+        )
+        self.produtos = [
+            Produto.objects.create(nome=f'Produto {i}', preco=Decimal(10 + i)) for i in range(3)
+        ]
+        self.recargas = [
+            Recarga.objects.create(nome=f'Recarga {i}', preco=Decimal(100 * (i + 1))) for i in range(2)
+        ]
+        self.inicio = date(2025, 1, 1)
+        self.dias_com_dados = 0
+
+    def _preencher_ate(self, dias):
+        """Resumos de vendas e relatórios diários nos primeiros `dias` dias do ano"""
+        resumos = []
+        for dia in range(self.dias_com_dados, dias):
+            data = self.inicio + timedelta(days=dia)
+            for produto in self.produtos:
+                resumos.append(ResumoVendaDiaria(
+                    loja=self.loja, data=data, item_type='produto', produto=produto,
+                    vendedor=self.vendedor, quantidade=2, valor_total=2 * produto.preco, numero_vendas=1
+                ))
+            for recarga in self.recargas:
+                resumos.append(ResumoVendaDiaria(
+                    loja=self.loja, data=data, item_type='recarga', recarga=recarga,
+                    vendedor=self.vendedor, quantidade=1, valor_total=recarga.preco, numero_vendas=1
+                ))
+            RelatorioDiario.objects.create(
+                loja=self.loja, usuario=self.vendedor, data=data,
+                tpa=Decimal('10.00'), dstv=Decimal('20.00'), dm=Decimal('5.00'),
+                moedas=Decimal('1.00'), gastos=Decimal('3.00'), acc=Decimal('7.00')
+            )
+        ResumoVendaDiaria.objects.bulk_create(resumos)
+        self.dias_com_dados = dias
+
+    def _balanco_anual(self):
+        return Balanco(
+            loja=self.loja,
+            periodo_tipo='anual',
+            data_inicio=self.inicio,
+            data_fim=self.inicio.replace(month=12, day=31)
+        )
+
+    def test_balanco_anual_com_numero_constante_de_consultas(self):
+        vendas_por_dia = len(self.produtos) + len(self.recargas)
+        for dias in (3, 120):
+            self._preencher_ate(dias)
+            balanco = self._balanco_anual()
+            with self.assertNumQueries(self.CONSULTAS_BALANCO):
+                balanco.calcular_todos_dados()
+            self.assertEqual(balanco.total_transacoes, dias * vendas_por_dia)
@@ -20,6 +20,7 @@ urlpatterns = [
     
     # APIs
     path('api/dados/<int:balanco_id>/', views.api_dados_balanco, name='api_dados_balanco'),
+    path('api/tarefa/<int:tarefa_id>/', views.api_status_tarefa, name='api_status_tarefa'),
 
      # Estoque consolidado (produtos de todas as lojas)
     path('produtos/', views.listar_produtos_estoque, name='listar_produtos_estoque'),
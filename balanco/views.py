@@ -8,7 +8,7 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 import json
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from .models import Balanco, MovimentoEstoque
+from .models import Balanco, MovimentoEstoque, TarefaBalanco
 from produtos.models import Produto
 from lojas.models import Venda, Loja, EstoqueLoja
 
@@ -80,8 +80,16 @@ def lista_balancos(request):
     # Anos disponíveis
     anos_disponiveis = Balanco.objects.dates('data_inicio', 'year').values_list('data_inicio__year', flat=True).distinct()
     
+    # Cálculos em segundo plano ainda não terminados
+    tarefas_ativas = TarefaBalanco.objects.filter(
+        status__in=['pendente', 'executando']
+    ).select_related('loja').order_by('criado_em')
+    if not request.user.is_superuser:
+        tarefas_ativas = tarefas_ativas.filter(loja__in=lojas_para_tabela)
+    
     context = {
         'balancos': balancos,  # Agora é um objeto Page, não um QuerySet
+        'tarefas_ativas': tarefas_ativas,
         'lojas': lojas_para_tabela,  # Para a tabela/filtros
         'todas_lojas': todas_lojas,  # Para o modal de criação (TODAS as lojas)
         'periodo_tipo_selecionado': periodo_tipo,
@@ -108,10 +116,9 @@ def detalhe_balanco(request, balanco_id):
         messages.error(request, 'Sem permissão para visualizar este balanço.')
         return redirect('balancos:lista_balancos')
     
-    # FORÇAR recálculo completo dos dados
+    # Recalcular apenas se as vendas ou relatórios do período mudaram
     try:
-        balanco.calcular_todos_dados()
-        balanco.save()
+        balanco.atualizar_se_necessario()
     except Exception as e:
         print(f"Erro ao calcular dados do balanço: {e}")
         # Continua mesmo com erro
@@ -141,8 +148,8 @@ def detalhe_balanco(request, balanco_id):
         # Top vendedores
         top_vendedores = balanco.detalhes_vendedores or []
         
-        # Dados dos relatórios
-        dados_relatorios = balanco.detalhes_relatorios or {}
+        # Dados dos relatórios (derivados dos totais gravados)
+        dados_relatorios = balanco.calcular_dados_relatorios_em_tempo_real()
         
     except Exception as e:
         print(f"Erro ao obter dados detalhados: {e}")
@@ -259,18 +266,18 @@ def criar_balanco_personalizado(request):
                 messages.info(request, f'Já existe um balanço para este período. <a href="{balanco_existente.get_absolute_url()}">Ver balanço</a>')
                 return redirect('lista_balancos')
             
-            # CRIAR O BALANÇO
-            balanco = Balanco.objects.create(
+            # ENFILEIRAR O CÁLCULO (executado pelo comando processar_tarefas_balanco)
+            tarefa = TarefaBalanco.enfileirar(
                 loja=loja,
                 periodo_tipo=periodo_tipo,
                 data_inicio=data_inicio,
                 data_fim=data_fim,
-                descricao_periodo=descricao or f"Balanço {periodo_tipo.capitalize()} - {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}",
-                criado_por=request.user
+                descricao=descricao or f"Balanço {periodo_tipo.capitalize()} - {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}",
+                usuario=request.user
             )
             
-            messages.success(request, f'✅ Balanço criado com sucesso para {loja.nome}!')
-            return redirect('detalhe_balanco', balanco_id=balanco.id)
+            messages.success(request, f'⏳ Balanço de {loja.nome} em processamento (tarefa #{tarefa.id}).')
+            return redirect('lista_balancos')
             
         except Exception as e:
             messages.error(request, f'❌ Erro ao criar balanço: {str(e)}')
@@ -332,18 +339,18 @@ def gerar_balanco_rapido(request, periodo_tipo):
             messages.info(request, f'Balanço {periodo_tipo} já existe para este período.')
             return redirect('detalhe_balanco', balanco_id=balanco_existente.id)
         
-        # Criar balanço
-        balanco = Balanco.objects.create(
+        # Enfileirar o cálculo do balanço
+        tarefa = TarefaBalanco.enfileirar(
             loja=loja,
             periodo_tipo=periodo_tipo,
             data_inicio=data_inicio,
             data_fim=data_fim,
-            descricao_periodo=descricao,
-            criado_por=request.user
+            descricao=descricao,
+            usuario=request.user
         )
         
-        messages.success(request, f'Balanço {periodo_tipo} criado com sucesso para {loja.nome}!')
-        return redirect('detalhe_balanco', balanco_id=balanco.id)
+        messages.success(request, f'Balanço {periodo_tipo} de {loja.nome} em processamento (tarefa #{tarefa.id}).')
+        return redirect('lista_balancos')
         
     except Exception as e:
         messages.error(request, f'Erro ao gerar balanço: {str(e)}')
@@ -450,6 +457,19 @@ def api_dados_balanco(request, balanco_id):
         'detalhes_relatorios': balanco.detalhes_relatorios_diarios,
     })
 
+@login_required
+def api_status_tarefa(request, tarefa_id):
+    """API para acompanhar o progresso de uma tarefa de balanço"""
+    tarefa = get_object_or_404(TarefaBalanco.objects.select_related('loja'), id=tarefa_id)
+    
+    if not request.user.is_superuser and tarefa.loja not in request.user.lojas_gerenciadas.all():
+        return JsonResponse({'error': 'Sem permissão'}, status=403)
+    
+    return JsonResponse({
+        'success': True,
+        'tarefa': tarefa.como_dict(),
+    })
+
 ###################################################################
 #                                                                 #
 #################### Movimentos de Produtos #######################
@@ -462,14 +482,21 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db.models import Sum, Count, Avg, Q, F
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
 import csv
 
 from produtos.models import Produto, Recarga
-from lojas.models import Loja, EstoqueLoja, EstoqueRecarga, Venda
+from lojas.models import Loja, EstoqueLoja, EstoqueRecarga, Venda, ResumoVendaDiaria
+from lojas.estoque import efetuar_venda, EstoqueInsuficiente
+from .estoque import (
+    montar_tabela_estoque, resumir_tabela_estoque, linhas_exportacao_estoque
+)
+from .analise import (
+    estoque_e_vendas_por_loja, serie_mensal_vendas, MESES_SERIE_PADRAO, MESES_SERIE_MAXIMO
+)
 
 @login_required
 def listar_produtos_estoque(request):
@@ -488,122 +515,28 @@ def listar_produtos_estoque(request):
     tipo_produto = request.GET.get('tipo', 'produtos')  # produtos ou recargas
     status_estoque = request.GET.get('status', '')
     
-    # Obter todos os produtos e recargas
-    produtos = Produto.objects.all().order_by('nome')
-    recargas = Recarga.objects.all().order_by('nome')
-    
-    # Dados para a tabela consolidada
-    tabela_estoque = []
-    
+    # Itens do tipo escolhido; o estoque vem da matriz item × loja (1 consulta)
     if tipo_produto == 'produtos':
-        items = produtos
+        items = Produto.objects.all().order_by('nome')
         item_type = 'produto'
     else:
-        items = recargas
+        items = Recarga.objects.all().order_by('nome')
         item_type = 'recarga'
     
-    # Para cada item (produto ou recarga), coletar estoque em cada loja
-    for item in items:
-        item_data = {
-            'id': item.id,
-            'nome': item.nome,
-            'preco': item.preco,
-            'tipo': item_type,
-            'estoques': [],
-            'estoque_total': 0,
-            'valor_total_estoque': Decimal('0.00')
-        }
-        
-        # Coletar estoque em cada loja
-        for loja in lojas:
-            if loja_id and str(loja.id) != loja_id:
-                continue  # Pular se filtro de loja ativo
-                
-            if item_type == 'produto':
-                try:
-                    estoque = EstoqueLoja.objects.get(loja=loja, produto=item)
-                    quantidade = estoque.quantidade
-                except EstoqueLoja.DoesNotExist:
-                    quantidade = 0
-            else:  # recarga
-                try:
-                    estoque = EstoqueRecarga.objects.get(loja=loja, recarga=item)
-                    quantidade = estoque.quantidade
-                except EstoqueRecarga.DoesNotExist:
-                    quantidade = 0
-            
-            # Calcular valor do estoque nesta loja
-            valor_estoque_loja = quantidade * item.preco
-            
-            # Adicionar ao estoque total
-            item_data['estoque_total'] += quantidade
-            item_data['valor_total_estoque'] += valor_estoque_loja
-            
-            # Status do estoque
-            if quantidade == 0:
-                status = 'esgotado'
-                status_class = 'danger'
-            elif quantidade < 10:
-                status = 'baixo'
-                status_class = 'warning'
-            else:
-                status = 'normal'
-                status_class = 'success'
-            
-            # Filtrar por status se especificado
-            if status_estoque and status != status_estoque:
-                continue
-            
-            item_data['estoques'].append({
-                'loja_id': loja.id,
-                'loja_nome': loja.nome,
-                'quantidade': quantidade,
-                'valor_estoque': valor_estoque_loja,
-                'status': status,
-                'status_class': status_class,
-                'cidade': loja.cidade
-            })
-        
-        # Adicionar item à tabela apenas se tiver estoque ou se não houver filtro de loja
-        if not loja_id or item_data['estoques']:
-            tabela_estoque.append(item_data)
-    
-    # Ordenar por valor total de estoque (desc)
-    tabela_estoque.sort(key=lambda x: x['valor_total_estoque'], reverse=True)
+    tabela_estoque = montar_tabela_estoque(items, lojas, item_type, loja_id, status_estoque)
     
     # Paginação
     paginator = Paginator(tabela_estoque, 25)
     page = request.GET.get('page')
     tabela_paginada = paginator.get_page(page)
     
-    # Estatísticas
-    total_items = len(tabela_estoque)
-    total_estoque = sum(item['estoque_total'] for item in tabela_estoque)
-    total_valor_estoque = sum(item['valor_total_estoque'] for item in tabela_estoque)
-    
-    # Contar status
-    contagem_status = {
-        'normal': 0,
-        'baixo': 0,
-        'esgotado': 0
-    }
-    
-    for item in tabela_estoque:
-        for estoque in item['estoques']:
-            contagem_status[estoque['status']] += 1
-    
     context = {
         'tabela_estoque': tabela_paginada,
         'lojas': lojas,
         'loja_selecionada': loja_id,
         'tipo_selecionado': tipo_produto,
         'status_selecionado': status_estoque,
-        'estatisticas': {
-            'total_items': total_items,
-            'total_estoque': total_estoque,
-            'total_valor_estoque': total_valor_estoque,
-            'contagem_status': contagem_status
-        },
+        'estatisticas': resumir_tabela_estoque(tabela_estoque),
         'tipos': [
             ('produtos', 'Produtos'),
             ('recargas', 'Recargas')
@@ -647,7 +580,7 @@ def detalhe_produto_loja(request, produto_id, loja_id=None):
     else:
         lojas_query = lojas_disponiveis
     
-    # Coletar dados de estoque e vendas para cada loja
+    # Estoque e vendas do produto em cada loja (1 consulta agrupada)
     estoques_lojas = []
     total_estoque = 0
     total_valor_estoque = Decimal('0.00')
@@ -656,32 +589,15 @@ def detalhe_produto_loja(request, produto_id, loja_id=None):
     total_valor_vendido = Decimal('0.00')
     lojas_com_estoque = 0
     
-    for loja in lojas_query:
-        # Buscar estoque
-        try:
-            estoque = EstoqueLoja.objects.get(loja=loja, produto=produto)
-            quantidade_estoque = estoque.quantidade
-            status = estoque.status_estoque
-        except EstoqueLoja.DoesNotExist:
-            quantidade_estoque = 0
-            status = 'esgotado'
-        
-        # Buscar vendas deste produto nesta loja
-        vendas_loja = Venda.objects.filter(
-            estoque_loja__loja=loja,
-            estoque_loja__produto=produto,
-            item_type='produto'
-        )
-        
-        quantidade_vendida = vendas_loja.aggregate(total=Sum('quantidade'))['total'] or 0
-        valor_vendido = vendas_loja.aggregate(total=Sum('valor_total'))['total'] or Decimal('0.00')
-        num_vendas = vendas_loja.count()
+    for loja in estoque_e_vendas_por_loja(produto, lojas_query):
+        quantidade_estoque = loja.quantidade_estoque
+        valor_vendido = loja.valor_vendido or Decimal('0.00')
         
         # Atualizar totais gerais
         total_estoque += quantidade_estoque
         total_valor_estoque += quantidade_estoque * produto.preco
-        total_vendas += num_vendas
-        total_vendido += quantidade_vendida
+        total_vendas += loja.numero_vendas
+        total_vendido += loja.quantidade_vendida
         total_valor_vendido += valor_vendido
         
         if quantidade_estoque > 0:
@@ -691,9 +607,9 @@ def detalhe_produto_loja(request, produto_id, loja_id=None):
         estoques_lojas.append({
             'loja': loja,
             'quantidade': quantidade_estoque,
-            'status': status,
-            'total_vendas': num_vendas,
-            'quantidade_vendida': quantidade_vendida,
+            'status': loja.status_estoque,
+            'total_vendas': loja.numero_vendas,
+            'quantidade_vendida': loja.quantidade_vendida,
             'valor_vendido': float(valor_vendido),
             'valor_estoque': float(quantidade_estoque * produto.preco)
         })
@@ -707,40 +623,13 @@ def detalhe_produto_loja(request, produto_id, loja_id=None):
         'vendedor'
     ).order_by('-data_venda')[:50]
     
-    # Preparar dados para gráfico de vendas por mês (últimos 6 meses)
-    hoje = datetime.now()
-    meses_labels = []
-    vendas_mensais = []
-    
-    for i in range(5, -1, -1):  # Últimos 6 meses
-        data_referencia = hoje - timedelta(days=30*i)
-        mes_label = data_referencia.strftime('%b/%Y')
-        meses_labels.append(mes_label)
-        
-        # Calcular início e fim do mês
-        inicio_mes = data_referencia.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        if data_referencia.month == 12:
-            fim_mes = data_referencia.replace(
-                year=data_referencia.year + 1, 
-                month=1, 
-                day=1
-            )
-        else:
-            fim_mes = data_referencia.replace(
-                month=data_referencia.month + 1, 
-                day=1
-            )
-        
-        # Buscar vendas do mês
-        vendas_mes = Venda.objects.filter(
-            estoque_loja__produto=produto,
-            item_type='produto',
-            data_venda__gte=inicio_mes,
-            data_venda__lt=fim_mes
-        ).aggregate(total=Sum('quantidade'))['total'] or 0
-        
-        vendas_mensais.append(vendas_mes)
+    # Gráfico de vendas por mês de calendário (padrão 6, no máximo 24 meses)
+    try:
+        meses_serie = int(request.GET.get('meses', MESES_SERIE_PADRAO))
+    except ValueError:
+        meses_serie = MESES_SERIE_PADRAO
+    meses_serie = max(1, min(meses_serie, MESES_SERIE_MAXIMO))
+    meses_labels, vendas_mensais = serie_mensal_vendas(produto, lojas_query, meses_serie)
     
     # Estatísticas consolidados
     estatisticas = {
@@ -765,6 +654,7 @@ def detalhe_produto_loja(request, produto_id, loja_id=None):
         'estatisticas': estatisticas,
         'grafico_meses': grafico_meses,
         'grafico_vendas': grafico_vendas,
+        'meses_serie': meses_serie,
     }
     
     return render(request, 'estoque/detalhe_produto_loja.html', context)
@@ -788,34 +678,18 @@ def criar_entrada_estoque(request):
                 messages.error(request, 'Você não tem permissão para adicionar estoque nesta loja.')
                 return redirect('detalhe_produto_loja', produto_id=produto_id)
             
-            # Buscar ou criar estoque
-            estoque, created = EstoqueLoja.objects.get_or_create(
-                loja=loja,
+            # Registra o movimento e atualiza (ou cria) o estoque da loja
+            MovimentoEstoque.registrar_entrada(
                 produto=produto,
-                defaults={'quantidade': 0}
+                loja=loja,
+                quantidade=quantidade,
+                custo_unitario=custo_unitario,
+                preco_venda_unitario=produto.preco,
+                motivo_tipo='compra',
+                motivo_detalhado=motivo,
+                criado_por=request.user
             )
             
-            # Atualizar estoque
-            estoque.quantidade += quantidade
-            estoque.save()
-            
-            # Registrar movimento se o modelo existir
-            try:
-                from .models import MovimentoEstoque
-                MovimentoEstoque.registrar_entrada(
-                    produto=produto,
-                    loja=loja,
-                    quantidade=quantidade,
-                    custo_unitario=custo_unitario,
-                    preco_venda_unitario=produto.preco,
-                    motivo_tipo='compra',
-                    motivo_detalhado=motivo,
-                    criado_por=request.user
-                )
-            except:
-                # Se não houver modelo MovimentoEstoque, apenas registrar no log
-                pass
-            
             messages.success(request, f'Entrada de {quantidade} unidades registrada com sucesso!')
             
         except Exception as e:
@@ -851,24 +725,15 @@ def criar_saida_estoque(request):
                 messages.error(request, 'Produto não encontrado no estoque desta loja.')
                 return redirect('detalhe_produto_loja', produto_id=produto_id, loja_id=loja_id)
             
-            # Verificar estoque suficiente
-            if estoque.quantidade < quantidade:
-                messages.error(request, f'Estoque insuficiente. Disponível: {estoque.quantidade}')
-                return redirect('detalhe_produto_loja', produto_id=produto_id, loja_id=loja_id)
+            from django.contrib.auth import get_user_model
+            vendedor = get_user_model().objects.get(id=vendedor_id)
             
-            # Criar venda
-            venda = Venda.objects.create(
-                estoque_loja=estoque,
-                item_type='produto',
-                quantidade=quantidade,
-                valor_total=quantidade * produto.preco,
-                vendedor_id=vendedor_id,
-                observacao=motivo
-            )
-            
-            # Atualizar estoque
-            estoque.quantidade -= quantidade
-            estoque.save()
+            # Baixa do estoque, venda e movimento numa única transação
+            try:
+                venda = efetuar_venda(estoque, quantidade, vendedor, motivo)
+            except EstoqueInsuficiente as e:
+                messages.error(request, f'Estoque insuficiente. Disponível: {e.disponivel}')
+                return redirect('detalhe_produto_loja', produto_id=produto_id, loja_id=loja_id)
             
             messages.success(request, f'Saída de {quantidade} unidades registrada com sucesso! Venda #{venda.id}')
             
@@ -879,78 +744,27 @@ def criar_saida_estoque(request):
     
     return redirect('listar_produtos_estoque')
 
+class Eco:
+    """Destino do csv.writer que devolve a linha escrita, para streaming"""
+    def write(self, valor):
+        return valor
+
 @login_required
 def exportar_estoque(request):
-    """Exporta o estoque para CSV"""
+    """Exporta o estoque para CSV em streaming (memória constante)"""
     # Filtros
     loja_id = request.GET.get('loja', '')
     tipo = request.GET.get('tipo', 'produtos')
     
-    # Response
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="estoque_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
+    item_type = 'produto' if tipo == 'produtos' else 'recarga'
+    cabecalho = ['Produto' if item_type == 'produto' else 'Recarga', 'Código', 'Preço', 'Loja', 'Quantidade', 'Valor Estoque', 'Status']
     
-    writer = csv.writer(response)
+    def gerar_csv():
+        writer = csv.writer(Eco())
+        yield writer.writerow(cabecalho)
+        for linha in linhas_exportacao_estoque(item_type, loja_id):
+            yield writer.writerow(linha)
     
-    if tipo == 'produtos':
-        writer.writerow(['Produto', 'Código', 'Preço', 'Loja', 'Quantidade', 'Valor Estoque', 'Status'])
-        
-        produtos = Produto.objects.all()
-        lojas = Loja.objects.all()
-        
-        if loja_id:
-            lojas = lojas.filter(id=loja_id)
-        
-        for produto in produtos:
-            for loja in lojas:
-                try:
-                    estoque = EstoqueLoja.objects.get(loja=loja, produto=produto)
-                    quantidade = estoque.quantidade
-                    status = estoque.status_estoque
-                except EstoqueLoja.DoesNotExist:
-                    quantidade = 0
-                    status = 'esgotado'
-                
-                valor_estoque = quantidade * produto.preco
-                
-                writer.writerow([
-                    produto.nome,
-                    f'PROD{produto.id:04d}',
-                    f'{produto.preco:.2f}',
-                    loja.nome,
-                    quantidade,
-                    f'{valor_estoque:.2f}',
-                    status
-                ])
-    else:
-        writer.writerow(['Recarga', 'Código', 'Preço', 'Loja', 'Quantidade', 'Valor Estoque', 'Status'])
-        
-        recargas = Recarga.objects.all()
-        lojas = Loja.objects.all()
-        
-        if loja_id:
-            lojas = lojas.filter(id=loja_id)
-        
-        for recarga in recargas:
-            for loja in lojas:
-                try:
-                    estoque = EstoqueRecarga.objects.get(loja=loja, recarga=recarga)
-                    quantidade = estoque.quantidade
-                    status = estoque.status_estoque
-                except EstoqueRecarga.DoesNotExist:
-                    quantidade = 0
-                    status = 'esgotado'
-                
-                valor_estoque = quantidade * recarga.preco
-                
-                writer.writerow([
-                    recarga.nome,
-                    f'REC{recarga.id:04d}',
-                    f'{recarga.preco:.2f}',
-                    loja.nome,
-                    quantidade,
-                    f'{valor_estoque:.2f}',
-                    status
-                ])
-    
-    return response
\ No newline at end of file
+    response = StreamingHttpResponse(gerar_csv(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="estoque_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
+    return response
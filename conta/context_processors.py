@@ -1,4 +1,5 @@
 # conta/context_processors.py
+from django.db.models import Count, Q
 from relatorio.models import RelatorioDiario  # ou onde está seu modelo
 
 def estatisticas_relatorios(request):
@@ -20,30 +21,21 @@ def estatisticas_relatorios(request):
         lojas_usuario = request.user.lojas_gerenciadas.all()
         relatorios = RelatorioDiario.objects.filter(loja__in=lojas_usuario)
     
-    # Calcular estatísticas
-    total_relatorios = relatorios.count()
-    completos = 0
-    negativos = 0
-    pendentes = 0
-    
-    for relatorio in relatorios:
-        try:
-            diferenca = relatorio.calcular_diferenca()
-            if diferenca > 0:
-                completos += 1
-            elif diferenca < 0:
-                negativos += 1
-            else:
-                pendentes += 1
-        except Exception:
-            continue
+    # Calcular estatísticas numa única agregação sobre o status anotado
+    # (o mesmo de lista_relatorios: completo com sobra, negativo com falta)
+    contagem = relatorios.com_totais().aggregate(
+        total=Count('id'),
+        completos=Count('id', filter=Q(status='completo')),
+        negativos=Count('id', filter=Q(status='negativo')),
+        pendentes=Count('id', filter=Q(status='pendente')),
+    )
     
     return {
         'estatisticas': {
-            'total_relatorios': total_relatorios,
-            'completos': completos,
-            'pendentes': pendentes,
-            'negativos': negativos,
+            'total_relatorios': contagem['total'],
+            'completos': contagem['completos'],
+            'pendentes': contagem['pendentes'],
+            'negativos': contagem['negativos'],
         }
     }
 
@@ -46,12 +46,12 @@ class Conta(AbstractBaseUser, PermissionsMixin):
         """
         Calcula o total de vendas realizadas por este usuário
         """
-        vendas_query = self.venda_set.all()
+        vendas_query = self.resumos_vendas.all()
         
         if data_relatorio:
             if isinstance(data_relatorio, str):
                 data_relatorio = datetime.strptime(data_relatorio, '%Y-%m-%d').date()
-            vendas_query = vendas_query.filter(data_venda__date=data_relatorio)
+            vendas_query = vendas_query.filter(data=data_relatorio)
         
         total = vendas_query.aggregate(
             total_vendas=Sum('valor_total')
@@ -62,12 +62,12 @@ class Conta(AbstractBaseUser, PermissionsMixin):
         """
         Calcula a quantidade total de produtos vendidos por este usuário
         """
-        vendas_query = self.venda_set.all()
+        vendas_query = self.resumos_vendas.all()
         
         if data_relatorio:
             if isinstance(data_relatorio, str):
                 data_relatorio = datetime.strptime(data_relatorio, '%Y-%m-%d').date()
-            vendas_query = vendas_query.filter(data_venda__date=data_relatorio)
+            vendas_query = vendas_query.filter(data=data_relatorio)
         
         total = vendas_query.aggregate(
             total_quantidade=Sum('quantidade')
@@ -79,7 +79,7 @@ class Conta(AbstractBaseUser, PermissionsMixin):
         Retorna vendas do usuário por período específico
         """
         return self.venda_set.filter(
-            data_venda__date__range=[data_inicio, data_fim]
+            dia_venda__range=[data_inicio, data_fim]
         )
     
     def vendas_ultimos_30_dias(self):
@@ -88,7 +88,7 @@ class Conta(AbstractBaseUser, PermissionsMixin):
         """
         data_inicio = datetime.now().date() - timedelta(days=30)
         data_fim = datetime.now().date()
-        vendas = self.get_vendas_por_periodo(data_inicio, data_fim)
+        vendas = self.resumos_vendas.filter(data__range=[data_inicio, data_fim])
         total = vendas.aggregate(total=Sum('valor_total'))['total'] or 0
         return total
     
@@ -98,7 +98,7 @@ class Conta(AbstractBaseUser, PermissionsMixin):
         """
         data_inicio = datetime.now().date() - timedelta(days=30)
         data_fim = datetime.now().date()
-        vendas = self.get_vendas_por_periodo(data_inicio, data_fim)
+        vendas = self.resumos_vendas.filter(data__range=[data_inicio, data_fim])
         total = vendas.aggregate(total=Sum('quantidade'))['total'] or 0
         return total
     
@@ -115,14 +115,16 @@ class Conta(AbstractBaseUser, PermissionsMixin):
         """
         Retorna o número total de vendas realizadas pelo usuário
         """
-        vendas_query = self.venda_set.all()
+        vendas_query = self.resumos_vendas.all()
         
         if data_relatorio:
             if isinstance(data_relatorio, str):
                 data_relatorio = datetime.strptime(data_relatorio, '%Y-%m-%d').date()
-            vendas_query = vendas_query.filter(data_venda__date=data_relatorio)
+            vendas_query = vendas_query.filter(data=data_relatorio)
         
-        return vendas_query.count()
+        return vendas_query.aggregate(
+            total_vendas=Sum('numero_vendas')
+        )['total_vendas'] or 0
 
     class Meta:
         verbose_name = 'Conta'
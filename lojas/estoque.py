@@ -0,0 +1,704 @@
+"""
+Alterações do estoque das lojas (EstoqueLoja e EstoqueRecarga).
+
+Baixas e reposições são um único UPDATE com F(): o banco aplica a conta
+sobre o valor atual da linha, sem ler, verificar e regravar em Python.
+A baixa só acontece se houver saldo (WHERE quantidade >= n), por isso
+dois vendedores simultâneos nunca vendem as mesmas unidades.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.utils import timezone
+
+
+class EstoqueInsuficiente(ValueError):
+    """Baixa recusada por falta de saldo"""
+    def __init__(self, disponivel, requerido):
+        self.disponivel = disponivel
+        self.requerido = requerido
+        super().__init__(f"Estoque insuficiente. Disponível: {disponivel}, Requerido: {requerido}")
+
+
+class BaixaRecusada(ValueError):
+    """Operação de estoque recusada; `erros` lista os motivos (um por item)"""
+    def __init__(self, erros):
+        self.erros = erros
+        super().__init__('; '.join(erros))
+
+
+class TransferenciaRecusada(BaixaRecusada):
+    """Transferência entre lojas recusada"""
+
+
+class VendaRecusada(BaixaRecusada):
+    """Venda de carrinho recusada"""
+
+
+def campo_do_item(modelo):
+    """Nome do campo do item ('produto_id' ou 'recarga_id') no modelo de estoque"""
+    from .models import EstoqueLoja
+    return 'produto_id' if modelo is EstoqueLoja else 'recarga_id'
+
+
+def _alterar_estoque(estoque, variacao, condicao=None):
+    """
+    Soma `variacao` à quantidade do estoque num UPDATE condicional e
+    atualiza estoque.quantidade. Retorna False se a condição falhou.
+    """
+    modelo = type(estoque)
+    alteracoes = {'quantidade': F('quantidade') + variacao}
+    if any(campo.name == 'atualizado_em' for campo in modelo._meta.fields):
+        alteracoes['atualizado_em'] = timezone.now()
+
+    with transaction.atomic():
+        alteradas = modelo.objects.filter(pk=estoque.pk, **(condicao or {})).update(**alteracoes)
+        # Após o UPDATE a linha fica bloqueada até o fim da transação
+        estoque.quantidade = modelo.objects.filter(pk=estoque.pk).values_list('quantidade', flat=True).first() or 0
+    return bool(alteradas)
+
+
+def baixar_estoque(estoque, quantidade):
+    """
+    Retira `quantidade` unidades do estoque se houver saldo; caso contrário
+    levanta EstoqueInsuficiente. Retorna a quantidade anterior à baixa.
+    """
+    if not _alterar_estoque(estoque, -quantidade, {'quantidade__gte': quantidade}):
+        raise EstoqueInsuficiente(estoque.quantidade, quantidade)
+    return estoque.quantidade + quantidade
+
+
+def repor_estoque(estoque, quantidade):
+    """Acrescenta `quantidade` unidades ao estoque. Retorna a quantidade anterior"""
+    _alterar_estoque(estoque, quantidade)
+    return estoque.quantidade - quantidade
+
+
+def efetuar_venda(estoque, quantidade, vendedor, observacao=''):
+    """
+    Baixa o estoque e grava a Venda e o MovimentoEstoque de saída numa
+    única transação: ou tudo é gravado, ou nada. Retorna a venda.
+    """
+    from balanco.models import MovimentoEstoque
+    from .models import EstoqueLoja, Venda
+
+    e_produto = isinstance(estoque, EstoqueLoja)
+    item = estoque.produto if e_produto else estoque.recarga
+
+    with transaction.atomic():
+        # O UPDATE vem primeiro: a transação já começa com o bloqueio de escrita
+        quantidade_anterior = baixar_estoque(estoque, quantidade)
+
+        venda = Venda(
+            item_type='produto' if e_produto else 'recarga',
+            quantidade=quantidade,
+            valor_total=quantidade * item.preco,
+            vendedor=vendedor,
+            observacao=observacao
+        )
+        if e_produto:
+            venda.estoque_loja = estoque
+        else:
+            venda.estoque_recarga = estoque
+        venda.save()
+
+        MovimentoEstoque.objects.create(
+            # A referência deriva da venda, única por construção
+            referencia=f"SAI-V{venda.id}",
+            tipo_movimento='saida',
+            loja_id=estoque.loja_id,
+            produto=item if e_produto else None,
+            recarga=None if e_produto else item,
+            quantidade_anterior=quantidade_anterior,
+            quantidade_movimento=quantidade,
+            quantidade_atual=estoque.quantidade,
+            preco_venda_unitario=item.preco,
+            motivo_tipo='venda',
+            motivo_detalhado=observacao,
+            venda=venda,
+            criado_por=vendedor
+        )
+
+    return venda
+
+
+def repor_em_lote(modelo, recebido):
+    """
+    Soma as quantidades recebidas {(loja_id, item_id): n} aos estoques do
+    modelo (EstoqueLoja ou EstoqueRecarga), criando os que faltam: um
+    bulk_create e um bulk_update de F('quantidade') + n. Deve ser chamada
+    dentro de uma transação. Retorna {(loja_id, item_id): quantidade final}.
+    """
+    from .models import EstoqueRecarga
+
+    if not recebido:
+        return {}
+    campo_item = campo_do_item(modelo)
+    filtro = {
+        'loja_id__in': {loja_id for loja_id, _ in recebido},
+        f'{campo_item}__in': {item_id for _, item_id in recebido},
+    }
+
+    existentes = set(modelo.objects.filter(**filtro).values_list('loja_id', campo_item))
+    modelo.objects.bulk_create([
+        modelo(loja_id=loja_id, quantidade=0, **{campo_item: item_id})
+        for loja_id, item_id in recebido if (loja_id, item_id) not in existentes
+    ], ignore_conflicts=True)
+
+    estoques = [
+        estoque for estoque in modelo.objects.filter(**filtro).only('id', 'loja_id', campo_item)
+        if (estoque.loja_id, getattr(estoque, campo_item)) in recebido
+    ]
+    campos = ['quantidade']
+    if modelo is EstoqueRecarga:
+        campos.append('atualizado_em')
+    agora = timezone.now()
+    for estoque in estoques:
+        estoque.quantidade = F('quantidade') + recebido[(estoque.loja_id, getattr(estoque, campo_item))]
+        estoque.atualizado_em = agora
+    modelo.objects.bulk_update(estoques, campos, batch_size=500)
+
+    # Lidas após o UPDATE, com as linhas já bloqueadas pela transação
+    return {
+        (loja_id, item_id): quantidade
+        for loja_id, item_id, quantidade in modelo.objects.filter(
+            id__in=[estoque.id for estoque in estoques]
+        ).values_list('loja_id', campo_item, 'quantidade')
+    }
+
+
+def baixar_em_lote(modelo, loja_id, retirado):
+    """
+    Retira de uma loja as quantidades {item_id: n} num único UPDATE
+    condicional (quantidade >= n em todas as linhas). Se algum item não
+    tiver saldo nada é retirado e levanta BaixaRecusada. Deve ser chamada
+    dentro de uma transação. Retorna {item_id: quantidade final}.
+    """
+    if not retirado:
+        return {}
+    campo_item = campo_do_item(modelo)
+    por_item = Case(
+        *[When(**{campo_item: item_id}, then=Value(quantidade)) for item_id, quantidade in retirado.items()],
+        output_field=IntegerField()
+    )
+
+    alteradas = modelo.objects.filter(
+        loja_id=loja_id,
+        quantidade__gte=por_item,
+        **{f'{campo_item}__in': list(retirado)}
+    ).update(quantidade=F('quantidade') - por_item)
+    if alteradas != len(retirado):
+        # A exceção desfaz, com a transação, as linhas que chegaram a ser baixadas
+        raise BaixaRecusada(['Estoque insuficiente'])
+
+    return dict(modelo.objects.filter(
+        loja_id=loja_id, **{f'{campo_item}__in': list(retirado)}
+    ).values_list(campo_item, 'quantidade'))
+
+
+def faltas_de_estoque(modelo, loja_id, retirado):
+    """Itens de {item_id: n} sem saldo suficiente na loja: [(item_id, disponível, requerido)]"""
+    campo_item = campo_do_item(modelo)
+    disponiveis = dict(modelo.objects.filter(
+        loja_id=loja_id, **{f'{campo_item}__in': list(retirado)}
+    ).values_list(campo_item, 'quantidade'))
+    return [
+        (item_id, disponiveis.get(item_id, 0), quantidade)
+        for item_id, quantidade in retirado.items()
+        if disponiveis.get(item_id, 0) < quantidade
+    ]
+
+
+def transferir_estoque(origem, destino, itens, criado_por=None, motivo=''):
+    """
+    Move itens de uma loja para outra numa única transação.
+
+    itens: [(item_type, item_id, quantidade)]; itens repetidos são somados.
+    Por tipo de item são 2 escritas em lote (baixa condicional na origem e
+    reposição no destino) e os movimentos de saída e entrada, em pares com
+    o mesmo documento de referência, num único bulk_create. Se algum item
+    não tiver saldo na origem nada é movido e levanta TransferenciaRecusada.
+    Retorna o código da transferência (documento de referência).
+    """
+    from balanco.models import MovimentoEstoque
+    from balanco.referencias import reservar_referencias
+    from produtos.models import Produto, Recarga
+    from .models import EstoqueLoja, EstoqueRecarga
+
+    if origem.id == destino.id:
+        raise TransferenciaRecusada(['A loja de origem e a de destino devem ser diferentes'])
+
+    pedidos = {'produto': {}, 'recarga': {}}
+    erros = []
+    for item_type, item_id, quantidade in itens:
+        if item_type not in pedidos:
+            erros.append(f"Tipo de item inválido: {item_type}")
+        elif quantidade <= 0:
+            erros.append(f"{item_type.capitalize()} {item_id}: quantidade deve ser maior que zero")
+        else:
+            pedidos[item_type][item_id] = pedidos[item_type].get(item_id, 0) + quantidade
+    if not erros and not any(pedidos.values()):
+        erros.append('Nenhum item a transferir')
+    if erros:
+        raise TransferenciaRecusada(erros)
+
+    tipos = [
+        ('produto', EstoqueLoja, Produto),
+        ('recarga', EstoqueRecarga, Recarga),
+    ]
+    agora = timezone.now()
+    # Código da sequência geral de transferências (as linhas usam a sequência de cada loja)
+    codigo = reservar_referencias('TRF')[0]
+    try:
+        with transaction.atomic():
+            movimentos = []
+            for item_type, modelo, modelo_item in tipos:
+                retirado = pedidos[item_type]
+                if not retirado:
+                    continue
+                # A baixa vem primeiro: a transação começa já com o bloqueio de escrita
+                finais_origem = baixar_em_lote(modelo, origem.id, retirado)
+                finais_destino = repor_em_lote(modelo, {(destino.id, item_id): n for item_id, n in retirado.items()})
+                precos = dict(modelo_item.objects.filter(id__in=list(retirado)).values_list('id', 'preco'))
+                referencias = zip(
+                    reservar_referencias('TRF', len(retirado), origem.id),
+                    reservar_referencias('TRF', len(retirado), destino.id)
+                )
+
+                for (item_id, quantidade), (referencia_saida, referencia_entrada) in zip(retirado.items(), referencias):
+                    item = {f'{item_type}_id': item_id}
+                    comum = {
+                        'tipo_movimento': 'transferencia',
+                        'quantidade_movimento': quantidade,
+                        'preco_venda_unitario': precos[item_id],
+                        'motivo_detalhado': motivo,
+                        'documento_referencia': codigo,
+                        'criado_por': criado_por,
+                        'data_documento': timezone.localdate(agora),
+                    }
+                    movimentos.append(MovimentoEstoque(
+                        referencia=referencia_saida,
+                        loja_id=origem.id,
+                        quantidade_anterior=finais_origem[item_id] + quantidade,
+                        quantidade_atual=finais_origem[item_id],
+                        motivo_tipo='transferencia_saida',
+                        **item, **comum
+                    ))
+                    movimentos.append(MovimentoEstoque(
+                        referencia=referencia_entrada,
+                        loja_id=destino.id,
+                        quantidade_anterior=finais_destino[(destino.id, item_id)] - quantidade,
+                        quantidade_atual=finais_destino[(destino.id, item_id)],
+                        motivo_tipo='transferencia_entrada',
+                        **item, **comum
+                    ))
+            MovimentoEstoque.objects.bulk_create(movimentos, batch_size=500)
+    except BaixaRecusada:
+        # Depois do rollback: identifica os itens sem saldo para a mensagem
+        faltas = []
+        for item_type, modelo, _ in tipos:
+            for item_id, disponivel, requerido in faltas_de_estoque(modelo, origem.id, pedidos[item_type]):
+                faltas.append(
+                    f"{item_type.capitalize()} {item_id}: estoque insuficiente em {origem.nome} "
+                    f"(disponível {disponivel}, requerido {requerido})"
+                )
+        raise TransferenciaRecusada(faltas or ['Estoque insuficiente na loja de origem'])
+
+    return codigo
+
+
+def _item_da_venda(venda):
+    """(item_type, item_id) de uma venda montada com o estoque em memória"""
+    if venda.item_type == 'produto':
+        return 'produto', venda.estoque_loja.produto_id
+    return 'recarga', venda.estoque_recarga.recarga_id
+
+
+def _gravar_vendas(vendas, finais, precos, documento=''):
+    """
+    Grava vendas cujo estoque já foi baixado: bulk_create das vendas, um
+    único vendas_alteradas (resumo diário e balanços) e os movimentos de
+    saída SAI-V<id>, encadeando o saldo das vendas de um mesmo item.
+    finais e precos: {(item_type, item_id): valor}. Deve ser chamada
+    dentro da transação da baixa.
+    """
+    from balanco.models import MovimentoEstoque
+    from .models import Venda
+    from .signals import vendas_alteradas
+
+    Venda.objects.bulk_create(vendas)
+    # bulk_create não envia post_save: resumo diário e balanços são atualizados aqui, de uma vez
+    vendas_alteradas.send(sender=Venda, vendas=vendas, sinal=1)
+
+    # Cada venda parte do saldo deixado pela anterior do mesmo item
+    saldo = dict(finais)
+    for venda in vendas:
+        saldo[_item_da_venda(venda)] += venda.quantidade
+
+    movimentos = []
+    for venda in vendas:
+        item_type, item_id = chave = _item_da_venda(venda)
+        anterior = saldo[chave]
+        saldo[chave] -= venda.quantidade
+        movimentos.append(MovimentoEstoque(
+            referencia=f"SAI-V{venda.id}",
+            tipo_movimento='saida',
+            loja_id=venda.loja_id,
+            produto_id=item_id if item_type == 'produto' else None,
+            recarga_id=item_id if item_type == 'recarga' else None,
+            quantidade_anterior=anterior,
+            quantidade_movimento=venda.quantidade,
+            quantidade_atual=saldo[chave],
+            preco_venda_unitario=precos[chave],
+            motivo_tipo='venda',
+            motivo_detalhado=venda.observacao,
+            documento_referencia=documento,
+            venda=venda,
+            criado_por_id=venda.vendedor_id
+        ))
+    MovimentoEstoque.objects.bulk_create(movimentos, batch_size=500)
+
+
+def finalizar_carrinho(loja, linhas, vendedor, observacao=''):
+    """
+    Vende os itens de um carrinho numa única transação, sob um recibo comum.
+
+    linhas: [(item_type, estoque_id, quantidade)] da loja; linhas repetidas
+    são somadas. Por tipo de item há uma baixa condicional em lote; vendas
+    e movimentos de saída são gravados com bulk_create e o resumo diário é
+    atualizado uma vez para o carrinho inteiro. Se algum item não tiver
+    saldo nada é vendido e levanta VendaRecusada.
+    Retorna {'recibo', 'vendas', 'itens', 'unidades', 'valor_total'}.
+    """
+    from balanco.referencias import reservar_referencias
+    from .models import EstoqueLoja, EstoqueRecarga, Venda
+
+    tipos = [
+        ('produto', EstoqueLoja, 'estoque_loja'),
+        ('recarga', EstoqueRecarga, 'estoque_recarga'),
+    ]
+
+    pedidos = {'produto': {}, 'recarga': {}}
+    erros = []
+    for item_type, estoque_id, quantidade in linhas:
+        if item_type not in pedidos:
+            erros.append(f"Tipo de item inválido: {item_type}")
+        elif quantidade <= 0:
+            erros.append(f"{item_type.capitalize()} (estoque {estoque_id}): quantidade deve ser maior que zero")
+        else:
+            pedidos[item_type][estoque_id] = pedidos[item_type].get(estoque_id, 0) + quantidade
+    if not erros and not any(pedidos.values()):
+        erros.append('O carrinho está vazio')
+    if erros:
+        raise VendaRecusada(erros)
+
+    # Item, nome e preço de cada estoque do carrinho (1 consulta por tipo)
+    estoques = {}
+    for item_type, modelo, _ in tipos:
+        if not pedidos[item_type]:
+            continue
+        campo_item = campo_do_item(modelo)
+        item = campo_item[:-len('_id')]
+        for estoque_id, item_id, nome, preco in modelo.objects.filter(
+            loja_id=loja.id, id__in=list(pedidos[item_type])
+        ).values_list('id', campo_item, f'{item}__nome', f'{item}__preco'):
+            estoques[(item_type, estoque_id)] = {'item_id': item_id, 'nome': nome, 'preco': preco}
+        erros.extend(
+            f"{item_type.capitalize()} (estoque {estoque_id}): não encontrado em {loja.nome}"
+            for estoque_id in pedidos[item_type] if (item_type, estoque_id) not in estoques
+        )
+    if erros:
+        raise VendaRecusada(erros)
+
+    agora = timezone.now()
+    recibo = reservar_referencias('VND', 1, loja.id)[0]
+    try:
+        with transaction.atomic():
+            vendas = []
+            finais = {}
+            for item_type, modelo, campo_estoque in tipos:
+                if not pedidos[item_type]:
+                    continue
+                campo_item = campo_do_item(modelo)
+                # A baixa vem primeiro: a transação começa já com o bloqueio de escrita
+                baixados = baixar_em_lote(modelo, loja.id, {
+                    estoques[(item_type, estoque_id)]['item_id']: quantidade
+                    for estoque_id, quantidade in pedidos[item_type].items()
+                })
+                finais.update({(item_type, item_id): final for item_id, final in baixados.items()})
+
+                for estoque_id, quantidade in pedidos[item_type].items():
+                    estoque = estoques[(item_type, estoque_id)]
+                    venda = Venda(
+                        item_type=item_type,
+                        quantidade=quantidade,
+                        valor_total=quantidade * estoque['preco'],
+                        vendedor=vendedor,
+                        observacao=observacao,
+                        recibo=recibo,
+                        # bulk_create não chama Venda.save: loja e dia são preenchidos aqui
+                        loja_id=loja.id,
+                        data_venda=agora,
+                        dia_venda=timezone.localdate(agora),
+                    )
+                    # Estoque só com as chaves: o resumo diário lê loja e item sem consultar
+                    setattr(venda, campo_estoque, modelo(id=estoque_id, loja_id=loja.id, **{campo_item: estoque['item_id']}))
+                    vendas.append(venda)
+
+            precos = {
+                (item_type, estoque['item_id']): estoque['preco']
+                for (item_type, _), estoque in estoques.items()
+            }
+            _gravar_vendas(vendas, finais, precos, documento=recibo)
+    except BaixaRecusada:
+        # Depois do rollback: identifica os itens sem saldo para a mensagem
+        faltas = []
+        for item_type, modelo, _ in tipos:
+            nomes = {estoque['item_id']: estoque['nome'] for (tipo, _), estoque in estoques.items() if tipo == item_type}
+            retirado = {
+                estoques[(item_type, estoque_id)]['item_id']: quantidade
+                for estoque_id, quantidade in pedidos[item_type].items()
+            }
+            for item_id, disponivel, requerido in faltas_de_estoque(modelo, loja.id, retirado):
+                faltas.append(f"{nomes[item_id]}: estoque insuficiente (disponível {disponivel}, requerido {requerido})")
+        raise VendaRecusada(faltas or ['Estoque insuficiente'])
+
+    return {
+        'recibo': recibo,
+        'vendas': vendas,
+        'itens': len(vendas),
+        'unidades': sum(venda.quantidade for venda in vendas),
+        'valor_total': sum((venda.valor_total for venda in vendas), Decimal('0.00')),
+    }
+
+
+def _validar_venda_offline(linha, agora):
+    """(venda normalizada, erros) de uma linha enviada por sincronizar_vendas"""
+    from django.utils.dateparse import parse_datetime
+
+    erros = []
+    chave = linha.get('chave')
+    if not isinstance(chave, str) or not chave.strip() or len(chave) > 64:
+        erros.append('chave deve ser um texto de 1 a 64 caracteres')
+    item_type = str(linha.get('item_type') or 'produto').lower().strip()
+    if item_type not in ('produto', 'recarga'):
+        erros.append(f'Tipo de item inválido: {item_type}')
+    estoque_id = linha.get('estoque_id')
+    quantidade = linha.get('quantidade')
+    if type(estoque_id) is not int or type(quantidade) is not int:
+        erros.append('estoque_id e quantidade devem ser inteiros')
+    elif quantidade <= 0:
+        erros.append('quantidade deve ser maior que zero')
+
+    data_venda = agora
+    if linha.get('data_venda'):
+        try:
+            data_venda = parse_datetime(str(linha['data_venda']))
+        except ValueError:
+            data_venda = None
+        if data_venda is None:
+            erros.append('data_venda inválida (use o formato ISO 8601)')
+        else:
+            if timezone.is_naive(data_venda):
+                data_venda = timezone.make_aware(data_venda)
+            if data_venda > agora:
+                erros.append('data_venda no futuro')
+
+    return {
+        'chave': chave.strip() if isinstance(chave, str) else chave,
+        'item_type': item_type,
+        'estoque_id': estoque_id,
+        'quantidade': quantidade,
+        'data_venda': data_venda,
+        'observacao': str(linha.get('observacao') or ''),
+    }, erros
+
+
+def sincronizar_vendas(loja, linhas, vendedor):
+    """
+    Grava um lote de vendas registradas offline na loja, numa única transação.
+
+    linhas: dicts com chave (gerada pelo cliente, única por venda),
+    item_type, estoque_id, quantidade e, opcionais, data_venda (ISO 8601)
+    e observacao. Vendas cuja chave já foi gravada não são repetidas: o
+    lote pode ser reenviado inteiro depois de uma falha de conexão. As
+    linhas são independentes — uma linha inválida ou sem saldo é recusada
+    sem impedir as demais; o saldo é consumido por ordem de data_venda.
+
+    Uma chave já usada por venda de outra loja é recusada como conflito.
+
+    Retorna um resultado por linha, na ordem recebida:
+    {'chave', 'status' ('criada', 'duplicada' ou 'recusada'), 'venda_id', 'erro'}.
+    """
+    from .models import EstoqueLoja, EstoqueRecarga, Venda
+
+    tipos = {
+        'produto': (EstoqueLoja, 'estoque_loja'),
+        'recarga': (EstoqueRecarga, 'estoque_recarga'),
+    }
+
+    agora = timezone.now()
+    resultados = []
+    pendentes = []
+    chaves = set()
+    for linha in linhas:
+        venda, erros = _validar_venda_offline(linha, agora)
+        resultado = {'chave': venda['chave'], 'status': 'recusada', 'venda_id': None, 'erro': '; '.join(erros)}
+        resultados.append(resultado)
+        if erros:
+            continue
+        if venda['chave'] in chaves:
+            resultado.update(status='duplicada', erro='chave repetida no lote')
+            continue
+        chaves.add(venda['chave'])
+        pendentes.append((venda, resultado))
+    if not pendentes:
+        return resultados
+
+    pedidos = {'produto': set(), 'recarga': set()}
+    for venda, _ in pendentes:
+        pedidos[venda['item_type']].add(venda['estoque_id'])
+
+    with transaction.atomic():
+        # Bloqueia os estoques do lote antes de ler chaves e saldos: um envio
+        # concorrente do mesmo lote espera este terminar e vê as vendas gravadas
+        for item_type, (modelo, _) in tipos.items():
+            if pedidos[item_type]:
+                modelo.objects.filter(loja_id=loja.id, id__in=pedidos[item_type]).update(quantidade=F('quantidade'))
+
+        existentes = {
+            chave: (venda_id, loja_id)
+            for chave, venda_id, loja_id in Venda.objects.filter(
+                chave_idempotencia__in=chaves
+            ).values_list('chave_idempotencia', 'id', 'loja_id')
+        }
+
+        # Item, nome, preço e saldo de cada estoque do lote (1 consulta por tipo)
+        estoques = {}
+        for item_type, (modelo, _) in tipos.items():
+            if not pedidos[item_type]:
+                continue
+            campo_item = campo_do_item(modelo)
+            item = campo_item[:-len('_id')]
+            for estoque_id, item_id, nome, preco, quantidade in modelo.objects.filter(
+                loja_id=loja.id, id__in=pedidos[item_type]
+            ).values_list('id', campo_item, f'{item}__nome', f'{item}__preco', 'quantidade'):
+                estoques[(item_type, estoque_id)] = {
+                    'item_id': item_id, 'nome': nome, 'preco': preco, 'saldo': quantidade
+                }
+
+        aceitas = []
+        for venda, resultado in sorted(pendentes, key=lambda pendente: pendente[0]['data_venda']):
+            estoque = estoques.get((venda['item_type'], venda['estoque_id']))
+            if venda['chave'] in existentes:
+                venda_id, loja_da_venda = existentes[venda['chave']]
+                if loja_da_venda == loja.id:
+                    resultado.update(status='duplicada', venda_id=venda_id)
+                else:
+                    # Chave já usada noutra loja: erro do cliente, sem revelar a venda alheia
+                    resultado['erro'] = 'chave já usada por uma venda de outra loja'
+            elif estoque is None:
+                resultado['erro'] = f"{venda['item_type'].capitalize()} (estoque {venda['estoque_id']}): não encontrado em {loja.nome}"
+            elif venda['quantidade'] > estoque['saldo']:
+                resultado['erro'] = (
+                    f"{estoque['nome']}: estoque insuficiente "
+                    f"(disponível {estoque['saldo']}, requerido {venda['quantidade']})"
+                )
+            else:
+                estoque['saldo'] -= venda['quantidade']
+                aceitas.append((venda, resultado))
+        if not aceitas:
+            return resultados
+
+        finais = {}
+        for item_type, (modelo, _) in tipos.items():
+            retirado = {}
+            for venda, _ in aceitas:
+                if venda['item_type'] == item_type:
+                    item_id = estoques[(item_type, venda['estoque_id'])]['item_id']
+                    retirado[item_id] = retirado.get(item_id, 0) + venda['quantidade']
+            if retirado:
+                # Os estoques estão bloqueados e o saldo foi conferido: a baixa não é recusada
+                baixados = baixar_em_lote(modelo, loja.id, retirado)
+                finais.update({(item_type, item_id): final for item_id, final in baixados.items()})
+
+        vendas = []
+        for dados, _ in aceitas:
+            modelo, campo_estoque = tipos[dados['item_type']]
+            estoque = estoques[(dados['item_type'], dados['estoque_id'])]
+            venda = Venda(
+                item_type=dados['item_type'],
+                quantidade=dados['quantidade'],
+                valor_total=dados['quantidade'] * estoque['preco'],
+                vendedor=vendedor,
+                observacao=dados['observacao'],
+                chave_idempotencia=dados['chave'],
+                loja_id=loja.id,
+                data_venda=dados['data_venda'],
+                dia_venda=timezone.localdate(dados['data_venda']),
+            )
+            setattr(venda, campo_estoque, modelo(
+                id=dados['estoque_id'], loja_id=loja.id, **{campo_do_item(modelo): estoque['item_id']}
+            ))
+            vendas.append(venda)
+
+        precos = {
+            (item_type, estoque['item_id']): estoque['preco']
+            for (item_type, _), estoque in estoques.items()
+        }
+        _gravar_vendas(vendas, finais, precos)
+
+    for venda, (_, resultado) in zip(vendas, aceitas):
+        resultado.update(status='criada', venda_id=venda.id)
+    return resultados
+
+
+def alertas_de_estoque(lojas=None, status='', item_type='', limite=50):
+    """
+    Estoques baixos e esgotados da rede (ou das `lojas` dadas), dos mais
+    críticos aos menos: esgotados primeiro, depois por quantidade.
+
+    Cada consulta percorre só os índices parciais da coluna status e para
+    em `limite` linhas, sem depender do tamanho do catálogo. Retorna
+    (itens, contagem por tipo e status).
+    """
+    from .models import EstoqueLoja, EstoqueRecarga
+
+    tipos = [
+        ('produto', EstoqueLoja, 'produto'),
+        ('recarga', EstoqueRecarga, 'recarga'),
+    ]
+    status_pedidos = [status] if status else ['esgotado', 'baixo']
+
+    itens = []
+    contagem = {}
+    for tipo, modelo, campo_item in tipos:
+        if item_type and tipo != item_type:
+            continue
+        alertas = modelo.objects.em_alerta()
+        if lojas is not None:
+            alertas = alertas.filter(loja__in=lojas)
+
+        contagem[tipo] = {'baixo': 0, 'esgotado': 0}
+        contagem[tipo].update(alertas.values_list('status').annotate(total=Count('id')).order_by())
+
+        for status_pedido in status_pedidos:
+            linhas = alertas.filter(status=status_pedido).order_by('quantidade', 'id').values(
+                'id', 'loja_id', 'loja__nome', f'{campo_item}_id', f'{campo_item}__nome',
+                'quantidade', 'estoque_minimo', 'status'
+            )[:limite]
+            itens.extend({
+                'estoque_id': linha['id'],
+                'item_type': tipo,
+                'item_id': linha[f'{campo_item}_id'],
+                'item_nome': linha[f'{campo_item}__nome'],
+                'loja_id': linha['loja_id'],
+                'loja_nome': linha['loja__nome'],
+                'quantidade': linha['quantidade'],
+                'estoque_minimo': linha['estoque_minimo'],
+                'status': linha['status'],
+            } for linha in linhas)
+
+    itens.sort(key=lambda item: (item['status'] != 'esgotado', item['quantidade']))
+    return itens[:limite], contagem
@@ -0,0 +1,380 @@
+"""
+Entrada de estoque em lote a partir de uma planilha CSV ou XLSX.
+
+Colunas (cabeçalho na primeira linha, sem distinguir maiúsculas/acentos):
+    loja            ID ou nome da loja
+    tipo            produto ou recarga (opcional: padrão produto, ou o
+                    indicado pelo código do item)
+    item            código da exportação de estoque (PROD0001, REC0001),
+                    ID ou nome do item; aceita também as colunas
+                    "produto" ou "recarga"
+    quantidade      unidades recebidas (inteiro > 0)
+    custo_unitario  opcional, padrão 0
+
+Todas as linhas são validadas em memória antes de qualquer escrita. Se
+alguma tiver erro nada é gravado e o relatório lista os erros por linha;
+caso contrário estoques e movimentos são gravados numa única transação
+com bulk_create/bulk_update, em vez de um get_or_create/save por item.
+
+O mesmo leitor atende aos planos de transferência entre lojas (colunas
+origem, destino, tipo, item e quantidade; ver validar_plano_transferencias).
+"""
+import csv
+import io
+import unicodedata
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+COLUNAS = {
+    'loja': 'loja',
+    'tipo': 'tipo',
+    'item': 'item',
+    'codigo': 'item',
+    'produto': 'item',
+    'recarga': 'item',
+    'quantidade': 'quantidade',
+    'qtd': 'quantidade',
+    'custo_unitario': 'custo_unitario',
+    'custo': 'custo_unitario',
+}
+
+COLUNAS_OBRIGATORIAS = ['loja', 'item', 'quantidade']
+
+# Plano de transferências entre lojas (comando transferir_estoque)
+COLUNAS_PLANO = {
+    'origem': 'origem',
+    'loja_origem': 'origem',
+    'destino': 'destino',
+    'loja_destino': 'destino',
+    'tipo': 'tipo',
+    'item': 'item',
+    'codigo': 'item',
+    'produto': 'item',
+    'recarga': 'item',
+    'quantidade': 'quantidade',
+    'qtd': 'quantidade',
+}
+
+COLUNAS_PLANO_OBRIGATORIAS = ['origem', 'destino', 'item', 'quantidade']
+
+PREFIXOS_CODIGO = [('PROD', 'produto'), ('REC', 'recarga')]
+
+
+class ErroImportacao(Exception):
+    """Arquivo ilegível ou sem as colunas obrigatórias"""
+    pass
+
+
+def normalizar(texto):
+    """Minúsculas, sem acentos e com espaços trocados por '_'"""
+    texto = unicodedata.normalize('NFKD', str(texto or '').strip().lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c)).replace(' ', '_')
+
+
+def ler_planilha(arquivo, nome_arquivo, colunas_aceitas=COLUNAS, obrigatorias=COLUNAS_OBRIGATORIAS):
+    """
+    Lê o CSV ou XLSX e retorna [(número da linha, {coluna: valor})],
+    com as colunas já mapeadas para os nomes de `colunas_aceitas`.
+    """
+    if nome_arquivo.lower().endswith('.xlsx'):
+        try:
+            import openpyxl
+        except ImportError:
+            raise ErroImportacao('Importação de XLSX indisponível: instale o pacote openpyxl ou envie um CSV.')
+        try:
+            planilha = openpyxl.load_workbook(arquivo, read_only=True, data_only=True).worksheets[0]
+        except Exception as e:
+            raise ErroImportacao(f'Não foi possível ler o arquivo XLSX: {e}')
+        linhas = planilha.iter_rows(values_only=True)
+    elif nome_arquivo.lower().endswith('.csv'):
+        conteudo = arquivo.read()
+        if isinstance(conteudo, bytes):
+            try:
+                conteudo = conteudo.decode('utf-8-sig')
+            except UnicodeDecodeError:
+                conteudo = conteudo.decode('latin-1')
+        try:
+            dialeto = csv.Sniffer().sniff(conteudo[:4096], delimiters=',;\t')
+        except csv.Error:
+            dialeto = csv.excel
+        linhas = csv.reader(io.StringIO(conteudo), dialeto)
+    else:
+        raise ErroImportacao('Formato não suportado. Envie um arquivo .csv ou .xlsx.')
+
+    cabecalho = next(linhas, None)
+    if not cabecalho:
+        raise ErroImportacao('O arquivo está vazio.')
+
+    colunas = []
+    tipo_da_coluna = None
+    for nome in cabecalho:
+        nome = normalizar(nome)
+        colunas.append(colunas_aceitas.get(nome))
+        if nome in ('produto', 'recarga'):
+            tipo_da_coluna = nome
+
+    faltando = [coluna for coluna in obrigatorias if coluna not in colunas]
+    if faltando:
+        raise ErroImportacao(f"Colunas obrigatórias ausentes: {', '.join(faltando)}")
+
+    resultado = []
+    for numero, valores in enumerate(linhas, start=2):
+        linha = {}
+        for coluna, valor in zip(colunas, valores):
+            if coluna and valor is not None and str(valor).strip() != '':
+                linha[coluna] = str(valor).strip() if not isinstance(valor, (int, float)) else valor
+        if not linha:
+            continue
+        if tipo_da_coluna and 'tipo' not in linha:
+            linha['tipo'] = tipo_da_coluna
+        resultado.append((numero, linha))
+    return resultado
+
+
+class Catalogo:
+    """Lojas, produtos e recargas em memória, procurados por ID, código ou nome"""
+
+    def __init__(self, lojas):
+        from produtos.models import Produto, Recarga
+
+        self.lojas = self._indexar(lojas)
+        self.itens = {
+            'produto': self._indexar(Produto.objects.all()),
+            'recarga': self._indexar(Recarga.objects.all()),
+        }
+
+    def _indexar(self, objetos):
+        por_id, por_nome = {}, {}
+        for objeto in objetos:
+            por_id[objeto.id] = objeto
+            por_nome.setdefault(normalizar(objeto.nome), objeto)
+        return por_id, por_nome
+
+    def _procurar(self, indice, valor):
+        por_id, por_nome = indice
+        texto = str(valor).strip()
+        if texto.isdigit() or isinstance(valor, (int, float)):
+            try:
+                return por_id.get(int(float(texto)))
+            except ValueError:
+                return None
+        return por_nome.get(normalizar(texto))
+
+    def loja(self, valor):
+        return self._procurar(self.lojas, valor)
+
+    def item(self, tipo, valor):
+        texto = str(valor).strip().upper()
+        for prefixo, tipo_codigo in PREFIXOS_CODIGO:
+            if texto.startswith(prefixo) and texto[len(prefixo):].isdigit():
+                if tipo_codigo != tipo:
+                    return None
+                return self.itens[tipo][0].get(int(texto[len(prefixo):]))
+        return self._procurar(self.itens[tipo], valor)
+
+
+def tipo_do_item(linha):
+    """Tipo informado na linha, ou o indicado pelo prefixo do código"""
+    if 'tipo' in linha:
+        return normalizar(linha['tipo']).rstrip('s')
+    codigo = str(linha.get('item', '')).strip().upper()
+    for prefixo, tipo in PREFIXOS_CODIGO:
+        if codigo.startswith(prefixo) and codigo[len(prefixo):].isdigit():
+            return tipo
+    return 'produto'
+
+
+def quantidade_da_linha(linha):
+    """Quantidade da linha como inteiro maior que zero, ou None se inválida"""
+    try:
+        quantidade = Decimal(str(linha.get('quantidade', '')))
+    except InvalidOperation:
+        return None
+    if quantidade <= 0 or quantidade != int(quantidade):
+        return None
+    return int(quantidade)
+
+
+def validar_linhas(linhas, lojas):
+    """
+    Valida as linhas contra as lojas permitidas e o catálogo.
+    Retorna (entradas válidas, erros) — erros: [{'linha', 'erros'}].
+    """
+    catalogo = Catalogo(lojas)
+    entradas, erros = [], []
+
+    for numero, linha in linhas:
+        problemas = []
+
+        loja = catalogo.loja(linha.get('loja', ''))
+        if loja is None:
+            problemas.append(f"Loja não encontrada ou sem permissão: {linha.get('loja', '')}")
+
+        tipo = tipo_do_item(linha)
+        item = None
+        if tipo not in ('produto', 'recarga'):
+            problemas.append(f"Tipo inválido: {linha['tipo']} (use produto ou recarga)")
+        else:
+            item = catalogo.item(tipo, linha.get('item', ''))
+            if item is None:
+                problemas.append(f"{tipo.capitalize()} não encontrado(a): {linha.get('item', '')}")
+
+        quantidade = quantidade_da_linha(linha)
+        if quantidade is None:
+            problemas.append(f"Quantidade inválida: {linha.get('quantidade', '')} (inteiro maior que zero)")
+
+        custo_unitario = Decimal('0.00')
+        if 'custo_unitario' in linha:
+            try:
+                custo_unitario = Decimal(str(linha['custo_unitario']).replace(',', '.')).quantize(Decimal('0.01'))
+                if custo_unitario < 0:
+                    raise InvalidOperation
+            except InvalidOperation:
+                problemas.append(f"Custo unitário inválido: {linha['custo_unitario']}")
+
+        if problemas:
+            erros.append({'linha': numero, 'erros': problemas})
+        else:
+            entradas.append({
+                'linha': numero,
+                'loja': loja,
+                'tipo': tipo,
+                'item': item,
+                'quantidade': quantidade,
+                'custo_unitario': custo_unitario,
+            })
+
+    return entradas, erros
+
+
+def aplicar_entradas(entradas, criado_por=None, documento=''):
+    """
+    Grava as entradas numa única transação: soma as quantidades aos
+    estoques em lote (ver lojas/estoque.py:repor_em_lote, sem sobrescrever
+    vendas simultâneas) e cria um MovimentoEstoque por linha.
+    Retorna o número de movimentos criados.
+    """
+    from balanco.models import MovimentoEstoque
+    from balanco.referencias import reservar_referencias
+    from .estoque import repor_em_lote
+    from .models import EstoqueLoja, EstoqueRecarga
+
+    agora = timezone.now()
+    with transaction.atomic():
+        for tipo, modelo in [('produto', EstoqueLoja), ('recarga', EstoqueRecarga)]:
+            do_tipo = [entrada for entrada in entradas if entrada['tipo'] == tipo]
+            if not do_tipo:
+                continue
+
+            recebido = {}
+            for entrada in do_tipo:
+                chave = (entrada['loja'].id, entrada['item'].id)
+                recebido[chave] = recebido.get(chave, 0) + entrada['quantidade']
+            finais = repor_em_lote(modelo, recebido)
+
+            # Cada linha parte do saldo deixado pela linha anterior do mesmo estoque
+            saldo = {chave: finais[chave] - recebido[chave] for chave in recebido}
+            for entrada in do_tipo:
+                chave = (entrada['loja'].id, entrada['item'].id)
+                entrada['quantidade_anterior'] = saldo[chave]
+                saldo[chave] += entrada['quantidade']
+                entrada['quantidade_atual'] = saldo[chave]
+
+        # Referências reservadas em bloco, um UPDATE por loja
+        por_loja = {}
+        for entrada in entradas:
+            por_loja.setdefault(entrada['loja'].id, []).append(entrada)
+        for loja_id, da_loja in por_loja.items():
+            for entrada, referencia in zip(da_loja, reservar_referencias('ENT', len(da_loja), loja_id)):
+                entrada['referencia'] = referencia
+
+        movimentos = MovimentoEstoque.objects.bulk_create([
+            MovimentoEstoque(
+                referencia=entrada['referencia'],
+                tipo_movimento='entrada',
+                loja=entrada['loja'],
+                produto=entrada['item'] if entrada['tipo'] == 'produto' else None,
+                recarga=entrada['item'] if entrada['tipo'] == 'recarga' else None,
+                quantidade_anterior=entrada['quantidade_anterior'],
+                quantidade_movimento=entrada['quantidade'],
+                quantidade_atual=entrada['quantidade_atual'],
+                custo_unitario=entrada['custo_unitario'],
+                custo_total=entrada['quantidade'] * entrada['custo_unitario'],
+                preco_venda_unitario=entrada['item'].preco,
+                motivo_tipo='compra',
+                motivo_detalhado=f"Importação em lote, linha {entrada['linha']}",
+                documento_referencia=documento[:100],
+                criado_por=criado_por,
+                data_documento=timezone.localdate(agora)
+            )
+            for entrada in entradas
+        ], batch_size=500)
+
+    return len(movimentos)
+
+
+def importar_entradas(arquivo, nome_arquivo, lojas, criado_por=None, aplicar=True):
+    """
+    Lê, valida e (se não houver erros e aplicar=True) grava a planilha.
+    Retorna o relatório: {'linhas', 'validas', 'erros', 'aplicado',
+    'movimentos', 'unidades'}. Levanta ErroImportacao para arquivos ilegíveis.
+    """
+    linhas = ler_planilha(arquivo, nome_arquivo)
+    entradas, erros = validar_linhas(linhas, lojas)
+
+    relatorio = {
+        'linhas': len(linhas),
+        'validas': len(entradas),
+        'erros': erros,
+        'aplicado': False,
+        'movimentos': 0,
+        'unidades': sum(entrada['quantidade'] for entrada in entradas),
+    }
+    if aplicar and entradas and not erros:
+        relatorio['movimentos'] = aplicar_entradas(entradas, criado_por=criado_por, documento=nome_arquivo)
+        relatorio['aplicado'] = True
+    return relatorio
+
+
+def validar_plano_transferencias(linhas, lojas):
+    """
+    Valida as linhas de um plano de transferências (origem, destino, tipo,
+    item, quantidade). Retorna ({(origem, destino): [(item_type, item_id,
+    quantidade)]}, erros) — os pares de lojas na ordem em que aparecem.
+    """
+    catalogo = Catalogo(lojas)
+    planos, erros = {}, []
+
+    for numero, linha in linhas:
+        problemas = []
+
+        origem = catalogo.loja(linha.get('origem', ''))
+        if origem is None:
+            problemas.append(f"Loja de origem não encontrada ou sem permissão: {linha.get('origem', '')}")
+        destino = catalogo.loja(linha.get('destino', ''))
+        if destino is None:
+            problemas.append(f"Loja de destino não encontrada ou sem permissão: {linha.get('destino', '')}")
+        if origem is not None and origem == destino:
+            problemas.append('A loja de origem e a de destino devem ser diferentes')
+
+        tipo = tipo_do_item(linha)
+        item = None
+        if tipo not in ('produto', 'recarga'):
+            problemas.append(f"Tipo inválido: {linha['tipo']} (use produto ou recarga)")
+        else:
+            item = catalogo.item(tipo, linha.get('item', ''))
+            if item is None:
+                problemas.append(f"{tipo.capitalize()} não encontrado(a): {linha.get('item', '')}")
+
+        quantidade = quantidade_da_linha(linha)
+        if quantidade is None:
+            problemas.append(f"Quantidade inválida: {linha.get('quantidade', '')} (inteiro maior que zero)")
+
+        if problemas:
+            erros.append({'linha': numero, 'erros': problemas})
+        else:
+            planos.setdefault((origem, destino), []).append((tipo, item.id, quantidade))
+
+    return planos, erros
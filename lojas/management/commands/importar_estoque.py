@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from lojas.importacao import importar_entradas, ErroImportacao
+from lojas.models import Loja
+
+
+class Command(BaseCommand):
+    help = 'Importa uma entrada de estoque em lote a partir de uma planilha CSV ou XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo .csv ou .xlsx')
+        parser.add_argument('--usuario', help='Username registrado como responsável pelos movimentos')
+        parser.add_argument('--validar', action='store_true',
+                            help='Apenas valida a planilha, sem gravar nada')
+
+    def handle(self, *args, **options):
+        criado_por = None
+        if options['usuario']:
+            try:
+                criado_por = get_user_model().objects.get(username=options['usuario'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Usuário não encontrado: {options['usuario']}")
+
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                relatorio = importar_entradas(
+                    arquivo, options['arquivo'], Loja.objects.all(),
+                    criado_por=criado_por,
+                    aplicar=not options['validar']
+                )
+        except OSError as e:
+            raise CommandError(f'Não foi possível abrir o arquivo: {e}')
+        except ErroImportacao as e:
+            raise CommandError(str(e))
+
+        for erro in relatorio['erros']:
+            self.stderr.write(f"Linha {erro['linha']}: {'; '.join(erro['erros'])}")
+
+        if relatorio['erros']:
+            raise CommandError(
+                f"{len(relatorio['erros'])} de {relatorio['linhas']} linha(s) com erro. Nenhuma entrada foi registrada."
+            )
+
+        if relatorio['aplicado']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{relatorio['movimentos']} entrada(s) registradas ({relatorio['unidades']} unidades)."
+            ))
+        else:
+            self.stdout.write(f"Planilha válida: {relatorio['validas']} linha(s), {relatorio['unidades']} unidades.")
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lojas.models import Loja, ResumoVendaDiaria
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o resumo diário de vendas (ResumoVendaDiaria) a partir das vendas registradas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loja', type=int, action='append', dest='lojas', help='ID da loja (pode repetir)')
+        parser.add_argument('--data-inicio', help='Data inicial (YYYY-MM-DD)')
+        parser.add_argument('--data-fim', help='Data final (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        lojas = None
+        if options['lojas']:
+            lojas = Loja.objects.filter(id__in=options['lojas'])
+            if lojas.count() != len(set(options['lojas'])):
+                raise CommandError('Uma ou mais lojas não foram encontradas.')
+
+        try:
+            data_inicio = self._data(options['data_inicio'])
+            data_fim = self._data(options['data_fim'])
+        except ValueError:
+            raise CommandError('Formato de data inválido. Use YYYY-MM-DD')
+
+        total = ResumoVendaDiaria.reconstruir(lojas=lojas, data_inicio=data_inicio, data_fim=data_fim)
+        self.stdout.write(self.style.SUCCESS(f'Resumo reconstruído: {total} linhas.'))
+
+    def _data(self, valor):
+        return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
@@ -0,0 +1,71 @@
+from contextlib import nullcontext
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from lojas.estoque import transferir_estoque, TransferenciaRecusada
+from lojas.importacao import (
+    ler_planilha, validar_plano_transferencias, ErroImportacao,
+    COLUNAS_PLANO, COLUNAS_PLANO_OBRIGATORIAS,
+)
+from lojas.models import Loja
+
+
+class Command(BaseCommand):
+    help = 'Executa um plano de transferências de estoque entre lojas (CSV ou XLSX)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plano', help='Arquivo .csv ou .xlsx com as colunas origem, destino, tipo, item, quantidade')
+        parser.add_argument('--usuario', help='Username registrado como responsável pelos movimentos')
+        parser.add_argument('--motivo', default='Redistribuição de estoque', help='Motivo registrado nos movimentos')
+        parser.add_argument('--validar', action='store_true', help='Apenas valida o plano, sem mover estoque')
+        parser.add_argument('--tudo-ou-nada', action='store_true',
+                            help='Desfaz o plano inteiro se alguma transferência for recusada '
+                                 '(por padrão cada par de lojas é independente)')
+
+    def handle(self, *args, **options):
+        criado_por = None
+        if options['usuario']:
+            try:
+                criado_por = get_user_model().objects.get(username=options['usuario'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Usuário não encontrado: {options['usuario']}")
+
+        try:
+            with open(options['plano'], 'rb') as arquivo:
+                linhas = ler_planilha(arquivo, options['plano'], COLUNAS_PLANO, COLUNAS_PLANO_OBRIGATORIAS)
+        except OSError as e:
+            raise CommandError(f'Não foi possível abrir o arquivo: {e}')
+        except ErroImportacao as e:
+            raise CommandError(str(e))
+
+        planos, erros = validar_plano_transferencias(linhas, Loja.objects.all())
+        for erro in erros:
+            self.stderr.write(f"Linha {erro['linha']}: {'; '.join(erro['erros'])}")
+        if erros:
+            raise CommandError(f"{len(erros)} de {len(linhas)} linha(s) com erro. Nenhuma transferência foi feita.")
+
+        if options['validar']:
+            self.stdout.write(f"Plano válido: {len(planos)} transferência(s), {len(linhas)} linha(s).")
+            return
+
+        feitas, recusadas = 0, 0
+        # Com --tudo-ou-nada o plano inteiro é uma transação; sem ele, cada par é a sua
+        with transaction.atomic() if options['tudo_ou_nada'] else nullcontext():
+            for (origem, destino), itens in planos.items():
+                try:
+                    codigo = transferir_estoque(origem, destino, itens, criado_por=criado_por, motivo=options['motivo'])
+                    feitas += 1
+                    self.stdout.write(f'{origem.nome} -> {destino.nome}: {len(itens)} item(ns) ({codigo})')
+                except TransferenciaRecusada as e:
+                    recusadas += 1
+                    self.stderr.write(f"{origem.nome} -> {destino.nome}: recusada — {'; '.join(e.erros)}")
+                    if options['tudo_ou_nada']:
+                        raise CommandError('Plano desfeito: uma transferência foi recusada.')
+
+        resumo = f'{feitas} transferência(s) feitas, {recusadas} recusada(s).'
+        if recusadas:
+            self.stdout.write(self.style.WARNING(resumo))
+        else:
+            self.stdout.write(self.style.SUCCESS(resumo))
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def preencher_resumo(apps, schema_editor):
+    from django.db.models import Count, Sum
+    from django.db.models.functions import TruncDate
+
+    Venda = apps.get_model('lojas', 'Venda')
+    ResumoVendaDiaria = apps.get_model('lojas', 'ResumoVendaDiaria')
+
+    agrupado = Venda.objects.annotate(
+        dia=TruncDate('data_venda')
+    ).values(
+        'dia',
+        'item_type',
+        'vendedor',
+        'estoque_loja__loja',
+        'estoque_loja__produto',
+        'estoque_recarga__loja',
+        'estoque_recarga__recarga',
+    ).annotate(
+        soma_quantidade=Sum('quantidade'),
+        soma_valor=Sum('valor_total'),
+        contagem=Count('id')
+    ).order_by()
+
+    novos = []
+    for linha in agrupado:
+        if linha['item_type'] == 'produto' and linha['estoque_loja__loja']:
+            loja_id, produto_id, recarga_id = linha['estoque_loja__loja'], linha['estoque_loja__produto'], None
+        elif linha['item_type'] == 'recarga' and linha['estoque_recarga__loja']:
+            loja_id, produto_id, recarga_id = linha['estoque_recarga__loja'], None, linha['estoque_recarga__recarga']
+        else:
+            continue
+        novos.append(ResumoVendaDiaria(
+            loja_id=loja_id,
+            data=linha['dia'],
+            item_type=linha['item_type'],
+            produto_id=produto_id,
+            recarga_id=recarga_id,
+            vendedor_id=linha['vendedor'],
+            quantidade=linha['soma_quantidade'] or 0,
+            valor_total=linha['soma_valor'] or 0,
+            numero_vendas=linha['contagem']
+        ))
+
+    ResumoVendaDiaria.objects.bulk_create(novos, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lojas', '0011_alter_estoqueloja_loja_alter_estoqueloja_produto_and_more'),
+        ('produtos', '0004_recarga'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoVendaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(verbose_name='Data')),
+                ('item_type', models.CharField(choices=[('produto', 'Produto'), ('recarga', 'Recarga')], max_length=10, verbose_name='Tipo de Item')),
+                ('quantidade', models.IntegerField(default=0, verbose_name='Quantidade Vendida')),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor Total')),
+                ('numero_vendas', models.IntegerField(default=0, verbose_name='Número de Vendas')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_vendas', to='lojas.loja', verbose_name='Loja')),
+                ('produto', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumos_vendas', to='produtos.produto', verbose_name='Produto')),
+                ('recarga', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumos_vendas', to='produtos.recarga', verbose_name='Recarga')),
+                ('vendedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_vendas', to=settings.AUTH_USER_MODEL, verbose_name='Vendedor')),
+            ],
+            options={
+                'verbose_name': 'Resumo Diário de Vendas',
+                'verbose_name_plural': 'Resumos Diários de Vendas',
+                'ordering': ['-data', 'loja'],
+                'indexes': [models.Index(fields=['loja', 'data'], name='lojas_resum_loja_id_06a915_idx'), models.Index(fields=['produto', 'data'], name='lojas_resum_produto_1cbbab_idx'), models.Index(fields=['recarga', 'data'], name='lojas_resum_recarga_ca104a_idx'), models.Index(fields=['vendedor', 'data'], name='lojas_resum_vendedo_5f36f2_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('item_type', 'produto')), fields=('loja', 'data', 'produto', 'vendedor'), name='resumo_venda_produto_unico'), models.UniqueConstraint(condition=models.Q(('item_type', 'recarga')), fields=('loja', 'data', 'recarga', 'vendedor'), name='resumo_venda_recarga_unico')],
+            },
+        ),
+        migrations.RunPython(preencher_resumo, migrations.RunPython.noop),
+    ]
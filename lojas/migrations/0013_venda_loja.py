@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def preencher_loja(apps, schema_editor):
+    from django.db.models import OuterRef, Subquery
+
+    Venda = apps.get_model('lojas', 'Venda')
+    EstoqueLoja = apps.get_model('lojas', 'EstoqueLoja')
+    EstoqueRecarga = apps.get_model('lojas', 'EstoqueRecarga')
+
+    Venda.objects.filter(item_type='produto', estoque_loja__isnull=False).update(
+        loja_id=Subquery(EstoqueLoja.objects.filter(pk=OuterRef('estoque_loja_id')).values('loja_id')[:1])
+    )
+    Venda.objects.filter(item_type='recarga', estoque_recarga__isnull=False).update(
+        loja_id=Subquery(EstoqueRecarga.objects.filter(pk=OuterRef('estoque_recarga_id')).values('loja_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lojas', '0012_resumovendadiaria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venda',
+            name='loja',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='vendas', to='lojas.loja', verbose_name='Loja'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['loja', 'data_venda'], name='lojas_venda_loja_id_f844d5_idx'),
+        ),
+        migrations.RunPython(preencher_loja, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def preencher_dia_venda(apps, schema_editor):
+    from django.db.models.functions import TruncDate
+
+    Venda = apps.get_model('lojas', 'Venda')
+    # TruncDate converte para o fuso atual (TIME_ZONE) antes de truncar
+    Venda.objects.update(dia_venda=TruncDate('data_venda'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lojas', '0013_venda_loja'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='venda',
+            name='data_venda',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Data da Venda'),
+        ),
+        migrations.AddField(
+            model_name='venda',
+            name='dia_venda',
+            field=models.DateField(editable=False, null=True, verbose_name='Dia da Venda'),
+        ),
+        migrations.RunPython(preencher_dia_venda, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='venda',
+            name='dia_venda',
+            field=models.DateField(editable=False, verbose_name='Dia da Venda'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['loja', 'dia_venda'], name='lojas_venda_loja_id_e7334b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['loja', 'item_type', 'dia_venda'], name='lojas_venda_loja_id_6199d1_idx'),
+        ),
+    ]
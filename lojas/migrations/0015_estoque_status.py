@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lojas', '0014_venda_dia_venda'),
+        ('produtos', '0004_recarga'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estoqueloja',
+            name='estoque_minimo',
+            field=models.PositiveIntegerField(default=10, verbose_name='Estoque Mínimo'),
+        ),
+        migrations.AddField(
+            model_name='estoquerecarga',
+            name='estoque_minimo',
+            field=models.PositiveIntegerField(default=10, verbose_name='Estoque Mínimo'),
+        ),
+        migrations.AddField(
+            model_name='estoqueloja',
+            name='status',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(quantidade=0, then=models.Value('esgotado')), models.When(quantidade__lt=models.F('estoque_minimo'), then=models.Value('baixo')), default=models.Value('normal'), output_field=models.CharField(max_length=10)), output_field=models.CharField(choices=[('normal', 'Normal'), ('baixo', 'Estoque Baixo'), ('esgotado', 'Esgotado')], max_length=10), verbose_name='Status do Estoque'),
+        ),
+        migrations.AddField(
+            model_name='estoquerecarga',
+            name='status',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(quantidade=0, then=models.Value('esgotado')), models.When(quantidade__lt=models.F('estoque_minimo'), then=models.Value('baixo')), default=models.Value('normal'), output_field=models.CharField(max_length=10)), output_field=models.CharField(choices=[('normal', 'Normal'), ('baixo', 'Estoque Baixo'), ('esgotado', 'Esgotado')], max_length=10), verbose_name='Status do Estoque'),
+        ),
+        migrations.AddIndex(
+            model_name='estoqueloja',
+            index=models.Index(condition=models.Q(('status', 'normal'), _negated=True), fields=['loja', 'status'], name='estoqueloja_alerta_loja_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estoqueloja',
+            index=models.Index(condition=models.Q(('status', 'normal'), _negated=True), fields=['status', 'quantidade'], name='estoqueloja_alerta_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estoquerecarga',
+            index=models.Index(condition=models.Q(('status', 'normal'), _negated=True), fields=['loja', 'status'], name='estoquerecarga_alerta_loja_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estoquerecarga',
+            index=models.Index(condition=models.Q(('status', 'normal'), _negated=True), fields=['status', 'quantidade'], name='estoquerecarga_alerta_idx'),
+        ),
+    ]
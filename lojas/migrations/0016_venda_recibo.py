@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lojas', '0015_estoque_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venda',
+            name='recibo',
+            field=models.CharField(blank=True, db_index=True, max_length=30, verbose_name='Recibo'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lojas', '0016_venda_recibo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venda',
+            name='chave_idempotencia',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Chave de Idempotência'),
+        ),
+    ]
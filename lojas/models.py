@@ -5,10 +5,87 @@ from django.db.models import Sum, Q
 from datetime import datetime, date
 from produtos.models import Recarga
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.conf import settings
-from django.db.models import Sum, Q, Count
+from django.db.models import Sum, Q, Count, F, Case, When, Value, OuterRef, Subquery, ExpressionWrapper
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from datetime import datetime
+from decimal import Decimal
+
+ESTOQUE_MINIMO_PADRAO = 10
+
+STATUS_ESTOQUE_CHOICES = [
+    ('normal', 'Normal'),
+    ('baixo', 'Estoque Baixo'),
+    ('esgotado', 'Esgotado'),
+]
+
+
+def expressao_status_estoque():
+    """Status do estoque calculado pelo banco a partir da quantidade e do mínimo"""
+    return Case(
+        When(quantidade=0, then=Value('esgotado')),
+        When(quantidade__lt=F('estoque_minimo'), then=Value('baixo')),
+        default=Value('normal'),
+        output_field=models.CharField(max_length=10)
+    )
+
+
+class EstoqueQuerySet(models.QuerySet):
+    def em_alerta(self, status=None):
+        """
+        Estoques baixos ou esgotados (ou só os do `status` dado). Repete a
+        condição dos índices parciais para que o banco possa usá-los.
+        """
+        alerta = self.exclude(status='normal')
+        return alerta.filter(status=status) if status else alerta
+
+
+def _soma_por_loja(queryset, expressao, padrao=0, output_field=None):
+    """Subconsulta com o total de `expressao` nas linhas de `queryset` da loja externa"""
+    total = queryset.filter(loja=OuterRef('pk')).order_by().values('loja').annotate(
+        total=expressao
+    ).values('total')
+    return Coalesce(Subquery(total, output_field=output_field), Value(padrao), output_field=output_field)
+
+
+class LojaQuerySet(models.QuerySet):
+    def with_stats(self, date_range=None):
+        """
+        Anota as estatísticas que as propriedades de Loja calculam, cada uma
+        numa subconsulta da mesma instrução SQL. date_range=(início, fim)
+        limita as vendas a esse período; o estoque é sempre o atual.
+        As propriedades usam os valores anotados quando existem.
+        """
+        resumos = ResumoVendaDiaria.objects.all()
+        if date_range:
+            resumos = resumos.filter(data__range=date_range)
+        valor = models.DecimalField(max_digits=15, decimal_places=2)
+
+        return self.annotate(
+            stats_total_vendas=_soma_por_loja(resumos, Sum('numero_vendas')),
+            stats_total_vendas_quantidade=_soma_por_loja(resumos, Sum('quantidade')),
+            stats_valor_total_vendas=_soma_por_loja(resumos, Sum('valor_total'), Decimal('0.00'), valor),
+            stats_produtos_em_estoque=_soma_por_loja(EstoqueLoja.objects.filter(quantidade__gt=0), Count('id')),
+            stats_recargas_em_estoque=_soma_por_loja(EstoqueRecarga.objects.filter(quantidade__gt=0), Count('id')),
+            stats_itens_produtos=_soma_por_loja(EstoqueLoja.objects.all(), Sum('quantidade')),
+            stats_itens_recargas=_soma_por_loja(EstoqueRecarga.objects.all(), Sum('quantidade')),
+            stats_valor_produtos=_soma_por_loja(
+                EstoqueLoja.objects.all(), Sum(F('quantidade') * F('produto__preco'), output_field=valor),
+                Decimal('0.00'), valor
+            ),
+            stats_valor_recargas=_soma_por_loja(
+                EstoqueRecarga.objects.all(), Sum(F('quantidade') * F('recarga__preco'), output_field=valor),
+                Decimal('0.00'), valor
+            ),
+        ).annotate(
+            stats_total_itens_em_estoque=F('stats_itens_produtos') + F('stats_itens_recargas'),
+            stats_valor_total_estoque=ExpressionWrapper(
+                F('stats_valor_produtos') + F('stats_valor_recargas'), output_field=valor
+            ),
+        )
+
 
 class Loja(models.Model):
     PROVINCIAS = [
@@ -43,26 +120,37 @@ class Loja(models.Model):
         related_name='lojas_gerenciadas'
     )
     
+    objects = LojaQuerySet.as_manager()
+    
     def __str__(self):
         return self.nome
     
+    def _estatistica_anotada(self, nome):
+        """Valor anotado por Loja.objects.with_stats(), ou None se a loja não veio dele"""
+        return getattr(self, f'stats_{nome}', None)
+    
     @property
     def total_vendas(self):
         """
         Retorna o número total de transações de venda da loja (produtos + recargas)
         """
-        return Venda.objects.filter(
-            Q(estoque_loja__loja=self) | Q(estoque_recarga__loja=self)
-        ).count()
+        anotado = self._estatistica_anotada('total_vendas')
+        if anotado is not None:
+            return anotado
+        
+        resultado = self.resumos_vendas.aggregate(total=Sum('numero_vendas'))
+        return resultado['total'] or 0
     
     @property
     def total_vendas_quantidade(self):
         """
         Retorna a quantidade total de itens vendidos (soma das quantidades)
         """
-        resultado = Venda.objects.filter(
-            Q(estoque_loja__loja=self) | Q(estoque_recarga__loja=self)
-        ).aggregate(total=Sum('quantidade'))
+        anotado = self._estatistica_anotada('total_vendas_quantidade')
+        if anotado is not None:
+            return anotado
+        
+        resultado = self.resumos_vendas.aggregate(total=Sum('quantidade'))
         return resultado['total'] or 0
     
     @property
@@ -70,24 +158,38 @@ class Loja(models.Model):
         """
         Retorna o valor total das vendas da loja
         """
-        resultado = Venda.objects.filter(
-            Q(estoque_loja__loja=self) | Q(estoque_recarga__loja=self)
-        ).aggregate(total=Sum('valor_total'))
+        anotado = self._estatistica_anotada('valor_total_vendas')
+        if anotado is not None:
+            return anotado
+        
+        resultado = self.resumos_vendas.aggregate(total=Sum('valor_total'))
         return resultado['total'] or 0
     
     @property
     def produtos_em_estoque(self):
         """Retorna o número de produtos diferentes em estoque"""
+        anotado = self._estatistica_anotada('produtos_em_estoque')
+        if anotado is not None:
+            return anotado
+        
         return self.estoqueloja_set.filter(quantidade__gt=0).count()
     
     @property
     def recargas_em_estoque(self):
         """Retorna o número de recargas diferentes em estoque"""
+        anotado = self._estatistica_anotada('recargas_em_estoque')
+        if anotado is not None:
+            return anotado
+        
         return self.estoquerecarga_set.filter(quantidade__gt=0).count()
     
     @property
     def total_itens_em_estoque(self):
         """Retorna o total de itens em estoque (quantidade)"""
+        anotado = self._estatistica_anotada('total_itens_em_estoque')
+        if anotado is not None:
+            return anotado
+        
         total_produtos = self.estoqueloja_set.aggregate(total=Sum('quantidade'))['total'] or 0
         total_recargas = self.estoquerecarga_set.aggregate(total=Sum('quantidade'))['total'] or 0
         return total_produtos + total_recargas
@@ -95,6 +197,10 @@ class Loja(models.Model):
     @property
     def valor_total_estoque(self):
         """Retorna o valor total do estoque (produtos + recargas)"""
+        anotado = self._estatistica_anotada('valor_total_estoque')
+        if anotado is not None:
+            return anotado
+        
         valor_produtos = 0
         for estoque in self.estoqueloja_set.filter(quantidade__gt=0):
             valor_produtos += estoque.quantidade * estoque.produto.preco
@@ -110,9 +216,7 @@ class Loja(models.Model):
         Calcula o ACC (Total de Produtos Vendidos) para esta loja
         Se data_relatorio for fornecida, filtra por essa data
         """
-        vendas_query = Venda.objects.filter(
-            Q(estoque_loja__loja=self) | Q(estoque_recarga__loja=self)
-        )
+        vendas_query = self.resumos_vendas.all()
         
         if data_relatorio:
             if isinstance(data_relatorio, str):
@@ -120,7 +224,7 @@ class Loja(models.Model):
                     data_relatorio = datetime.strptime(data_relatorio, '%Y-%m-%d').date()
                 except ValueError:
                     return 0
-            vendas_query = vendas_query.filter(data_venda__date=data_relatorio)
+            vendas_query = vendas_query.filter(data=data_relatorio)
         
         total = vendas_query.aggregate(
             total_vendido=Sum('quantidade')
@@ -132,9 +236,7 @@ class Loja(models.Model):
         Calcula o valor total das vendas para esta loja
         Se data_relatorio for fornecida, filtra por essa data
         """
-        vendas_query = Venda.objects.filter(
-            Q(estoque_loja__loja=self) | Q(estoque_recarga__loja=self)
-        )
+        vendas_query = self.resumos_vendas.all()
         
         if data_relatorio:
             if isinstance(data_relatorio, str):
@@ -142,7 +244,7 @@ class Loja(models.Model):
                     data_relatorio = datetime.strptime(data_relatorio, '%Y-%m-%d').date()
                 except ValueError:
                     return 0
-            vendas_query = vendas_query.filter(data_venda__date=data_relatorio)
+            vendas_query = vendas_query.filter(data=data_relatorio)
         
         total = vendas_query.aggregate(
             total_valor=Sum('valor_total')
@@ -153,9 +255,8 @@ class Loja(models.Model):
         """
         Retorna vendas por período específico
         """
-        return Venda.objects.filter(
-            Q(estoque_loja__loja=self) | Q(estoque_recarga__loja=self),
-            data_venda__date__range=[data_inicio, data_fim]
+        return self.vendas.filter(
+            dia_venda__range=[data_inicio, data_fim]
         )
     
     def get_ranking_produtos(self, data_inicio=None, data_fim=None):
@@ -165,14 +266,13 @@ class Loja(models.Model):
         from django.db.models import Count, Sum
         
         # Filtra vendas de produtos desta loja
-        vendas_query = Venda.objects.filter(
-            estoque_loja__loja=self,
+        vendas_query = self.vendas.filter(
             item_type='produto'
         )
         
         if data_inicio and data_fim:
             vendas_query = vendas_query.filter(
-                data_venda__date__range=[data_inicio, data_fim]
+                dia_venda__range=[data_inicio, data_fim]
             )
         
         return vendas_query.values(
@@ -190,14 +290,13 @@ class Loja(models.Model):
         from django.db.models import Count, Sum
         
         # Filtra vendas de recargas desta loja
-        vendas_query = Venda.objects.filter(
-            estoque_recarga__loja=self,
+        vendas_query = self.vendas.filter(
             item_type='recarga'
         )
         
         if data_inicio and data_fim:
             vendas_query = vendas_query.filter(
-                data_venda__date__range=[data_inicio, data_fim]
+                dia_venda__range=[data_inicio, data_fim]
             )
         
         return vendas_query.values(
@@ -211,24 +310,22 @@ class Loja(models.Model):
     def get_vendas_hoje(self):
         """Retorna vendas do dia atual"""
         hoje = datetime.now().date()
-        return Venda.objects.filter(
-            Q(estoque_loja__loja=self) | Q(estoque_recarga__loja=self),
-            data_venda__date=hoje
+        return self.vendas.filter(
+            dia_venda=hoje
         )
     
     def get_vendas_mes_atual(self):
         """Retorna vendas do mês atual"""
         hoje = datetime.now().date()
         primeiro_dia_mes = hoje.replace(day=1)
-        return Venda.objects.filter(
-            Q(estoque_loja__loja=self) | Q(estoque_recarga__loja=self),
-            data_venda__date__range=[primeiro_dia_mes, hoje]
+        return self.vendas.filter(
+            dia_venda__range=[primeiro_dia_mes, hoje]
         )
     
     def get_estoque_baixo(self):
-        """Retorna itens com estoque baixo (menos de 10 unidades)"""
-        produtos_baixo = self.estoqueloja_set.filter(quantidade__lt=10, quantidade__gt=0)
-        recargas_baixo = self.estoquerecarga_set.filter(quantidade__lt=10, quantidade__gt=0)
+        """Retorna itens com estoque baixo (abaixo do estoque mínimo de cada item)"""
+        produtos_baixo = self.estoqueloja_set.em_alerta('baixo')
+        recargas_baixo = self.estoquerecarga_set.em_alerta('baixo')
         return {
             'produtos': produtos_baixo,
             'recargas': recargas_baixo,
@@ -237,8 +334,8 @@ class Loja(models.Model):
     
     def get_estoque_esgotado(self):
         """Retorna itens com estoque esgotado"""
-        produtos_esgotado = self.estoqueloja_set.filter(quantidade=0)
-        recargas_esgotado = self.estoquerecarga_set.filter(quantidade=0)
+        produtos_esgotado = self.estoqueloja_set.em_alerta('esgotado')
+        recargas_esgotado = self.estoquerecarga_set.em_alerta('esgotado')
         return {
             'produtos': produtos_esgotado,
             'recargas': recargas_esgotado,
@@ -253,11 +350,26 @@ class EstoqueLoja(models.Model):
     loja = models.ForeignKey(Loja, on_delete=models.CASCADE)
     produto = models.ForeignKey('produtos.Produto', on_delete=models.CASCADE)
     quantidade = models.PositiveIntegerField(default=0)
+    estoque_minimo = models.PositiveIntegerField(default=ESTOQUE_MINIMO_PADRAO, verbose_name='Estoque Mínimo')
+    # Mantido pelo banco a cada alteração, inclusive nos UPDATEs com F()
+    status = models.GeneratedField(
+        expression=expressao_status_estoque(),
+        output_field=models.CharField(max_length=10, choices=STATUS_ESTOQUE_CHOICES),
+        db_persist=True,
+        verbose_name='Status do Estoque'
+    )
+    
+    objects = EstoqueQuerySet.as_manager()
     
     class Meta:
         unique_together = ['loja', 'produto']
         verbose_name = 'Estoque da Loja'
         verbose_name_plural = 'Estoques das Lojas'
+        indexes = [
+            # Índices parciais: só as linhas em alerta entram no índice
+            models.Index(fields=['loja', 'status'], condition=~Q(status='normal'), name='estoqueloja_alerta_loja_idx'),
+            models.Index(fields=['status', 'quantidade'], condition=~Q(status='normal'), name='estoqueloja_alerta_idx'),
+        ]
     
     def __str__(self):
         return f"{self.loja.nome} - {self.produto.nome}: {self.quantidade}"
@@ -282,10 +394,10 @@ class EstoqueLoja(models.Model):
     
     @property
     def status_estoque(self):
-        """Retorna o status do estoque"""
+        """Retorna o status do estoque (o mesmo da coluna status, sem reler a linha)"""
         if self.quantidade == 0:
             return 'esgotado'
-        elif self.quantidade < 10:
+        elif self.quantidade < self.estoque_minimo:
             return 'baixo'
         else:
             return 'normal'
@@ -295,15 +407,30 @@ class EstoqueRecarga(models.Model):
     loja = models.ForeignKey(Loja, on_delete=models.CASCADE, verbose_name='Loja')
     recarga = models.ForeignKey(Recarga, on_delete=models.CASCADE, verbose_name='Recarga')
     quantidade = models.PositiveIntegerField(default=0, verbose_name='Quantidade em Estoque')
+    estoque_minimo = models.PositiveIntegerField(default=ESTOQUE_MINIMO_PADRAO, verbose_name='Estoque Mínimo')
+    # Mantido pelo banco a cada alteração, inclusive nos UPDATEs com F()
+    status = models.GeneratedField(
+        expression=expressao_status_estoque(),
+        output_field=models.CharField(max_length=10, choices=STATUS_ESTOQUE_CHOICES),
+        db_persist=True,
+        verbose_name='Status do Estoque'
+    )
     
     # Campos de data
     criado_em = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
     atualizado_em = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
     
+    objects = EstoqueQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Estoque de Recarga'
         verbose_name_plural = 'Estoques de Recargas'
         unique_together = ['loja', 'recarga']
+        indexes = [
+            # Índices parciais: só as linhas em alerta entram no índice
+            models.Index(fields=['loja', 'status'], condition=~Q(status='normal'), name='estoquerecarga_alerta_loja_idx'),
+            models.Index(fields=['status', 'quantidade'], condition=~Q(status='normal'), name='estoquerecarga_alerta_idx'),
+        ]
     
     def __str__(self):
         return f"{self.loja.nome} - {self.recarga.nome}: {self.quantidade}"
@@ -330,10 +457,10 @@ class EstoqueRecarga(models.Model):
     
     @property
     def status_estoque(self):
-        """Retorna o status do estoque"""
+        """Retorna o status do estoque (o mesmo da coluna status, sem reler a linha)"""
         if self.quantidade == 0:
             return 'esgotado'
-        elif self.quantidade < 10:
+        elif self.quantidade < self.estoque_minimo:
             return 'baixo'
         else:
             return 'normal'
@@ -371,6 +498,17 @@ class Venda(models.Model):
         verbose_name='Tipo de Item'
     )
     
+    # Copiada do estoque ao gravar, para filtrar vendas por loja sem JOIN
+    loja = models.ForeignKey(
+        'Loja',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Loja',
+        related_name='vendas'
+    )
+    
     quantidade = models.PositiveIntegerField(verbose_name='Quantidade Vendida')
     valor_total = models.DecimalField(
         max_digits=10, 
@@ -382,8 +520,21 @@ class Venda(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Vendedor'
     )
-    data_venda = models.DateTimeField(auto_now_add=True, verbose_name='Data da Venda')
+    data_venda = models.DateTimeField(default=timezone.now, editable=False, verbose_name='Data da Venda')
+    # Dia local (TIME_ZONE) da venda, gravado para filtrar por data sem converter data_venda
+    dia_venda = models.DateField(editable=False, verbose_name='Dia da Venda')
     observacao = models.TextField(blank=True, verbose_name='Observações')
+    # Recibo comum às vendas de um mesmo carrinho (ver lojas/estoque.py:finalizar_carrinho)
+    recibo = models.CharField(max_length=30, blank=True, db_index=True, verbose_name='Recibo')
+    # Chave gerada pelo cliente nas vendas registradas offline: reenvios não duplicam a venda
+    chave_idempotencia = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Chave de Idempotência'
+    )
     
     class Meta:
         verbose_name = 'Venda'
@@ -393,6 +544,9 @@ class Venda(models.Model):
             models.Index(fields=['estoque_loja', 'data_venda']),
             models.Index(fields=['estoque_recarga', 'data_venda']),
             models.Index(fields=['data_venda']),
+            models.Index(fields=['loja', 'data_venda']),
+            models.Index(fields=['loja', 'dia_venda']),
+            models.Index(fields=['loja', 'item_type', 'dia_venda']),
         ]
     
     def __str__(self):
@@ -414,7 +568,17 @@ class Venda(models.Model):
         if not self.estoque_loja and not self.estoque_recarga:
             raise ValueError("Uma venda deve estar associada a um estoque de produto ou recarga")
         
-        super().save(*args, **kwargs)
+        # Loja da venda, a partir do estoque do item vendido
+        if self.item_type == 'produto' and self.estoque_loja:
+            self.loja_id = self.estoque_loja.loja_id
+        elif self.item_type == 'recarga' and self.estoque_recarga:
+            self.loja_id = self.estoque_recarga.loja_id
+        
+        self.dia_venda = timezone.localdate(self.data_venda)
+        
+        # A venda e o resumo diário (ver lojas/signals.py) são gravados na mesma transação
+        with transaction.atomic():
+            super().save(*args, **kwargs)
     
     @property
     def item_nome(self):
@@ -425,15 +589,6 @@ class Venda(models.Model):
             return self.estoque_recarga.recarga.nome
         return "Item não especificado"
     
-    @property
-    def loja(self):
-        """Retorna a loja onde ocorreu a venda"""
-        if self.item_type == 'produto' and self.estoque_loja:
-            return self.estoque_loja.loja
-        elif self.item_type == 'recarga' and self.estoque_recarga:
-            return self.estoque_recarga.loja
-        return None
-    
     @property
     def preco_unitario(self):
         """Retorna o preço unitário do item"""
@@ -441,4 +596,201 @@ class Venda(models.Model):
             return self.estoque_loja.produto.preco
         elif self.item_type == 'recarga' and self.estoque_recarga:
             return self.estoque_recarga.recarga.preco
-        return 0
\ No newline at end of file
+        return 0
+
+class ResumoVendaDiaria(models.Model):
+    """
+    Resumo materializado das vendas por (loja, dia, item, vendedor).
+
+    Mantido na mesma transação em que as vendas são criadas ou removidas
+    (ver lojas/signals.py) e reconstruível com o comando
+    `manage.py reconstruir_resumo_vendas`. Os relatórios por período leem
+    este resumo em vez de reagregar as vendas individuais.
+    """
+    loja = models.ForeignKey(Loja, on_delete=models.CASCADE, verbose_name='Loja', related_name='resumos_vendas')
+    data = models.DateField(verbose_name='Data')
+    item_type = models.CharField(max_length=10, choices=Venda.ITEM_TYPE_CHOICES, verbose_name='Tipo de Item')
+    produto = models.ForeignKey(
+        'produtos.Produto',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name='Produto',
+        related_name='resumos_vendas'
+    )
+    recarga = models.ForeignKey(
+        Recarga,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name='Recarga',
+        related_name='resumos_vendas'
+    )
+    vendedor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name='Vendedor',
+        related_name='resumos_vendas'
+    )
+    
+    quantidade = models.IntegerField(default=0, verbose_name='Quantidade Vendida')
+    valor_total = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name='Valor Total')
+    numero_vendas = models.IntegerField(default=0, verbose_name='Número de Vendas')
+    
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
+    
+    class Meta:
+        verbose_name = 'Resumo Diário de Vendas'
+        verbose_name_plural = 'Resumos Diários de Vendas'
+        ordering = ['-data', 'loja']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['loja', 'data', 'produto', 'vendedor'],
+                condition=Q(item_type='produto'),
+                name='resumo_venda_produto_unico'
+            ),
+            models.UniqueConstraint(
+                fields=['loja', 'data', 'recarga', 'vendedor'],
+                condition=Q(item_type='recarga'),
+                name='resumo_venda_recarga_unico'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['loja', 'data']),
+            models.Index(fields=['produto', 'data']),
+            models.Index(fields=['recarga', 'data']),
+            models.Index(fields=['vendedor', 'data']),
+        ]
+    
+    def __str__(self):
+        return f"{self.loja.nome} - {self.data} - {self.item_type}: {self.quantidade} ({self.valor_total})"
+    
+    @staticmethod
+    def chave_da_venda(venda):
+        """Retorna a chave (loja, data, item_type, produto, recarga, vendedor) de uma venda"""
+        if venda.item_type == 'produto' and venda.estoque_loja_id:
+            estoque = venda.estoque_loja
+            produto_id, recarga_id = estoque.produto_id, None
+        elif venda.item_type == 'recarga' and venda.estoque_recarga_id:
+            estoque = venda.estoque_recarga
+            produto_id, recarga_id = None, estoque.recarga_id
+        else:
+            return None
+        
+        return (
+            venda.loja_id or estoque.loja_id,
+            venda.dia_venda or timezone.localdate(venda.data_venda),
+            venda.item_type,
+            produto_id,
+            recarga_id,
+            venda.vendedor_id,
+        )
+    
+    @classmethod
+    def aplicar_vendas(cls, vendas, sinal=1):
+        """
+        Aplica ao resumo vendas criadas (sinal=1) ou removidas (sinal=-1).
+        As vendas são agrupadas por chave antes de tocar no banco.
+        """
+        agrupado = {}
+        for venda in vendas:
+            chave = cls.chave_da_venda(venda)
+            if chave is None:
+                continue
+            quantidade, valor, numero = agrupado.get(chave, (0, Decimal('0.00'), 0))
+            agrupado[chave] = (
+                quantidade + venda.quantidade,
+                valor + Decimal(str(venda.valor_total or 0)),
+                numero + 1
+            )
+        
+        agora = timezone.now()
+        with transaction.atomic():
+            for (loja_id, data, item_type, produto_id, recarga_id, vendedor_id), (quantidade, valor, numero) in agrupado.items():
+                filtro = {
+                    'loja_id': loja_id,
+                    'data': data,
+                    'item_type': item_type,
+                    'produto_id': produto_id,
+                    'recarga_id': recarga_id,
+                    'vendedor_id': vendedor_id,
+                }
+                alteracoes = {
+                    'quantidade': F('quantidade') + sinal * quantidade,
+                    'valor_total': F('valor_total') + sinal * valor,
+                    'numero_vendas': F('numero_vendas') + sinal * numero,
+                    'atualizado_em': agora,
+                }
+                
+                if cls.objects.filter(**filtro).update(**alteracoes) or sinal < 0:
+                    continue
+                
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(
+                            quantidade=quantidade,
+                            valor_total=valor,
+                            numero_vendas=numero,
+                            **filtro
+                        )
+                except IntegrityError:
+                    # Outra transação criou a linha entre o UPDATE e o INSERT
+                    cls.objects.filter(**filtro).update(**alteracoes)
+    
+    @classmethod
+    def reconstruir(cls, lojas=None, data_inicio=None, data_fim=None):
+        """Recalcula o resumo a partir das vendas. Retorna o número de linhas criadas."""
+        vendas = Venda.objects.all()
+        resumos = cls.objects.all()
+        
+        if lojas is not None:
+            vendas = vendas.filter(loja__in=lojas)
+            resumos = resumos.filter(loja__in=lojas)
+        if data_inicio:
+            vendas = vendas.filter(dia_venda__gte=data_inicio)
+            resumos = resumos.filter(data__gte=data_inicio)
+        if data_fim:
+            vendas = vendas.filter(dia_venda__lte=data_fim)
+            resumos = resumos.filter(data__lte=data_fim)
+        
+        agrupado = vendas.values(
+            'dia_venda',
+            'item_type',
+            'vendedor',
+            'loja',
+            'estoque_loja__produto',
+            'estoque_recarga__recarga',
+        ).annotate(
+            soma_quantidade=Sum('quantidade'),
+            soma_valor=Sum('valor_total'),
+            contagem=Count('id')
+        ).order_by()
+        
+        novos = []
+        for linha in agrupado:
+            if not linha['loja']:
+                continue
+            if linha['item_type'] == 'produto' and linha['estoque_loja__produto']:
+                produto_id, recarga_id = linha['estoque_loja__produto'], None
+            elif linha['item_type'] == 'recarga' and linha['estoque_recarga__recarga']:
+                produto_id, recarga_id = None, linha['estoque_recarga__recarga']
+            else:
+                continue
+            
+            novos.append(cls(
+                loja_id=linha['loja'],
+                data=linha['dia_venda'],
+                item_type=linha['item_type'],
+                produto_id=produto_id,
+                recarga_id=recarga_id,
+                vendedor_id=linha['vendedor'],
+                quantidade=linha['soma_quantidade'] or 0,
+                valor_total=linha['soma_valor'] or Decimal('0.00'),
+                numero_vendas=linha['contagem']
+            ))
+        
+        with transaction.atomic():
+            resumos.delete()
+            cls.objects.bulk_create(novos, batch_size=1000)
+        
+        return len(novos)
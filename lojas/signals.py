@@ -0,0 +1,38 @@
+# lojas/signals.py
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.dispatch import Signal, receiver
+
+from .models import Venda, ResumoVendaDiaria
+
+# Enviado sempre que vendas são criadas (sinal=1) ou removidas (sinal=-1).
+# Caminhos que gravam vendas em lote (bulk_create) devem enviá-lo manualmente.
+vendas_alteradas = Signal()
+
+
+@receiver(post_save, sender=Venda)
+def venda_salva(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        vendas_alteradas.send(sender=Venda, vendas=[instance], sinal=1)
+
+
+@receiver(pre_delete, sender=Venda)
+def preparar_remocao_venda(sender, instance, **kwargs):
+    """
+    Carrega o estoque da venda antes da remoção: numa exclusão em cascata
+    ele pode já ter sido removido quando o post_delete é enviado.
+    """
+    if instance.estoque_loja_id:
+        instance.estoque_loja
+    if instance.estoque_recarga_id:
+        instance.estoque_recarga
+
+
+@receiver(post_delete, sender=Venda)
+def venda_removida(sender, instance, **kwargs):
+    vendas_alteradas.send(sender=Venda, vendas=[instance], sinal=-1)
+
+
+@receiver(vendas_alteradas)
+def atualizar_resumo_vendas(sender, vendas, sinal, **kwargs):
+    """Mantém o ResumoVendaDiaria em dia com as vendas"""
+    ResumoVendaDiaria.aplicar_vendas(vendas, sinal)
@@ -1,3 +1,105 @@
-from django.test import TestCase
+import threading
+import time
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import OperationalError, connections
+from django.db.models import Sum
+from django.test import TransactionTestCase
+
+from balanco.models import MovimentoEstoque
+from conta.models import Conta
+from produtos.models import Produto
+from .estoque import EstoqueInsuficiente, efetuar_venda
+from .models import EstoqueLoja, Loja, ResumoVendaDiaria, Venda
+
+
+class VendaConcorrenteTest(TransactionTestCase):
+    """
+    Várias threads vendem do mesmo estoque ao mesmo tempo: nenhuma baixa
+    se perde e o estoque nunca é vendido além do saldo.
+    """
+    ESTOQUE_INICIAL = 120
+    THREADS = 8
+    VENDAS_POR_THREAD = 25
+    # Reenvios de uma venda recusada por bloqueio antes de desistir (~2s)
+    REENVIOS = 400
+    PAUSA_REENVIO = 0.005
+
+    def setUp(self):
+        self.vendedor = Conta.objects.create_user(
+            'vendedor@teste.ao', 'senha', username='vendedor', nome='Vendedor'
+        )
+        self.loja = Loja.objects.create(
+            nome='Loja Teste', bairro='Centro', cidade='Luanda', provincia='Luanda'
+        )
+        self.produto = Produto.objects.create(nome='Produto Teste', preco=Decimal('10.00'))
+        self.estoque = EstoqueLoja.objects.create(
+            loja=self.loja, produto=self.produto, quantidade=self.ESTOQUE_INICIAL
+        )
+
+    def _vender(self, resultados, erros, trava, barreira):
+        barreira.wait()
+        try:
+            for _ in range(self.VENDAS_POR_THREAD):
+                # Um bloqueio do SQLite recusa a transação inteira: o caixa reenvia
+                for _ in range(self.REENVIOS):
+                    try:
+                        efetuar_venda(EstoqueLoja.objects.get(id=self.estoque.id), 1, self.vendedor)
+                        resultado = 'vendida'
+                    except EstoqueInsuficiente:
+                        resultado = 'recusada'
+                    except OperationalError as e:
+                        if 'locked' not in str(e):
+                            raise
+                        time.sleep(self.PAUSA_REENVIO)
+                        continue
+                    break
+                else:
+                    raise OperationalError('Venda recusada por bloqueio em todos os reenvios')
+                with trava:
+                    resultados[resultado] += 1
+        except Exception as e:
+            with trava:
+                erros.append(repr(e))
+        finally:
+            connections.close_all()
+
+    def test_vendas_simultaneas_nao_perdem_baixas(self):
+        resultados = {'vendida': 0, 'recusada': 0}
+        erros = []
+        trava = threading.Lock()
+        barreira = threading.Barrier(self.THREADS)
+        threads = [
+            threading.Thread(target=self._vender, args=(resultados, erros, trava, barreira))
+            for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(erros, [])
+        tentativas = self.THREADS * self.VENDAS_POR_THREAD
+        self.assertEqual(resultados['vendida'] + resultados['recusada'], tentativas)
+        self.assertEqual(resultados['vendida'], self.ESTOQUE_INICIAL)
+
+        self.estoque.refresh_from_db()
+        self.assertEqual(self.estoque.quantidade, 0)
+
+        vendas = Venda.objects.filter(estoque_loja=self.estoque)
+        self.assertEqual(vendas.count(), self.ESTOQUE_INICIAL)
+        self.assertEqual(vendas.aggregate(total=Sum('quantidade'))['total'], self.ESTOQUE_INICIAL)
+
+        resumo = ResumoVendaDiaria.objects.filter(loja=self.loja).aggregate(
+            quantidade=Sum('quantidade'), vendas=Sum('numero_vendas')
+        )
+        self.assertEqual(resumo['quantidade'], self.ESTOQUE_INICIAL)
+        self.assertEqual(resumo['vendas'], self.ESTOQUE_INICIAL)
+
+        movimentos = MovimentoEstoque.objects.filter(loja=self.loja, tipo_movimento='saida')
+        self.assertEqual(movimentos.count(), self.ESTOQUE_INICIAL)
+        self.assertEqual(movimentos.filter(venda__in=vendas).count(), self.ESTOQUE_INICIAL)
+        self.assertEqual(
+            movimentos.aggregate(total=Sum('quantidade_movimento'))['total'],
+            self.ESTOQUE_INICIAL
+        )
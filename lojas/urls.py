@@ -15,10 +15,15 @@ urlpatterns = [
     # Estoque
     path('estoque/', views.listar_estoque, name='listar_estoque'),
     path('estoque/adicionar/', views.adicionar_estoque, name='adicionar_estoque'),
+    path('estoque/importar/', views.importar_estoque, name='importar_estoque'),
+    path('api/transferencias/', views.api_transferir_estoque, name='api_transferir_estoque'),
+    path('api/estoque-baixo/', views.api_estoque_baixo, name='api_estoque_baixo'),
     path('estoque/<int:estoque_id>/editar/', views.editar_estoque, name='editar_estoque'),
     
     # Vendas
     path('vendas/', views.listar_vendas, name='listar_vendas'),
     path('vendas/novo/', views.registrar_venda, name='registrar_venda'),
+    path('api/vendas/carrinho/', views.api_finalizar_carrinho, name='api_finalizar_carrinho'),
+    path('api/vendas/sincronizar/', views.api_sincronizar_vendas, name='api_sincronizar_vendas'),
     path('vendas/<int:venda_id>/detalhes/', views.detalhes_venda, name='detalhes_venda'),
 ]
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+Totais de vendas de uma loja por dia (ACC), lidos do resumo diário.
+
+Todos os números saem de uma única agregação condicional sobre
+ResumoVendaDiaria. O resultado fica no cache sob uma chave que inclui a
+versão dos dados da loja no dia — última alteração, número de linhas e
+número de vendas do resumo (ver versao_totais) —, lida a cada consulta
+por uma agregação leve no índice (loja, data). Uma venda gravada por
+qualquer processo muda a versão, e o próximo pedido em qualquer worker
+recalcula os totais: o cache não depende de invalidação nem de um
+backend compartilhado.
+
+A API /api/totais-vendas/, consultada periodicamente, usa totais_vendas;
+o detalhe do relatório diário lê o resumo direto (calcular_totais_vendas).
+"""
+import hashlib
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Q, Sum
+
+# Só limita a memória ocupada por versões antigas: uma entrada nunca fica desatualizada
+TEMPO_CACHE_TOTAIS = 300
+
+
+def resumos_do_escopo(loja_id, data=None):
+    """Linhas do resumo diário da loja no dia (ou em todas as datas)"""
+    from .models import ResumoVendaDiaria
+
+    resumos = ResumoVendaDiaria.objects.filter(loja_id=loja_id)
+    if data:
+        resumos = resumos.filter(data=data)
+    return resumos
+
+
+def versao_totais(loja_id, data=None):
+    """
+    Versão dos dados do resumo da loja no dia (1 consulta): última
+    alteração, número de linhas e soma do número de vendas. As somas
+    mudam com qualquer venda gravada ou removida, mesmo por uma transação
+    cujo atualizado_em é anterior ao máximo já gravado.
+    Retorna (versão, última alteração ou None).
+    """
+    dados = resumos_do_escopo(loja_id, data).aggregate(
+        ultima=Max('atualizado_em'),
+        linhas=Count('id'),
+        vendas=Sum('numero_vendas', default=0),
+    )
+    ultima = dados['ultima']
+    versao = f"{ultima.isoformat() if ultima else '-'}:{dados['linhas']}:{dados['vendas']}"
+    return hashlib.md5(versao.encode(), usedforsecurity=False).hexdigest(), ultima
+
+
+def calcular_totais_vendas(loja_id, data=None):
+    """
+    Quantidades, valores e número de vendas da loja no dia (ou em todas as
+    datas), no total e por tipo de item, lidos do resumo sem passar pelo
+    cache (1 consulta).
+    """
+    produtos = Q(item_type='produto')
+    recargas = Q(item_type='recarga')
+    totais = resumos_do_escopo(loja_id, data).aggregate(
+        acc_total=Sum('quantidade', default=0),
+        valor_geral=Sum('valor_total', default=Decimal('0.00')),
+        total_vendas_count=Sum('numero_vendas', default=0),
+        acc_produtos=Sum('quantidade', filter=produtos, default=0),
+        acc_recargas=Sum('quantidade', filter=recargas, default=0),
+        valor_produtos=Sum('valor_total', filter=produtos, default=Decimal('0.00')),
+        valor_recargas=Sum('valor_total', filter=recargas, default=Decimal('0.00')),
+        count_produtos=Sum('numero_vendas', filter=produtos, default=0),
+        count_recargas=Sum('numero_vendas', filter=recargas, default=0),
+    )
+    # O alias não pode repetir o nome do campo agregado
+    totais['valor_total'] = totais.pop('valor_geral')
+    return totais
+
+
+def totais_vendas(loja_id, data=None):
+    """
+    Totais de calcular_totais_vendas, guardados no cache sob a versão dos
+    dados, mais 'atualizado_em': a última alteração do resumo no escopo
+    (None se não houver vendas).
+    """
+    versao, ultima = versao_totais(loja_id, data)
+    chave = f"totais_vendas:{loja_id}:{data.isoformat() if data else 'todas'}:{versao}"
+    totais = cache.get(chave)
+    if totais is not None:
+        return totais
+
+    totais = calcular_totais_vendas(loja_id, data)
+    totais['atualizado_em'] = ultima
+
+    cache.set(chave, totais, TEMPO_CACHE_TOTAIS)
+    return totais
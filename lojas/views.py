@@ -4,10 +4,23 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST, require_GET
+from django.db import IntegrityError
 from django.db.models import Sum, Q, Count
 import json
+import logging
 from datetime import datetime, timedelta
 from .models import Loja, EstoqueLoja, Venda
+from .estoque import (
+    efetuar_venda, repor_estoque, transferir_estoque, alertas_de_estoque, finalizar_carrinho,
+    sincronizar_vendas, EstoqueInsuficiente, TransferenciaRecusada, VendaRecusada
+)
+from .importacao import importar_entradas, ErroImportacao
+from balanco.models import MovimentoEstoque
+
+logger = logging.getLogger(__name__)
+
+# Vendas offline aceitas por pedido em api_sincronizar_vendas
+MAX_VENDAS_POR_LOTE = 500
 
 # Importar Produto e Recarga do app correto
 try:
@@ -198,51 +211,21 @@ def registrar_venda(request):
                 'error': 'Você não tem permissão para vender itens desta loja.'
             })
         
-        # Verificar se há estoque suficiente
-        if estoque.quantidade < quantidade:
+        # Baixa do estoque, venda e movimento numa única transação;
+        # o saldo é verificado pelo próprio UPDATE (ver lojas/estoque.py)
+        try:
+            venda = efetuar_venda(estoque, quantidade, request.user, observacao)
+        except EstoqueInsuficiente as e:
             return JsonResponse({
                 'success': False,
-                'error': f'Estoque insuficiente. Disponível: {estoque.quantidade}'
+                'error': f'Estoque insuficiente. Disponível: {e.disponivel}'
             })
         
-        # Calcular valor total
-        valor_total = quantidade * preco_unitario
-        
-        print(f"Valor total calculado: {valor_total}")
-        
-        # Registrar a venda
-        if item_type == 'produto':
-            venda = Venda.objects.create(
-                estoque_loja=estoque,  # CORREÇÃO: usar estoque_loja
-                item_type='produto',
-                quantidade=quantidade,
-                valor_total=valor_total,
-                vendedor=request.user,
-                observacao=observacao
-            )
-            print(f"Venda de produto criada: {venda.id}")
-        else:  # recarga
-            venda = Venda.objects.create(
-                estoque_recarga=estoque,  # CORREÇÃO: usar estoque_recarga
-                item_type='recarga',
-                quantidade=quantidade,
-                valor_total=valor_total,
-                vendedor=request.user,
-                observacao=observacao
-            )
-            print(f"Venda de recarga criada: {venda.id}")
-        
-        # Atualizar estoque
-        estoque.quantidade -= quantidade
-        estoque.save()
-        
-        print(f"Estoque atualizado: {estoque.quantidade}")
-        
         return JsonResponse({
             'success': True,
             'venda_id': venda.id,
             'novo_estoque': estoque.quantidade,
-            'valor_total': float(valor_total),
+            'valor_total': float(venda.valor_total),
             'item_nome': item_nome
         })
         
@@ -256,10 +239,276 @@ def registrar_venda(request):
             'error': f'Erro interno: {str(e)}'
         })
 
+@require_POST
+@csrf_exempt
+@login_required
+def api_finalizar_carrinho(request):
+    """
+    Vende todos os itens de um carrinho numa única transação, com um recibo comum.
+    Corpo JSON: {"loja_id": id, "observacao": "...",
+                 "itens": [{"item_type": "produto", "estoque_id": id, "quantidade": n}]}
+    """
+    try:
+        data = json.loads(request.body)
+    except (ValueError, TypeError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Corpo da requisição deve ser JSON válido.'
+        })
+    
+    try:
+        loja = Loja.objects.get(id=data.get('loja_id'))
+    except (Loja.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Loja não encontrada.'
+        })
+    
+    if not request.user.is_superuser and not loja.gerentes.filter(id=request.user.id).exists():
+        return JsonResponse({
+            'success': False,
+            'error': 'Você não tem permissão para vender itens desta loja.'
+        })
+    
+    try:
+        linhas = [
+            (str(item.get('item_type', 'produto')).lower().strip(), int(item['estoque_id']), int(item['quantidade']))
+            for item in data.get('itens') or []
+        ]
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Cada item deve ter estoque_id e quantidade inteiros.'
+        })
+    
+    try:
+        carrinho = finalizar_carrinho(loja, linhas, request.user, data.get('observacao', ''))
+    except VendaRecusada as e:
+        return JsonResponse({
+            'success': False,
+            'error': 'Venda recusada. Nenhum item foi vendido.',
+            'erros': e.erros
+        })
+    except Exception:
+        logger.exception('Erro em api_finalizar_carrinho (loja %s)', loja.id)
+        return JsonResponse({
+            'success': False,
+            'error': 'Erro interno ao finalizar a venda.'
+        }, status=500)
+    
+    return JsonResponse({
+        'success': True,
+        'recibo': carrinho['recibo'],
+        'vendas': [venda.id for venda in carrinho['vendas']],
+        'itens': carrinho['itens'],
+        'unidades': carrinho['unidades'],
+        'valor_total': float(carrinho['valor_total'])
+    })
+
+@require_POST
+@csrf_exempt
+@login_required
+def api_sincronizar_vendas(request):
+    """
+    Sincroniza vendas registradas offline, com uma chave gerada pelo cliente
+    por venda: vendas já sincronizadas não são repetidas, então o lote pode
+    ser reenviado depois de uma falha de conexão.
+    Corpo JSON: {"loja_id": id,
+                 "vendas": [{"chave": "...", "item_type": "produto", "estoque_id": id,
+                             "quantidade": n, "data_venda": "2025-01-31T14:05:00", "observacao": "..."}]}
+    """
+    try:
+        data = json.loads(request.body)
+    except (ValueError, TypeError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Corpo da requisição deve ser JSON válido.'
+        })
+    
+    try:
+        loja = Loja.objects.get(id=data.get('loja_id'))
+    except (Loja.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Loja não encontrada.'
+        })
+    
+    if not request.user.is_superuser and not loja.gerentes.filter(id=request.user.id).exists():
+        return JsonResponse({
+            'success': False,
+            'error': 'Você não tem permissão para vender itens desta loja.'
+        })
+    
+    vendas = data.get('vendas')
+    if not isinstance(vendas, list) or not all(isinstance(venda, dict) for venda in vendas):
+        return JsonResponse({
+            'success': False,
+            'error': 'vendas deve ser uma lista de objetos.'
+        })
+    if len(vendas) > MAX_VENDAS_POR_LOTE:
+        return JsonResponse({
+            'success': False,
+            'error': f'Envie no máximo {MAX_VENDAS_POR_LOTE} vendas por lote.'
+        })
+    
+    try:
+        resultados = sincronizar_vendas(loja, vendas, request.user)
+    except IntegrityError:
+        # Outro envio gravou uma das chaves ao mesmo tempo: o reenvio é seguro
+        return JsonResponse({
+            'success': False,
+            'error': 'Lote enviado em paralelo por outra conexão. Reenvie o lote.'
+        })
+    except Exception:
+        logger.exception('Erro em api_sincronizar_vendas (loja %s)', loja.id)
+        return JsonResponse({
+            'success': False,
+            'error': 'Erro interno ao sincronizar as vendas. Reenvie o lote.'
+        }, status=500)
+    
+    contagem = {'criada': 0, 'duplicada': 0, 'recusada': 0}
+    for resultado in resultados:
+        contagem[resultado['status']] += 1
+    
+    return JsonResponse({
+        'success': True,
+        'criadas': contagem['criada'],
+        'duplicadas': contagem['duplicada'],
+        'recusadas': contagem['recusada'],
+        'resultados': resultados
+    })
+
+@require_POST
+@csrf_exempt
+@login_required
+def api_transferir_estoque(request):
+    """
+    Transfere vários itens de uma loja para outra numa única operação.
+    Corpo JSON: {"origem": id, "destino": id, "motivo": "...",
+                 "itens": [{"item_type": "produto", "item_id": id, "quantidade": n}]}
+    """
+    try:
+        data = json.loads(request.body)
+    except (ValueError, TypeError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Corpo da requisição deve ser JSON válido.'
+        })
+    
+    try:
+        origem = Loja.objects.get(id=data.get('origem'))
+        destino = Loja.objects.get(id=data.get('destino'))
+    except (Loja.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Loja de origem ou de destino não encontrada.'
+        })
+    
+    # O usuário precisa gerir as duas lojas
+    if not request.user.is_superuser and (
+        request.user not in origem.gerentes.all() or request.user not in destino.gerentes.all()
+    ):
+        return JsonResponse({
+            'success': False,
+            'error': 'Você não tem permissão para transferir estoque entre estas lojas.'
+        })
+    
+    try:
+        itens = [
+            (str(item.get('item_type', 'produto')).lower().strip(), int(item['item_id']), int(item['quantidade']))
+            for item in data.get('itens') or []
+        ]
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Cada item deve ter item_id e quantidade inteiros.'
+        })
+    
+    try:
+        codigo = transferir_estoque(origem, destino, itens, criado_por=request.user, motivo=data.get('motivo', ''))
+    except TransferenciaRecusada as e:
+        return JsonResponse({
+            'success': False,
+            'error': 'Transferência recusada. Nenhum item foi movido.',
+            'erros': e.erros
+        })
+    except Exception:
+        logger.exception('Erro em api_transferir_estoque (loja %s para %s)', origem.id, destino.id)
+        return JsonResponse({
+            'success': False,
+            'error': 'Erro interno ao transferir o estoque.'
+        }, status=500)
+    
+    return JsonResponse({
+        'success': True,
+        'transferencia': codigo,
+        'itens': len(itens),
+        'unidades': sum(quantidade for _, _, quantidade in itens)
+    })
+
+@require_GET
+@login_required
+def api_estoque_baixo(request):
+    """
+    Estoques baixos e esgotados das lojas do usuário (toda a rede para o
+    superusuário), dos mais críticos aos menos.
+    Parâmetros: status (baixo|esgotado), tipo (produto|recarga), loja, limite (até 200)
+    """
+    status = request.GET.get('status', '')
+    item_type = request.GET.get('tipo', '')
+    if status not in ('', 'baixo', 'esgotado') or item_type not in ('', 'produto', 'recarga'):
+        return JsonResponse({
+            'success': False,
+            'error': 'Use status=baixo|esgotado e tipo=produto|recarga.'
+        }, status=400)
+    
+    try:
+        limite = min(max(int(request.GET.get('limite', 50)), 1), 200)
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': 'O limite deve ser um número inteiro.'
+        }, status=400)
+    
+    try:
+        loja_id = int(request.GET.get('loja') or 0)
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': 'A loja deve ser um número inteiro.'
+        }, status=400)
+    
+    lojas = None if request.user.is_superuser else request.user.lojas_gerenciadas.all()
+    if loja_id:
+        lojas = (lojas if lojas is not None else Loja.objects.all()).filter(id=loja_id)
+    
+    try:
+        itens, contagem = alertas_de_estoque(lojas, status, item_type, limite)
+    except Exception:
+        logger.exception('Erro em api_estoque_baixo')
+        return JsonResponse({
+            'success': False,
+            'error': 'Erro interno ao consultar os alertas de estoque.'
+        }, status=500)
+    
+    return JsonResponse({
+        'success': True,
+        'contagem': contagem,
+        'itens': itens
+    })
+
 @require_GET
 @csrf_exempt
 def api_totais_vendas(request):
-    """API simplificada para retornar os totais de vendas"""
+    """
+    API simplificada para retornar os totais de vendas (ver lojas/vendas.py).
+    Responde com ETag e Last-Modified: clientes que consultam periodicamente
+    recebem 304 enquanto os totais não mudam.
+    """
+    from django.utils.cache import get_conditional_response, patch_cache_control
+    from django.utils.http import http_date, quote_etag
+    import hashlib
+    from .vendas import totais_vendas
     
     try:
         # Obter parâmetros
@@ -275,55 +524,61 @@ def api_totais_vendas(request):
         # Buscar loja
         try:
             loja = Loja.objects.get(id=loja_id)
-        except Loja.DoesNotExist:
+        except (Loja.DoesNotExist, ValueError):
             return JsonResponse({
                 'status': 'error',
                 'message': f'Loja com ID {loja_id} não encontrada'
             }, status=404)
         
-        # Query base para vendas
-        vendas_query = Venda.objects.filter(
-            Q(estoque_loja__loja=loja) | Q(estoque_recarga__loja=loja)
-        )
-        
         # Aplicar filtro de data se fornecido
+        data_obj = None
         if data_relatorio:
             try:
                 data_obj = datetime.strptime(data_relatorio, '%Y-%m-%d').date()
-                vendas_query = vendas_query.filter(data_venda__date=data_obj)
             except ValueError:
                 return JsonResponse({
                     'status': 'error',
                     'message': 'Formato de data inválido. Use YYYY-MM-DD'
                 }, status=400)
         
-        # Calcular totais
-        total_quantidade = vendas_query.aggregate(total=Sum('quantidade'))['total'] or 0
-        total_valor = vendas_query.aggregate(total=Sum('valor_total'))['total'] or 0
-        total_vendas = vendas_query.count()
-        
-        # Calcular por tipo
-        vendas_produtos = vendas_query.filter(item_type='produto')
-        vendas_recargas = vendas_query.filter(item_type='recarga')
+        # Versão dos dados e, se não estiver no cache, uma agregação condicional
+        totais = totais_vendas(loja.id, data_obj)
         
         response_data = {
-            'acc_total': total_quantidade,
-            'valor_total': float(total_valor),
-            'total_vendas_count': total_vendas,
+            'acc_total': totais['acc_total'],
+            'valor_total': float(totais['valor_total']),
+            'total_vendas_count': totais['total_vendas_count'],
             
-            'acc_produtos': vendas_produtos.aggregate(total=Sum('quantidade'))['total'] or 0,
-            'acc_recargas': vendas_recargas.aggregate(total=Sum('quantidade'))['total'] or 0,
-            'valor_produtos': float(vendas_produtos.aggregate(total=Sum('valor_total'))['total'] or 0),
-            'valor_recargas': float(vendas_recargas.aggregate(total=Sum('valor_total'))['total'] or 0),
-            'count_produtos': vendas_produtos.count(),
-            'count_recargas': vendas_recargas.count(),
+            'acc_produtos': totais['acc_produtos'],
+            'acc_recargas': totais['acc_recargas'],
+            'valor_produtos': float(totais['valor_produtos']),
+            'valor_recargas': float(totais['valor_recargas']),
+            'count_produtos': totais['count_produtos'],
+            'count_recargas': totais['count_recargas'],
             
             'loja_nome': loja.nome,
             'data_relatorio': data_relatorio if data_relatorio else 'Todas as datas',
             'status': 'success'
         }
         
-        return JsonResponse(response_data)
+        # A ETag vem do conteúdo; Last-Modified, da última alteração do resumo
+        # no escopo (sem vendas não há data e vale só a ETag)
+        etag = quote_etag(hashlib.md5(
+            json.dumps(response_data, sort_keys=True).encode(), usedforsecurity=False
+        ).hexdigest())
+        last_modified = None
+        if totais['atualizado_em']:
+            last_modified = int(totais['atualizado_em'].timestamp())
+        
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = JsonResponse(response_data)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # O cliente pode guardar a resposta, mas deve revalidá-la a cada uso
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
         
     except Exception as e:
         return JsonResponse({
@@ -338,9 +593,12 @@ def listar_lojas(request):
     else:
         lojas = Loja.objects.filter(gerentes=request.user)
     
+    # Estatísticas anotadas e gerentes pré-carregados: 2 consultas para a página toda
+    lojas = list(lojas.with_stats().prefetch_related('gerentes'))
+    
     context = {
         'lojas': lojas,
-        'total_lojas': lojas.count()
+        'total_lojas': len(lojas)
     }
     return render(request, 'lojas/listar_lojas.html', context)
 
@@ -441,7 +699,7 @@ def excluir_loja(request, loja_id):
 # views.py
 @login_required
 def detalhes_loja(request, loja_id):
-    loja = get_object_or_404(Loja, id=loja_id)
+    loja = get_object_or_404(Loja.objects.with_stats(), id=loja_id)
     
     # Verificar se o usuário tem acesso a esta loja
     if not request.user.is_superuser and request.user not in loja.gerentes.all():
@@ -453,10 +711,8 @@ def detalhes_loja(request, loja_id):
     total_produtos = estoque_loja.count()
     total_estoque = estoque_loja.aggregate(total=Sum('quantidade'))['total'] or 0
     
-    # Vendas recentes - CORRIGIDO: usar Q objects para ambos os tipos
-    vendas_recentes = Venda.objects.filter(
-        Q(estoque_loja__loja=loja) | Q(estoque_recarga__loja=loja)
-    ).order_by('-data_venda')[:10]
+    # Vendas recentes (produtos e recargas)
+    vendas_recentes = loja.vendas.order_by('-data_venda')[:10]
     
     # Ranking de produtos
     ranking_produtos = loja.get_ranking_produtos()
@@ -546,9 +802,11 @@ def adicionar_estoque(request):
                     defaults={'quantidade': quantidade}
                 )
                 
-                if not created:
-                    estoque.quantidade += int(quantidade)
-                    estoque.save()
+                quantidade_anterior = 0 if created else repor_estoque(estoque, int(quantidade))
+                MovimentoEstoque.registrar_alteracao(
+                    estoque, quantidade_anterior, tipo_movimento='entrada', motivo_tipo='outro',
+                    motivo_detalhado='Entrada manual de estoque', criado_por=request.user
+                )
                 
                 messages.success(request, f'Estoque do produto {produto.nome} atualizado com sucesso!')
                 
@@ -566,9 +824,11 @@ def adicionar_estoque(request):
                     defaults={'quantidade': quantidade}
                 )
                 
-                if not created:
-                    estoque.quantidade += int(quantidade)
-                    estoque.save()
+                quantidade_anterior = 0 if created else repor_estoque(estoque, int(quantidade))
+                MovimentoEstoque.registrar_alteracao(
+                    estoque, quantidade_anterior, tipo_movimento='entrada', motivo_tipo='outro',
+                    motivo_detalhado='Entrada manual de estoque', criado_por=request.user
+                )
                 
                 messages.success(request, f'Estoque da recarga {recarga.nome} atualizado com sucesso!')
             
@@ -590,6 +850,51 @@ def adicionar_estoque(request):
     }
     return render(request, 'estoque/adicionar_estoque.html', context)
 
+@login_required
+def importar_estoque(request):
+    """Entrada de estoque em lote a partir de uma planilha CSV/XLSX (ver lojas/importacao.py)"""
+    if request.user.is_superuser:
+        lojas = Loja.objects.all()
+    else:
+        lojas = Loja.objects.filter(gerentes=request.user)
+    
+    relatorio = None
+    status = 200
+    if request.method == 'POST':
+        arquivo = request.FILES.get('arquivo')
+        if not arquivo:
+            messages.error(request, 'Selecione um arquivo CSV ou XLSX.')
+        else:
+            try:
+                relatorio = importar_entradas(
+                    arquivo, arquivo.name, lojas,
+                    criado_por=request.user,
+                    aplicar=not request.POST.get('apenas_validar')
+                )
+                if relatorio['aplicado']:
+                    messages.success(
+                        request,
+                        f"{relatorio['movimentos']} entrada(s) registradas ({relatorio['unidades']} unidades)."
+                    )
+                elif relatorio['erros']:
+                    messages.error(request, f"{len(relatorio['erros'])} linha(s) com erro. Nenhuma entrada foi registrada.")
+                elif relatorio['validas']:
+                    messages.info(request, f"Arquivo válido: {relatorio['validas']} linha(s) prontas para importar.")
+                else:
+                    messages.warning(request, 'O arquivo não tem linhas de dados.')
+            except ErroImportacao as e:
+                messages.error(request, str(e))
+            except Exception:
+                logger.exception('Erro ao importar estoque (%s)', arquivo.name)
+                messages.error(request, 'Erro interno ao importar o estoque.')
+                status = 500
+    
+    context = {
+        'lojas': lojas,
+        'relatorio': relatorio,
+    }
+    return render(request, 'estoque/importar_estoque.html', context, status=status)
+
 # views.py
 @login_required
 def editar_estoque(request, estoque_id):
@@ -615,11 +920,17 @@ def editar_estoque(request, estoque_id):
         try:
             nova_quantidade = request.POST.get('quantidade')
             observacao = request.POST.get('observacao', '')
+            estoque_minimo = request.POST.get('estoque_minimo')
             
             # Registrar a alteração (opcional - você pode criar um modelo para histórico)
             quantidade_antiga = estoque.quantidade
             estoque.quantidade = nova_quantidade
+            if estoque_minimo not in (None, ''):
+                estoque.estoque_minimo = int(estoque_minimo)
             estoque.save()
+            MovimentoEstoque.registrar_alteracao(
+                estoque, quantidade_antiga, motivo_detalhado=observacao, criado_por=request.user
+            )
             
             # Log da alteração
             if observacao:
@@ -647,8 +958,7 @@ def listar_vendas(request):
     else:
         lojas_usuario = Loja.objects.filter(gerentes=request.user)
         vendas = Venda.objects.filter(
-            Q(estoque_loja__loja__in=lojas_usuario) | 
-            Q(estoque_recarga__loja__in=lojas_usuario)
+            loja__in=lojas_usuario
         ).order_by('-data_venda')
         lojas = lojas_usuario
     
@@ -659,14 +969,11 @@ def listar_vendas(request):
     
     # Aplicar filtros
     if data_inicio:
-        vendas = vendas.filter(data_venda__date__gte=data_inicio)
+        vendas = vendas.filter(dia_venda__gte=data_inicio)
     if data_fim:
-        vendas = vendas.filter(data_venda__date__lte=data_fim)
+        vendas = vendas.filter(dia_venda__lte=data_fim)
     if loja_id:
-        vendas = vendas.filter(
-            Q(estoque_loja__loja_id=loja_id) | 
-            Q(estoque_recarga__loja_id=loja_id)
-        )
+        vendas = vendas.filter(loja_id=loja_id)
     
     # Estatísticas
     total_vendas = vendas.count()
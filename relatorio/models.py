@@ -1,7 +1,41 @@
 from django.db import models
+from django.db.models import Case, DecimalField, F, Value, When
+from django.db.models.functions import Coalesce, Round
 from django.conf import settings
 from decimal import Decimal
 
+# Campos somados no total arrecadado (ver RelatorioDiario.calcular_total_arrecadado)
+CAMPOS_ARRECADADOS = ['dm', 'moedas', 'tpa', 'gastos']
+
+
+class RelatorioDiarioQuerySet(models.QuerySet):
+    def com_totais(self):
+        """
+        Anota total_arrecadado_calculado, diferenca_calculada (total geral -
+        total arrecadado, arredondada em centavos) e status: 'completo' com
+        sobra, 'negativo' com falta e 'pendente' sem diferença — os mesmos
+        valores de calcular_total_arrecadado e calcular_diferenca, calculados
+        no banco para que filtros, contagens e paginação não carreguem
+        todos os relatórios. Sem total geral não há diferença e o status é
+        None: o relatório fica fora das listas e contagens por status.
+        """
+        decimal = DecimalField(max_digits=12, decimal_places=2)
+        parcelas = [Coalesce(F(campo), Value(Decimal('0.00')), output_field=decimal) for campo in CAMPOS_ARRECADADOS]
+        total_arrecadado = sum(parcelas[1:], parcelas[0])
+        return self.annotate(
+            total_arrecadado_calculado=total_arrecadado,
+            diferenca_calculada=Round(F('total_geral') - total_arrecadado, 2, output_field=decimal),
+        ).annotate(
+            status=Case(
+                When(total_geral__isnull=True, then=Value(None)),
+                When(diferenca_calculada__lt=0, then=Value('completo')),
+                When(diferenca_calculada__gt=0, then=Value('negativo')),
+                default=Value('pendente'),
+                output_field=models.CharField(max_length=10),
+            )
+        )
+
+
 class RelatorioDiario(models.Model):
     loja = models.ForeignKey(
         'lojas.Loja', 
@@ -141,6 +175,8 @@ class RelatorioDiario(models.Model):
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
     
+    objects = RelatorioDiarioQuerySet.as_manager()
+    
     def calcular_total_arrecadado(self):
         """Calcula o total arrecadado (DM + Moedas + TPA + Gastos)"""
         return (self.dm or Decimal('0.00')) + \
@@ -288,8 +324,8 @@ class RelatorioDiario(models.Model):
             # Buscar vendas do dia e da loja específica
             from lojas.models import Venda
             vendas_dia = Venda.objects.filter(
-                data_venda__date=self.data,
-                estoque__loja=self.loja
+                dia_venda=self.data,
+                loja=self.loja
             ).aggregate(total=Sum('valor_total'))
             
             return vendas_dia['total'] or Decimal('0.00')
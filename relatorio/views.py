@@ -7,7 +7,8 @@ from .models import RelatorioDiario
 from lojas.models import Loja
 from django.utils import timezone
 from decimal import Decimal
-from django.db.models import Q
+from django.db.models import Count, Q
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from conta.utils import registrar_atividade
 
 @login_required
@@ -35,63 +36,45 @@ def lista_relatorios(request):
     if loja_id:
         relatorios = relatorios.filter(loja_id=loja_id)
 
+    # Totais, diferença e status calculados no banco
+    relatorios = relatorios.com_totais()
+    if status:
+        relatorios = relatorios.filter(status=status)
+
     # Ordenação
     relatorios = relatorios.order_by('-data', 'loja__nome')
 
-    # Calcular estatísticas
-    total_relatorios = relatorios.count()
-    
-    # Inicializar contadores
-    completos = 0
-    negativos = 0
-    pendentes = 0
+    # Contagem por status numa única agregação (já com o filtro de status)
+    contagem = relatorios.aggregate(
+        total=Count('id'),
+        listados=Count('id', filter=Q(status__isnull=False)),
+        completos=Count('id', filter=Q(status='completo')),
+        negativos=Count('id', filter=Q(status='negativo')),
+        pendentes=Count('id', filter=Q(status='pendente')),
+    )
 
-    # Calcular totais e status para cada relatório
-    relatorios_com_calculos = []
-    for relatorio in relatorios:
-        try:
-            total_arrecadado = relatorio.calcular_total_arrecadado()
-            diferenca = relatorio.calcular_diferenca()
-            
-            # Determinar status
-            if diferenca < 0:
-                completos += 1
-                status_relatorio = 'completo'
-            elif diferenca > 0:
-                negativos += 1
-                status_relatorio = 'negativo'
-            else:
-                pendentes += 1
-                status_relatorio = 'pendente'
+    # Relatórios sem total geral não têm status e não são listados
+    relatorios = relatorios.filter(status__isnull=False)
 
-            # Aplicar filtro de status se especificado
-            if status and status != status_relatorio:
-                continue
+    # PAGINAÇÃO - 20 relatórios por página
+    page = request.GET.get('page', 1)
+    paginator = Paginator(relatorios, 20)
+    # O total já veio da agregação: o paginador não precisa contar de novo
+    paginator.count = contagem['listados']
 
-            # Adicionar atributos calculados ao relatório
-            relatorio.total_arrecadado_calculado = total_arrecadado
-            relatorio.diferenca_calculada = diferenca
-            relatorio.status = status_relatorio
-            
-            relatorios_com_calculos.append(relatorio)
-            
-        except Exception as e:
-            print(f"Erro ao calcular totais para relatório {relatorio.id}: {e}")
-            continue
-
-    # Atualizar contadores após aplicar filtro de status
-    if status:
-        completos = len([r for r in relatorios_com_calculos if r.status == 'completo'])
-        negativos = len([r for r in relatorios_com_calculos if r.status == 'negativo'])
-        pendentes = len([r for r in relatorios_com_calculos if r.status == 'pendente'])
-        total_relatorios = len(relatorios_com_calculos)
+    try:
+        relatorios_paginados = paginator.page(page)
+    except PageNotAnInteger:
+        relatorios_paginados = paginator.page(1)
+    except EmptyPage:
+        relatorios_paginados = paginator.page(paginator.num_pages)
 
     context = {
-        'relatorios_recentes': relatorios_com_calculos,
-        'total_relatorios': total_relatorios,
-        'completos': completos,
-        'negativos': negativos,
-        'pendentes': pendentes,
+        'relatorios_recentes': relatorios_paginados,
+        'total_relatorios': contagem['total'],
+        'completos': contagem['completos'],
+        'negativos': contagem['negativos'],
+        'pendentes': contagem['pendentes'],
         'lojas': lojas,
         'filtros': {
             'data_inicial': data_inicial,
@@ -216,9 +199,8 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from .models import RelatorioDiario
 from lojas.models import Venda, EstoqueRecarga, Loja
-import requests
+from balanco.estoque import estoque_no_dia
 import json
-from django.conf import settings
 from decimal import Decimal
 from datetime import datetime, date
 from django.db.models import Sum, Q
@@ -279,68 +261,22 @@ def calcular_todos_valores(relatorio):
     }
 
 def buscar_dados_vendas(relatorio):
-    """Buscar dados das vendas da API ou calcular localmente"""
-    try:
-        # Tentar buscar da API
-        api_url = f"{getattr(settings, 'BASE_URL', 'http://localhost:8000')}/api/totais-vendas/"
-        params = {
-            'loja_id': relatorio.loja.id,
-            'data_relatorio': relatorio.data.strftime('%Y-%m-%d')
-        }
-        
-        response = requests.get(api_url, params=params, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('status') == 'success':
-                dados = {
-                    'acc_produtos': data.get('acc_produtos', 0),
-                    'acc_recargas': data.get('acc_recargas', 0),
-                    'valor_produtos': Decimal(str(data.get('valor_produtos', 0))),
-                    'valor_recargas': Decimal(str(data.get('valor_recargas', 0))),
-                    'valor_total': Decimal(str(data.get('valor_total', 0))),
-                    'count_produtos': data.get('count_produtos', 0),
-                    'count_recargas': data.get('count_recargas', 0),
-                }
-                
-                # Calcular percentuais
-                if dados['valor_total'] > Decimal('0.00'):
-                    dados['percentual_produtos'] = (dados['valor_produtos'] / dados['valor_total']) * Decimal('100.00')
-                    dados['percentual_recargas'] = (dados['valor_recargas'] / dados['valor_total']) * Decimal('100.00')
-                else:
-                    dados['percentual_produtos'] = Decimal('0.00')
-                    dados['percentual_recargas'] = Decimal('0.00')
-                    
-                return dados
-    except Exception as e:
-        print(f"Erro ao buscar dados da API: {e}")
-    
-    # Fallback: calcular localmente
-    return calcular_dados_vendas_local(relatorio)
+    """
+    Totais das vendas da loja no dia do relatório (os mesmos da API
+    /api/totais-vendas/), lidos do resumo diário numa única agregação,
+    sem cache: o detalhe mostra sempre as vendas já gravadas.
+    """
+    from lojas.vendas import calcular_totais_vendas
 
-def calcular_dados_vendas_local(relatorio):
-    """Calcular dados de vendas localmente baseado no relatório"""
-    valor_recargas = relatorio.recargas or Decimal('0.00')
-    acc_total = relatorio.acc or Decimal('0.00')
-    
-    # Estimativa: 60% produtos, 40% recargas
-    if acc_total > Decimal('0.00'):
-        valor_produtos = acc_total - valor_recargas
-        if valor_produtos < Decimal('0.00'):
-            valor_produtos = acc_total * Decimal('0.6')
-            valor_recargas = acc_total * Decimal('0.4')
-    else:
-        valor_produtos = Decimal('0.00')
-        valor_recargas = Decimal('0.00')
-    
+    totais = calcular_totais_vendas(relatorio.loja_id, relatorio.data)
     dados = {
-        'acc_produtos': int(valor_produtos / Decimal('100.00')) if valor_produtos > Decimal('100.00') else 0,
-        'acc_recargas': int(valor_recargas / Decimal('100.00')) if valor_recargas > Decimal('100.00') else 0,
-        'valor_produtos': valor_produtos,
-        'valor_recargas': valor_recargas,
-        'valor_total': acc_total,
-        'count_produtos': int(valor_produtos / Decimal('100.00')) if valor_produtos > Decimal('100.00') else 0,
-        'count_recargas': int(valor_recargas / Decimal('100.00')) if valor_recargas > Decimal('100.00') else 0,
+        'acc_produtos': totais['acc_produtos'],
+        'acc_recargas': totais['acc_recargas'],
+        'valor_produtos': totais['valor_produtos'],
+        'valor_recargas': totais['valor_recargas'],
+        'valor_total': totais['valor_total'],
+        'count_produtos': totais['count_produtos'],
+        'count_recargas': totais['count_recargas'],
     }
 
     # Calcular percentuais
@@ -416,13 +352,16 @@ def buscar_dados_recargas_reais(relatorio):
         
         # Buscar vendas de recargas do dia específico
         vendas_recargas = Venda.objects.filter(
-            Q(estoque_recarga__loja=relatorio.loja),
+            loja=relatorio.loja,
             item_type='recarga',
-            data_venda__date=relatorio.data
+            dia_venda=relatorio.data
         )
         
         print(f"Encontradas {vendas_recargas.count()} vendas de recargas para {relatorio.data}")
         
+        # Estoque de abertura e de fechamento do dia, reconstruído pelo histórico de estoque
+        posicoes = estoque_no_dia(relatorio.loja_id, 'recarga', relatorio.data)
+        
         # Para cada estoque de recarga, calcular os detalhes
         for estoque in estoques_recargas:
             try:
@@ -435,10 +374,9 @@ def buscar_dados_recargas_reais(relatorio):
                 if total_vendido == 0:
                     continue
                 
-                # Calcular estoque inicial (estoque atual + vendas do dia)
-                # NOTA: Isso assume que não houve reposição de estoque durante o dia
-                estoque_inicial = estoque.quantidade + total_vendido
-                estoque_final = estoque.quantidade
+                posicao = posicoes.get(estoque.recarga_id, {'abertura': 0, 'fechamento': 0})
+                estoque_inicial = posicao['abertura']
+                estoque_final = posicao['fechamento']
                 
                 detalhes_recargas.append({
                     'nome': estoque.recarga.nome,